@@ -0,0 +1,243 @@
+# Emir Ersanli S2221285
+"""
+User-space impaired link for testing the sender/receiver pairs without root
+or tc netem. The emulator listens on <ListenPort>, forwards every datagram
+to <TargetHost>:<TargetPort> from a socket of its own, and relays the
+answers back, impairing each direction independently:
+
+    --delay=<ms>          one-way delay
+    --jitter=<ms>         uniform random variation of the delay, +/- ms
+    --loss=<p>            random (Bernoulli) loss probability
+    --burst-loss=<p>,<r>[,<bad>[,<good>]]
+                          Gilbert-Elliott bursts: good->bad with p, bad->good
+                          with r, loss <bad> in the bad state (default 1) and
+                          <good> in the good one (default 0); replaces --loss
+    --reorder=<p>         probability that a datagram skips the delay and
+                          overtakes the ones before it (needs --delay)
+    --duplicate=<p>       probability that a datagram is delivered twice
+    --rate=<bytes/s>|<N>pps
+                          bandwidth cap, e.g. 2M or 800pps
+    --queue=<bytes>       drop-tail queue in front of the cap (default 256K)
+    --seed=<n>            seed for every random decision (default 1)
+
+Each option applies to both directions; --fwd-<option> (sender to
+receiver) and --rev-<option> (receiver to sender) override it for one
+direction, e.g. --loss=0.01 --rev-loss=0. With the same seed and the same
+traffic, the same datagrams are lost, duplicated and reordered. Each
+sender address gets its own forwarding socket, so several senders can
+share one emulator. Per-direction counters are printed on exit, or after
+--idle-exit=<seconds> without traffic.
+
+Usage:
+    python3 LinkEmulator.py <ListenPort> <TargetHost> <TargetPort> [options]
+"""
+import asyncio
+import random
+import signal
+import sys
+
+from cliopts import split_options, parse_quantity
+from pacing import TokenBucket, parse_rate
+
+DEFAULT_QUEUE = 256 * 1024  # Bytes that may wait for the bandwidth cap before the tail is dropped
+DEFAULT_SEED = 1
+FORWARD, REVERSE = 'fwd', 'rev'  # Sender to receiver, receiver to sender
+
+class GilbertElliott:
+    """
+    Two-state burst loss model: a good and a bad state with their own loss
+    probabilities, switching with p (good to bad) and r (bad to good) per
+    datagram.
+    """
+
+    def __init__(self, p, r, bad_loss=1.0, good_loss=0.0):
+        self.p = p
+        self.r = r
+        self.bad_loss = bad_loss
+        self.good_loss = good_loss
+        self.bad = False  # Current state
+
+    def lost(self, rng):
+        self.bad = rng.random() >= self.r if self.bad else rng.random() < self.p
+        return rng.random() < (self.bad_loss if self.bad else self.good_loss)
+
+    @classmethod
+    def parse(cls, text):
+        return cls(*(float(value) for value in text.split(',')))
+
+class Impairment:
+    """
+    The impairments of one direction. decide() returns the delay in seconds
+    of every copy of a datagram to deliver: none if it is lost, two if it
+    is duplicated.
+    """
+
+    def __init__(self, rng, delay=0.0, jitter=0.0, loss=0.0, burst_loss=None, reorder=0.0, duplicate=0.0,
+                 rate=None, queue=DEFAULT_QUEUE):
+        self.rng = rng  # random.Random of this direction
+        self.delay = delay  # Seconds
+        self.jitter = jitter  # Seconds
+        self.loss = loss
+        self.burst_loss = burst_loss  # GilbertElliott or None
+        self.reorder = reorder
+        self.duplicate = duplicate
+        self.bucket = None  # Bandwidth cap
+        self.per_packet = False
+        self.queue = queue  # Bytes, or packets for a pps cap
+        if rate is not None:
+            rate, self.per_packet = rate
+            self.bucket = TokenBucket(rate, 1 if self.per_packet else 1500)
+        self.stats = dict.fromkeys(('in', 'lost', 'queue_drop', 'duplicated', 'reordered', 'out'), 0)
+
+    def lost(self):
+        if self.burst_loss is not None:
+            return self.burst_loss.lost(self.rng)
+        return self.loss > 0 and self.rng.random() < self.loss
+
+    def decide(self, size):
+        self.stats['in'] += 1
+        if self.lost():
+            self.stats['lost'] += 1
+            return []
+        copies = 1
+        if self.duplicate > 0 and self.rng.random() < self.duplicate:
+            self.stats['duplicated'] += 1
+            copies = 2
+        delays = []
+        for _ in range(copies):
+            # Draw every random number first, so the decisions do not depend on timing
+            delay = self.delay
+            if self.jitter > 0:
+                delay = max(0.0, delay + self.rng.uniform(-self.jitter, self.jitter))
+            if self.reorder > 0 and self.rng.random() < self.reorder:
+                self.stats['reordered'] += 1
+                delay = 0.0  # Overtakes everything still in flight
+            if self.bucket is not None:
+                cost = 1 if self.per_packet else size
+                if self.bucket.backlog() + cost > self.queue:
+                    self.stats['queue_drop'] += 1
+                    continue
+                delay += self.bucket.reserve(cost)  # Wait for the link to serialize the queue ahead
+            delays.append(delay)
+        self.stats['out'] += len(delays)
+        return delays
+
+    def summary(self):
+        return ' '.join(f'{name}={count}' for name, count in self.stats.items())
+
+    @classmethod
+    def from_options(cls, options, direction, seed):
+        """Builds the impairment of one direction from the shared and --fwd-/--rev- options."""
+        def get(name, default=None):
+            return options.get(f'{direction}_{name}', options.get(name, default))
+        rate = get('rate')
+        burst_loss = get('burst_loss')
+        return cls(random.Random(f'{seed}-{direction}'),
+                   float(get('delay', 0)) / 1000, float(get('jitter', 0)) / 1000,
+                   float(get('loss', 0)), GilbertElliott.parse(burst_loss) if burst_loss else None,
+                   float(get('reorder', 0)), float(get('duplicate', 0)),
+                   parse_rate(str(rate)) if rate else None, parse_quantity(get('queue', DEFAULT_QUEUE)))
+
+class Upstream(asyncio.DatagramProtocol):
+    """Forwarding socket of one sender; relays the receiver's answers back."""
+
+    def __init__(self, emulator, client):
+        self.emulator = emulator
+        self.client = client  # Sender address the answers go to
+        self.transport = None
+        self.pending = []  # Datagrams from the sender that arrived while the socket was opening
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, packet, addr):
+        self.emulator.relay(self.emulator.reverse, self.emulator.transport, packet, self.client)
+
+    def error_received(self, exc):
+        pass  # The receiver is not listening (yet): the datagram is simply lost
+
+class LinkEmulator(asyncio.DatagramProtocol):
+    """
+    Listening side: impairs and forwards datagrams from the senders and
+    opens one forwarding socket per sender.
+    """
+
+    def __init__(self, target, forward, reverse):
+        self.target = target  # (host, port) of the receiver
+        self.forward = forward  # Impairment from senders to the receiver
+        self.reverse = reverse  # Impairment from the receiver to senders
+        self.upstreams = {}  # Sender address -> Upstream
+        self.transport = None
+        self.loop = asyncio.get_running_loop()
+        self.last_heard = self.loop.time()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, packet, addr):
+        upstream = self.upstreams.get(addr)
+        if upstream is None:
+            upstream = self.upstreams[addr] = Upstream(self, addr)
+            self.loop.create_task(self.open(upstream))
+        if upstream.transport is None or upstream.pending:
+            upstream.pending.append(packet)  # Goes out once the socket is ready
+            return
+        self.relay(self.forward, upstream.transport, packet, None)
+
+    async def open(self, upstream):
+        await self.loop.create_datagram_endpoint(lambda: upstream, remote_addr=self.target)
+        for packet in upstream.pending:
+            self.relay(self.forward, upstream.transport, packet, None)
+        upstream.pending = []
+
+    def relay(self, impairment, transport, packet, addr):
+        self.last_heard = self.loop.time()
+        for delay in impairment.decide(len(packet)):
+            if delay == 0:
+                transport.sendto(packet, addr)
+            else:
+                self.loop.call_later(delay, transport.sendto, packet, addr)
+
+    def error_received(self, exc):
+        pass
+
+    def close(self):
+        for upstream in self.upstreams.values():
+            if upstream.transport is not None:
+                upstream.transport.close()
+
+async def emulate(listen_port, target, forward, reverse, idle_exit=None, host='0.0.0.0'):
+    """
+    Relays between senders on `listen_port` and the receiver at `target`
+    through the forward and reverse Impairment, until cancelled or until
+    `idle_exit` seconds pass without a datagram.
+    """
+    loop = asyncio.get_running_loop()
+    transport, emulator = await loop.create_datagram_endpoint(
+        lambda: LinkEmulator(target, forward, reverse), local_addr=(host, listen_port))
+    try:
+        while idle_exit is None or loop.time() - emulator.last_heard < idle_exit:
+            await asyncio.sleep(idle_exit / 4 if idle_exit else 3600)
+    finally:
+        emulator.close()
+        transport.close()
+
+def stop(signum, frame):
+    raise KeyboardInterrupt  # Print the counters on kill as on Ctrl-C
+
+if __name__ == '__main__':
+    args, options = split_options(sys.argv[1:])
+    if len(args) != 3:
+        print(__doc__.split('Usage:')[1])
+        sys.exit(1)
+    seed = options.get('seed', DEFAULT_SEED)
+    forward = Impairment.from_options(options, FORWARD, seed)
+    reverse = Impairment.from_options(options, REVERSE, seed)
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        asyncio.run(emulate(int(args[0]), (args[1], int(args[2])), forward, reverse,
+                            float(options['idle_exit']) if 'idle_exit' in options else None))
+    except KeyboardInterrupt:
+        pass
+    print(f' {FORWARD} {forward.summary()}')
+    print(f' {REVERSE} {reverse.summary()}')
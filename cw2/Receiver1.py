@@ -2,37 +2,46 @@
 
 from socket import *  # Imports necessary functions and constants for socket programming
 import sys  # For accessing command-line arguments
+from cliopts import split_options  # For the optional --batch/--mem-cap flags
+from filesink import StreamingWriter  # Writes data to disk while receiving
+from metrics import TransferMetrics  # Counters exported with --metrics
+from wire import ReceiveBuffers  # Reused receive buffers
 
 class Receiver:
-    def __init__(self, port, file_to_save):
+    def __init__(self, port, file_to_save, options=None):
         # Initialize the Receiver with a port and a file name to save received data
         self.UDP_PORT = int(port)  # Convert port number to integer
         self.file_to_save = file_to_save  # File path to save received data
         self.receiver_socket = socket(AF_INET, SOCK_DGRAM)  # Create a UDP socket
         self.receiver_socket.bind(('', self.UDP_PORT))  # Bind socket to the given port on all interfaces
-        self.data_received = bytearray()  # Initialize a bytearray to accumulate received data
+        self.data_received = StreamingWriter.from_options(file_to_save, options or {})  # Streams received data to the file
+        self.metrics = TransferMetrics.from_options(options or {}, 'receiver', 'oneway')  # Packets and bytes received
+        self.buffers = ReceiveBuffers(1027)  # Packets of up to 1027 bytes are received into these
 
     def receive(self):
         while True:
-            # Continuously receive packets of size 1027 bytes
-            packet, _ = self.receiver_socket.recvfrom(1027)
+            # Continuously receive packets of size 1027 bytes, as views of a reused buffer
+            packet, _ = self.buffers.receive(self.receiver_socket)
             sequence_number = packet[:2]  # The first 2 bytes represent the sequence number
             EOF = packet[2]  # The third byte is the EOF flag
             data = packet[3:]  # The rest of the packet is the actual data
-            self.data_received.extend(data)  # Append data to the accumulator
+            self.data_received.write(data)  # Append data to the file; the writer copies it out of the buffer
+            self.metrics.count('packets_received_total')
+            self.metrics.count('bytes_received_total', len(data))
+            self.metrics.progress(len(data))
             if EOF == 1:  # If EOF flag is set, break the loop
                 break
-        # Write the accumulated data to a file
-        with open(self.file_to_save, 'wb') as file:
-            file.write(self.data_received)
+        self.data_received.close()  # Flush whatever is still buffered to the file
         self.receiver_socket.close()  # Close the socket
+        self.metrics.finish()  # Export the metrics, with --metrics
 
 if __name__ == '__main__':
     # Ensure that two arguments are passed (port number and file to save)
-    if len(sys.argv) != 3:
-        print("Usage: python3 Receiver1.py <Port> <Filename>")
+    args, options = split_options(sys.argv[1:])
+    if len(args) != 2:
+        print("Usage: python3 Receiver1.py <Port> <Filename> [--batch=<bytes>] [--mem-cap=<bytes>] [--metrics=<file>]")
         sys.exit(1)
-    receiver = Receiver(sys.argv[1], sys.argv[2])
+    receiver = Receiver(args[0], args[1], options)
     receiver.receive()  # Start receiving data
 
 
@@ -1,6 +1,13 @@
 #Emir Ersanli S2221285
 import socket
 import sys
+import time
+from cliopts import split_options
+from filesink import StreamingWriter
+from wire import FLAG_EOF, ReceiveBuffers
+from ackpolicy import DelayedAck
+from handshake import ReceiverLimits, accept, answer_again
+from metrics import TransferMetrics
 
 # Function to create and bind a socket
 def create_bound_socket(ip, port):
@@ -9,23 +16,37 @@ def create_bound_socket(ip, port):
     sock.bind((ip, port))
     return sock
 
-# Function to write the received data to a file
-def write_to_file(filename, data):
-    """Write the received bytearray data to a file."""
-    with open(filename, 'wb') as file:
-        file.write(data)
+# Separate the optional --batch/--mem-cap flags from the positional arguments
+args, options = split_options(sys.argv[1:])
 
 # Specify localhost and port from command line arguments
 local_IP = "127.0.0.1"
-local_PORT = int(sys.argv[1])   
+local_PORT = int(args[0])   
 # Specify output filename from command line arguments
-output_filename = sys.argv[2] 
+output_filename = args[1] 
 
 # Create and bind the socket to localhost and the specified port
 socket_obj = create_bound_socket(local_IP, local_PORT)
 
-# Initialize a bytearray to store the received data
-received_data = bytearray()
+# Wait for the sender's proposal and agree on the payload size (--max-payload caps it)
+session, _ = accept(socket_obj, ReceiverLimits.from_options(options))
+
+# Sequence numbers of the agreed width (2 bytes by default) that wrap around, so files of any size can be received
+header = session.header
+
+# Stream the received data to the output file with bounded memory
+received_data = StreamingWriter.from_options(output_filename, options)
+
+# Packets are received into reused buffers; the buffer size includes the packet header
+buffers = ReceiveBuffers(session.payload_size + header.header_length)
+
+# Stop-and-Wait sends the next packet only after its ACK, so in-order packets are
+# acknowledged at once; duplicates arriving in a burst share one re-ACK (--ack-delay)
+duplicate_ack_interval = DelayedAck.from_options(options).delay
+last_duplicate_ack = None  # (sequence number, time) of the last re-ACK sent
+
+# Counters of the transfer, exported with --metrics=<file> and on SIGUSR1
+metrics = TransferMetrics.from_options(options, 'receiver', 'stop-and-wait')
 
 # Initialize variables to track sequence numbers for duplicate packet checking
 current_sequence_number = 0
@@ -35,41 +56,59 @@ end_of_file = False
 # Main loop to receive data packets
 while not end_of_file:
     # Receive a data packet from the sender
-    data, addr = socket_obj.recvfrom(1027) # Buffer size includes packet header
+    data, addr = buffers.receive(socket_obj)
     
     # If the data packet is empty, skip this iteration
     if data is None:
         continue
+
+    # The sender repeats its SYN if our SYN-ACK was lost
+    if answer_again(socket_obj, data, addr, session):
+        continue
     
-    # Extract the sequence number from the beginning of the packet
-    current_sequence_number = int.from_bytes(data[:2], 'big')
+    # Extract the sequence number and map it next to the one we expect
+    wire_sequence_number, flags = header.unpack_header(data)
+    metrics.count('packets_received_total')
+    current_sequence_number = header.unwrap(wire_sequence_number, previous_sequence_number + 1)
     
     # Check if the received packet is the next in the sequence
     if current_sequence_number == (previous_sequence_number + 1):
         # Update the sequence number and append the packet data to the received_data bytearray
         previous_sequence_number = current_sequence_number
-        received_data.extend(data[3:])
+        received_data.write(data[header.header_length:])
+        metrics.count('bytes_received_total', len(data) - header.header_length)
+        metrics.progress(len(data) - header.header_length)
         
         # Construct the ACK packet and send it back to the sender
-        packet = bytearray(previous_sequence_number.to_bytes(2, byteorder='big'))
+        packet = header.pack_ack(previous_sequence_number)
         socket_obj.sendto(packet, addr)
+        metrics.count('acks_sent_total')
     else:
-        # If the packet is a duplicate, re-send the ACK for the last correctly received packet
-        packet = bytearray(previous_sequence_number.to_bytes(2, byteorder='big'))
-        socket_obj.sendto(packet, addr)
+        # If the packet is a duplicate, re-send the ACK for the last correctly received packet,
+        # unless that ACK was already re-sent a moment ago
+        metrics.count('packets_discarded_total', reason='duplicate')
+        now = time.monotonic()
+        if last_duplicate_ack is None or last_duplicate_ack[0] != previous_sequence_number \
+                or now - last_duplicate_ack[1] >= duplicate_ack_interval:
+            packet = header.pack_ack(previous_sequence_number)
+            socket_obj.sendto(packet, addr)
+            metrics.count('acks_sent_total')
+            last_duplicate_ack = (previous_sequence_number, now)
     
     # Check if the packet is marked as the last packet (EOF)
-    if data[2] == 1:
+    if flags & FLAG_EOF:
         # Construct a packet to acknowledge the reception of the last packet and send it
         end_sequence_number = 0
-        packet = bytearray(end_sequence_number.to_bytes(2, byteorder='big'))
+        packet = header.pack_ack(end_sequence_number)
         socket_obj.sendto(packet, addr)
+        metrics.count('acks_sent_total')
         # Set the flag to exit the loop since the last packet has been received
         end_of_file = True
 
-# Once all packets are received, write the data to the specified output file
-write_to_file(output_filename, received_data)
+# Once all packets are received, flush the remaining data to the output file
+received_data.close()
 
 # Close the socket after transmission is complete
 socket_obj.close()
+metrics.finish()
 
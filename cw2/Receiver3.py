@@ -3,65 +3,131 @@ import socket
 import sys 
 import os
 import math
+from cliopts import split_options
+from filesink import StreamingWriter
+from wire import FLAG_EOF, FLAG_PARITY
+from batchio import make_receiver, RECEIVE_MODES, choose
+from ackpolicy import DelayedAck
+from handshake import ReceiverLimits, FEATURE_FEC, accept, answer_again
+from fec import ParityDecoder, PARITY_HEADER
+from metrics import TransferMetrics
 
+# in-order packets covered by one ACK unless --ack-every says otherwise
+DEFAULT_GBN_ACK_EVERY = 4
+
+# separate the optional --batch/--mem-cap flags from the positional arguments
+args, options = split_options(sys.argv[1:])
 # specify localhost
 local_IP = "127.0.0.1"
 # specify port
-local_port = int(sys.argv[1])
+local_port = int(args[0])
 # specify filename to be created
-file_name = sys.argv[2] 
+file_name = args[1] 
+# how datagrams are received (--batch-io=auto|gro|mmsg|off), checked before the handshake
+try:
+    batch_modes = choose(options.get('batch_io'), RECEIVE_MODES)
+except ValueError as error:
+    print(error)
+    sys.exit(1)
 # start a socket
 data_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 # Use this socket for specified port number
 data_socket.bind((local_IP, local_port))
-# create a bytearray
-file_data = bytearray()
-# create variables to check duplicate packets
-packet_seq_num = 0
+# wait for the sender's proposal and agree on payload size and sequence width (--max-payload caps the payload)
+session, addr = accept(data_socket, ReceiverLimits.from_options(options, features=FEATURE_FEC))
+# sequence numbers of the agreed width; the wire value wraps and is mapped back next to next_seq_num
+header = session.header
+# with --fec on the sender, lost packets are rebuilt from parity packets; GBN sequence numbers start at 0
+decoder = ParityDecoder(0, session.payload_size) if session.features & FEATURE_FEC else None
+# packets are received into reused buffers of the payload plus the packet header, plus the parity header with FEC,
+# a batch per system call where the platform allows it
+buffers = make_receiver(data_socket, session.payload_size + header.header_length + (PARITY_HEADER.size if decoder else 0),
+                        batch_modes)
+# stream in-order data to the file instead of keeping it all in memory
+file_data = StreamingWriter.from_options(file_name, options)
+# hold back ACKs: one cumulative ACK per few in-order packets (--ack-every, --ack-delay)
+ack_policy = DelayedAck.from_options(options, DEFAULT_GBN_ACK_EVERY)
+# with a small window, waiting for more packets than half of it would stall the sender
+ack_policy.every = max(1, min(ack_policy.every, session.window // 2))
+# counters of the transfer, exported with --metrics=<file> and on SIGUSR1
+metrics = TransferMetrics.from_options(options, 'receiver', 'go-back-n')
+# next packet we expect in order
 next_seq_num = 0
+# packets waiting to be written in order; with FEC this includes the ones past a gap parity may still fill
+ahead = {}
 while True:
-    # set buffer size to 1027 and get data from it
-    data, addr = data_socket.recvfrom(1027) 
+    # wait for data, but no longer than a held-back ACK may be delayed
+    data_socket.settimeout(ack_policy.timeout())
+    try:
+        data, addr = buffers.receive(data_socket)
+    except socket.timeout:
+        # the delayed ACK is due: acknowledge everything received in order so far
+        data_socket.sendto(header.pack_ack(next_seq_num - 1), addr)
+        metrics.count('acks_sent_total')
+        ack_policy.sent()
+        continue
+    # the sender repeats its SYN if our SYN-ACK was lost
+    if answer_again(data_socket, data, addr, session):
+        continue
+    wire_seq_num, flags = header.unpack_header(data)
+    packet_seq_num = header.unwrap(wire_seq_num, next_seq_num)
+    if flags & FLAG_PARITY:
+        metrics.count('parity_packets_received_total')
+        # a parity packet only matters if it rebuilds a missing packet
+        arrivals = decoder.add_parity(packet_seq_num, data[header.header_length:]) if decoder else []
+        if not arrivals:
+            continue
+    else:
+        metrics.count('packets_received_total')
+        arrivals = [(packet_seq_num, flags, data[header.header_length:])]
+    for seq_num, packet_flags, payload in arrivals:
+        if seq_num < next_seq_num or seq_num in ahead:
+            metrics.count('packets_discarded_total', reason='duplicate')
+            continue  # duplicate
+        if decoder is not None:
+            # keep it for the parity of its group, and until the packets before it are here;
+            # a copy, since the receive buffer is reused
+            arrivals += decoder.add_data(seq_num, packet_flags, payload)
+            ahead[seq_num] = (packet_flags, bytes(payload))
+        elif seq_num == next_seq_num:
+            ahead[seq_num] = (packet_flags, payload)
+        else:
+            metrics.count('packets_discarded_total', reason='out_of_order')
+    # everything past the packet itself was rebuilt from parity
+    metrics.count('fec_recovered_total', len(arrivals) - (0 if flags & FLAG_PARITY else 1))
     # if seqNum is nextSeqnum it means we received the next in order packet
-    packet_seq_num = int.from_bytes(data[:2],'big')
-    if packet_seq_num == next_seq_num:
-        # increase sequence number and add to bytearray image
-        file_data.extend(data[3:])
+    in_order = next_seq_num in ahead
+    last_packet = False
+    while next_seq_num in ahead and not last_packet:
+        # increase sequence number and add to the file
+        packet_flags, payload = ahead.pop(next_seq_num)
+        file_data.write(payload)
+        metrics.count('bytes_received_total', len(payload))
+        metrics.progress(len(payload))
         next_seq_num += 1
-    if next_seq_num == 0 :
-        var = 0
-    else :
-        var = next_seq_num - 1
-    ack_packet = bytearray(var.to_bytes(2, byteorder='big'))
-    # send acknowledgement
-    data_socket.sendto(ack_packet, addr)
-    # be in the loop until we receive the packet in order
-    while next_seq_num != packet_seq_num + 1:
-       # set buffer size to 1027 and get data from it
-       data, addr = data_socket.recvfrom(1027) 
-       # get sequence number of packet
-       packet_seq_num = int.from_bytes(data[:2],'big')
-       # if seqNum is nextSeqnum it means we received the next in order packet
-       if packet_seq_num == next_seq_num:
-           # extend to the file
-           file_data.extend(data[3:])
-           next_seq_num += 1
-        # assign var as nextSeqnum -1 so that we can send ack to the sender for received packet
-       if next_seq_num == 0 :
-            var = 0
-       else :
-            var = next_seq_num - 1
-       ack_packet = bytearray(var.to_bytes(2, byteorder='big'))
-       # send acknowledgement
-       data_socket.sendto(ack_packet, addr)
-    # if it is last packet, break out of loop
-    if(data[2] == 1):
+        last_packet = packet_flags & FLAG_EOF
+    if decoder is not None:
+        decoder.forget(next_seq_num)
+    # acknowledge the last in-order packet; before packet 0 this is -1, which wraps on the wire
+    var = next_seq_num - 1
+    ack_packet = header.pack_ack(var)
+    # if it is last packet, acknowledge it at once and break out of loop
+    if last_packet:
+        data_socket.sendto(ack_packet, addr)
         # send another packet indicating that receiver has the last packet in case the last ACK is lost
-        ack_packet = bytearray(packet_seq_num.to_bytes(2, byteorder='big'))
         data_socket.sendto(ack_packet, addr)
+        metrics.count('acks_sent_total', 2)
         break
-# write file   
-with open(file_name, 'wb') as file:
-    file.write(file_data)
+    # a packet past a gap that parity may still fill is not acknowledged: a duplicate ACK would make the sender go back
+    if not in_order and decoder is not None and next_seq_num < packet_seq_num <= decoder.group_end(next_seq_num):
+        continue
+    # a gap (out-of-order or duplicate packet) is reported at once, in-order packets may wait
+    if ack_policy.on_packet(urgent=not in_order):
+        data_socket.sendto(ack_packet, addr)
+        metrics.count('acks_sent_total')
+        ack_policy.sent()
+# flush the rest of the file   
+file_data.close()
 
-data_socket.close()
\ No newline at end of file
+data_socket.close()
+metrics.finish()
\ No newline at end of file
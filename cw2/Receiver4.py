@@ -2,79 +2,238 @@
 import socket  # For network connections
 import sys  # For command line arguments
 import os  # For file operations
+import time  # For spacing the journal checkpoints
+from filesink import OffsetWriter, CompletionBitmap  # Offset-addressed writes and arrival tracking
+from wire import HeaderFormat, FLAG_EOF, FLAG_COMPRESSED, FLAG_PARITY, SACK_BITS  # Packet header layout
+from ackpolicy import DelayedAck  # When to send the next SACK
+from cliopts import split_options  # For the optional --ack-every/--ack-delay flags
+from handshake import ReceiverLimits, FEATURE_RESUME, FEATURE_COMPRESS, FEATURE_FEC, accept, answer_again  # Session parameters agreed with the sender
+from journal import RangeJournal, covered_packets  # Checkpoints for resumable transfers
+from compression import inflate  # Compressed payloads
+from fec import ParityDecoder, PARITY_HEADER  # Rebuilds lost packets from parity
+from metrics import TransferMetrics  # Counters exported with --metrics
+from batchio import make_receiver, RECEIVE_MODES, choose  # recvmmsg/GRO receive batches (--batch-io)
+import pkttrace  # --trace recorder and its event codes
 
 # Constants for managing data packets and control flow
-DATA_PAYLOAD_SIZE = 1024  # Size of the data payload in each UDP packet
-HEADER_LENGTH = 3  # Size of the header in each packet (2 bytes for sequence number + 1 byte for EOF flag)
-ACK_PACKET_SIZE = 2  # Size of the acknowledgement packet
-SYSTEM_BYTE_ORDER = 'big'  # Byte order for converting between bytes and integers
+HEADER = HeaderFormat()  # 4-byte sequence number that wraps around + 1 byte of flags
 REPEATED_ACKS_FOR_LAST_PACKET = 5  # Number of times the ACK for the final packet will be sent
+JOURNAL_INTERVAL = 1.0  # Seconds between journal checkpoints
 
-def handle_incoming_data(sock, target_filename, ctrl_window_size):
+def build_sack(window_start, received_packets, header=HEADER):
+    # Cumulative ACK for everything before the window, plus the bitmap of what arrived past the gap
+    return header.pack_sack(window_start - 1, received_packets.bits_from(window_start + 1, SACK_BITS))
+
+def save_checkpoint(journal, output_file, session, window_start, received_packets, window_size, final_packet_seq):
+    # Everything below the window is on disk, plus the full packets that arrived inside it
+    payload_size = session.payload_size
+    ranges = list(journal.ranges)
+    ranges.append((session.offset, session.offset + (window_start - 1) * payload_size))
+    bits = received_packets.bits_from(window_start + 1, window_size)
+    while bits:
+        seq = window_start + bits.bit_length()  # Highest packet still set
+        if seq != final_packet_seq:  # The short final packet is always resent, it carries EOF
+            offset = session.offset + (seq - 1) * payload_size
+            ranges.append((offset, offset + payload_size))
+        bits &= ~(1 << (bits.bit_length() - 1))
+    output_file.sync()  # The data must be on disk before the journal claims it
+    journal.save(ranges)
+
+def handle_incoming_data(sock, target_filename, ctrl_window_size, ack_policy=None, limits=None, truncate=True, journal=None,
+                         metrics=None, trace=None, batch_modes=None):
     """
-    Receives data packets over UDP, acknowledges each packet, ensures packets are processed
-    in sequence using a sliding window protocol, and writes the received data to a file.
+    Agrees on payload size and sequence width with the sender, then receives data packets over UDP and writes every in-window payload
+    straight to its offset in the output file. Arrivals are tracked in a
+    bitmap, which also drives the sliding window forward. Packets are
+    acknowledged with SACKs (cumulative ACK + bitmap): one per few in-order
+    packets or after a short delay, and at once for gaps and duplicates.
+    The sender's handshake says where in the file its first packet belongs,
+    so several transfers can fill disjoint ranges of one file. The file is
+    cut after the final packet unless `truncate` is False. Returns the
+    offset just past the final packet's payload.
+
+    With a RangeJournal, progress is checkpointed every JOURNAL_INTERVAL
+    seconds and when the transfer is interrupted. If the sender agrees to
+    resume, the packets the journal already covers count as received and
+    the sender skips them; the journal is removed once the file is complete.
+    Payloads marked FLAG_COMPRESSED are inflated before they are written.
+    With FEATURE_FEC agreed, a packet lost from a parity group is rebuilt
+    from the group's parity and handled as if it had arrived.
+    Counters and histograms of the transfer go to `metrics`, which is
+    finished (and exported) once the final SACKs are out. With a
+    pkttrace.TraceRecorder, every arrival, write, window advance and SACK
+    is traced; the caller closes the recorder. `batch_modes`, from
+    batchio.choose(), picks how datagrams are received (default: auto).
     """
+    if metrics is None:
+        metrics = TransferMetrics('receiver', 'selective-repeat')  # Collected, not exported
+    if ack_policy is None:
+        ack_policy = DelayedAck()
+    if limits is None:
+        limits = ReceiverLimits(ctrl_window_size, features=FEATURE_COMPRESS | FEATURE_FEC)
+    if batch_modes is None:
+        batch_modes = choose('auto', RECEIVE_MODES)
+    session, sender_addr = accept(sock, limits)  # Wait for the sender's SYN and answer it
+    header = session.header  # Header layout of the agreed sequence number width
+    payload_size = session.payload_size  # File bytes carried by every packet but the last
+    decoder = ParityDecoder(1, payload_size) if session.features & FEATURE_FEC else None  # Forward error correction
+    buffers = make_receiver(sock, payload_size + header.header_length + (PARITY_HEADER.size if decoder else 0),
+                            batch_modes)  # Reused, sized for the largest datagram
     window_start = 1  # Initial sequence number of the sliding window
-    received_data_packets = {}  # Dictionary to store out-of-order packets
-    file_end_received = False  # Flag to indicate the end of file transfer
+    received_packets = CompletionBitmap()  # One bit per sequence number already written
+    resume_ranges = []  # Byte ranges an earlier transfer left on disk, as told to the sender
+    if journal is not None and session.features & FEATURE_RESUME:
+        resume_ranges = journal.ranges
+        for first, last in covered_packets(resume_ranges, session.offset, payload_size):
+            received_packets.add_range(first, last)  # The sender skips exactly these packets
+        window_start = received_packets.advance(window_start)
+    next_checkpoint = time.monotonic() + JOURNAL_INTERVAL  # When the journal is next brought up to date
     final_packet_seq = None  # Sequence number of the final packet
+    end_offset = None  # File offset just past the final packet's payload
+    output_file = OffsetWriter(target_filename)  # Descriptor kept open for the whole transfer
+
+    try:
+        # Continue receiving packets until every packet up to the final one has been written
+        while final_packet_seq is None or window_start <= final_packet_seq:
+            sock.settimeout(ack_policy.timeout())  # Wake up when a held-back SACK is due
+            try:
+                packet, sender_addr = buffers.receive(sock)  # Receive a packet into the next buffer of the pool
+            except socket.timeout:
+                sock.sendto(build_sack(window_start, received_packets, header), sender_addr)  # Delayed SACK
+                metrics.count('acks_sent_total')
+                if trace is not None:
+                    trace.record(pkttrace.ACK_SENT, window_start - 1)
+                ack_policy.sent()
+                continue
+            if answer_again(sock, packet, sender_addr, session, resume_ranges):
+                continue  # A repeated SYN whose SYN-ACK was lost, or the sender asking for the journal
+            wire_seq, flags = header.unpack_header(packet)  # Extract sequence number and flags
+            sequence_number = header.unwrap(wire_seq, window_start)  # Absolute sequence number nearest the window
+            packet_data = packet[header.header_length:]  # View of the data payload, no copy
+
+            if flags & FLAG_PARITY:
+                metrics.count('parity_packets_received_total')
+                if trace is not None:
+                    trace.record(pkttrace.PARITY, sequence_number, len(packet))
+                if decoder is None:
+                    continue
+                arrivals = decoder.add_parity(sequence_number, packet_data)  # The packet it rebuilds, if any
+                if not arrivals:
+                    continue
+            else:
+                metrics.count('packets_received_total')
+                if trace is not None:
+                    trace.record(pkttrace.RECEIVE, sequence_number, len(packet))
+                arrivals = [(sequence_number, flags, packet_data)]
+            from_parity = bool(flags & FLAG_PARITY)  # Every arrival but a data packet itself was rebuilt
+
+            urgent = True  # Duplicates and packets outside the window are answered at once
+            for index, (sequence_number, flags, packet_data) in enumerate(arrivals):  # Grows if a packet completes a parity group
+                # Check if the packet is within the window and not already received
+                if not (window_start <= sequence_number < window_start + ctrl_window_size) or sequence_number in received_packets:
+                    metrics.count('packets_discarded_total',
+                                  reason='duplicate' if sequence_number in received_packets or sequence_number < window_start
+                                  else 'outside_window')
+                    if trace is not None:
+                        trace.record(pkttrace.DISCARD, sequence_number)
+                    continue
+                if index > 0 or from_parity:
+                    metrics.count('fec_recovered_total')
+                    if trace is not None:
+                        trace.record(pkttrace.RECOVER, sequence_number)
+                if decoder is not None:
+                    arrivals += decoder.add_data(sequence_number, flags, packet_data)
+                if flags & FLAG_COMPRESSED:
+                    packet_data = inflate(packet_data, payload_size)
+                    if packet_data is None:
+                        continue  # Corrupt: drop it like a lost packet, the sender resends it
+                offset = session.offset + (sequence_number - 1) * payload_size  # Where this payload belongs in the file
+                output_file.write_at(offset, packet_data)  # Write it in place, whatever its arrival order
+                metrics.count('bytes_received_total', len(packet_data))
+                metrics.progress(len(packet_data))
+                if trace is not None:
+                    trace.record(pkttrace.WRITE, sequence_number, len(packet_data))
+                received_packets.add(sequence_number)
+                if flags & FLAG_EOF:
+                    # Record the final packet and cut the file to its exact length
+                    final_packet_seq = sequence_number
+                    end_offset = offset + len(packet_data)
+                    if truncate:
+                        output_file.truncate(end_offset)
 
-    # Continue receiving packets until the end of the file is marked and all packets within the window are processed
-    while not file_end_received or any(seq >= window_start for seq in received_data_packets):
-        packet, sender_addr = sock.recvfrom(DATA_PAYLOAD_SIZE + HEADER_LENGTH)  # Receive a packet
-        sequence_number = int.from_bytes(packet[:2], SYSTEM_BYTE_ORDER)  # Extract sequence number
-        eof_marker = packet[2]  # Extract EOF flag
-        packet_data = packet[3:]  # Extract the data payload
-
-        # Send an ACK for the received packet
-        ack_response = sequence_number.to_bytes(2, SYSTEM_BYTE_ORDER)
-        sock.sendto(ack_response, sender_addr)
-
-        # Check if the packet is within the window and not already received
-        if window_start <= sequence_number < window_start + ctrl_window_size and sequence_number not in received_data_packets:
-            received_data_packets[sequence_number] = (packet_data, eof_marker)  # Store packet
-            if eof_marker == 1:
-                # If EOF marker is set, record the end of file and the final packet's sequence number
-                file_end_received = True
-                final_packet_seq = sequence_number
-
-            # Write in-sequence packets to the file and advance the window as appropriate
-            with open(target_filename, 'ab') as output_file:
-                while window_start in received_data_packets:
-                    data, is_eof = received_data_packets.pop(window_start)
-                    output_file.write(data)  # Write data to file
-                    if is_eof == 1:
-                        # Break the loop if EOF marker is encountered
-                        file_end_received = True
-                        break
-                    window_start += 1  # Advance the sliding window
+                # Slide the window past every packet that has now arrived
+                previous_start = window_start
+                window_start = received_packets.advance(window_start)
+                if trace is not None and window_start != previous_start:
+                    trace.record(pkttrace.ADVANCE, window_start, ctrl_window_size)
+                # An in-order packet that leaves no gap behind may wait; a gap opening or closing may not
+                urgent = sequence_number != previous_start or received_packets.bits_from(window_start + 1, SACK_BITS) != 0
+            if decoder is not None:
+                decoder.forget(window_start)
+
+            if ack_policy.on_packet(urgent):
+                sock.sendto(build_sack(window_start, received_packets, header), sender_addr)
+                metrics.count('acks_sent_total')
+                if trace is not None:
+                    trace.record(pkttrace.ACK_SENT, window_start - 1)
+                ack_policy.sent()
+
+            if journal is not None and time.monotonic() >= next_checkpoint:
+                save_checkpoint(journal, output_file, session, window_start, received_packets, ctrl_window_size, final_packet_seq)
+                next_checkpoint = time.monotonic() + JOURNAL_INTERVAL
+    finally:
+        if journal is not None:
+            if final_packet_seq is not None and window_start > final_packet_seq:
+                journal.remove()  # Complete: nothing left to resume
+            else:
+                save_checkpoint(journal, output_file, session, window_start, received_packets, ctrl_window_size, final_packet_seq)
+        output_file.close()
+        sock.settimeout(None)
 
     # After receiving the final packet, send repeated ACKs to ensure the sender knows transmission is complete
     if final_packet_seq is not None:
         for _ in range(REPEATED_ACKS_FOR_LAST_PACKET):
-            ack_response = final_packet_seq.to_bytes(2, SYSTEM_BYTE_ORDER)
-            sock.sendto(ack_response, sender_addr)
+            sock.sendto(build_sack(window_start, received_packets, header), sender_addr)
+        metrics.count('acks_sent_total', REPEATED_ACKS_FOR_LAST_PACKET)
+    metrics.finish()
+    return end_offset
 
 if __name__ == "__main__":
     # Check for correct command line arguments and exit if incorrect
-    if len(sys.argv) != 4:
+    args, options = split_options(sys.argv[1:])
+    if len(args) != 3:
         sys.exit(1)
 
     # Extract command line arguments for port, output filename, and window size
-    UDP_PORT, OUTPUT_FILENAME, WINDOW_SIZE = int(sys.argv[1]), sys.argv[2], int(sys.argv[3])
+    UDP_PORT, OUTPUT_FILENAME, WINDOW_SIZE = int(args[0]), args[1], int(args[2])
+    try:
+        batch_modes = choose(options.get('batch_io'), RECEIVE_MODES)  # --batch-io, checked before the handshake
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
 
-    # Remove the output file if it already exists to start fresh
-    if os.path.exists(OUTPUT_FILENAME):
+    # With --resume, keep a partial file and its journal (<file>.journal) so a restarted sender
+    # only sends what is missing; otherwise remove the output file if it already exists to start fresh
+    journal = None
+    if options.get('resume'):
+        journal = RangeJournal(OUTPUT_FILENAME + '.journal')
+    elif os.path.exists(OUTPUT_FILENAME):
         os.remove(OUTPUT_FILENAME)
 
+    trace = pkttrace.TraceRecorder.from_options(options)  # --trace=<file>
+
     # Create a UDP socket and bind it to the specified port
     udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     udp_socket.bind(('0.0.0.0', UDP_PORT))
 
     try:
         # Handle incoming data until the transmission is complete
-        handle_incoming_data(udp_socket, OUTPUT_FILENAME, WINDOW_SIZE)
+        handle_incoming_data(udp_socket, OUTPUT_FILENAME, WINDOW_SIZE, DelayedAck.from_options(options),
+                             ReceiverLimits.from_options(options, WINDOW_SIZE, FEATURE_COMPRESS | FEATURE_FEC | (FEATURE_RESUME if journal else 0)),
+                             journal=journal, metrics=TransferMetrics.from_options(options, 'receiver', 'selective-repeat'),
+                             trace=trace, batch_modes=batch_modes)
     finally:
         # Ensure the socket is closed properly
         udp_socket.close()
+        if trace is not None:
+            trace.close()
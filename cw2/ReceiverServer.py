@@ -0,0 +1,178 @@
+# Emir Ersanli S2221285
+"""
+Long-running Selective Repeat receiver for many senders at once.
+
+One UDP socket and one event loop serve every transfer. Sessions are keyed
+by (sender address, session id from the handshake); data packets carry no
+session id and are routed by sender address to that address's latest
+session. Each session has its own asyncsr.ReceiverProtocol (reorder
+bitmap, SACK state and output file), so a slow or lossy peer does not hold
+up the others. Any sender of the Sender4 protocol can connect: Sender4.py,
+`asyncsr.py send`, or a single StripedSender stream.
+
+Each session is written to <OutputDir>/<host>-<port>-<session id>.bin. At
+most --max-sessions transfers run at once; a SYN beyond the cap gets no
+answer and the sender's SYN retries try again later. A session that hears
+nothing for --idle-timeout seconds is dropped, and a finished one lingers
+as long to re-acknowledge a sender whose final SACKs were lost.
+
+With --metrics=<file>, each session exports its metrics to
+<file>.<host>-<port>-<session id> when it ends; SIGUSR1 exports every
+session still open.
+
+Usage:
+    python3 ReceiverServer.py <Port> <OutputDir> <WindowSize> [--max-sessions=N] [--idle-timeout=<seconds>] [Receiver4 options]
+"""
+import asyncio
+import os
+import signal
+import sys
+import time
+
+from cliopts import split_options, parse_quantity
+from ackpolicy import DelayedAck
+from handshake import ReceiverLimits, SessionParams, SYN, FEATURE_COMPRESS, is_handshake
+from asyncsr import ReceiverProtocol
+from metrics import TransferMetrics, PROMETHEUS_SUFFIXES
+
+DEFAULT_MAX_SESSIONS = 64  # Transfers in progress at the same time
+DEFAULT_IDLE_TIMEOUT = 30.0  # Seconds of silence before a session is dropped
+
+class ReceiverServer(asyncio.DatagramProtocol):
+    """
+    Demultiplexes datagrams on one socket into per-session receivers.
+    """
+
+    def __init__(self, directory, window, options=None, max_sessions=DEFAULT_MAX_SESSIONS, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.directory = directory  # Where the session files go
+        self.options = options or {}  # --ack-every, --ack-delay and --max-payload for every session
+        self.limits = ReceiverLimits.from_options(self.options, window, FEATURE_COMPRESS)  # Compressed senders welcome
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.metrics_path = self.options.get('metrics')  # Base of the per-session metrics files
+        if not isinstance(self.metrics_path, str):
+            self.metrics_path = None
+        self.metrics_format = self.options.get('metrics_format')
+        if self.metrics_format not in (None, 'json', 'prometheus'):
+            raise ValueError(f"unknown metrics format: {self.metrics_format}")
+        if self.metrics_format is None and self.metrics_path is not None:
+            # The suffixed session files keep the format the base name asks for
+            self.metrics_format = 'prometheus' if self.metrics_path.endswith(PROMETHEUS_SUFFIXES) else 'json'
+        self.sessions = {}  # (addr, session id) -> ReceiverProtocol
+        self.by_addr = {}  # addr -> (addr, session id) of its latest session
+        self.last_heard = {}  # (addr, session id) -> loop time of its last datagram
+        self.started = {}  # (addr, session id) -> perf_counter at its SYN
+        self.transport = None
+        self.loop = asyncio.get_running_loop()
+        self.reaper = None  # Periodic idle-session check
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.reaper = self.loop.call_later(self.idle_timeout / 4, self.reap)
+
+    def active(self):
+        """Number of sessions still receiving."""
+        return sum(1 for protocol in self.sessions.values() if not protocol.done.done())
+
+    def open_session(self, key, proposal):
+        # A new transfer from this address replaces whatever it sent before
+        previous = self.by_addr.get(key[0])
+        if previous is not None:
+            self.close_session(previous, ConnectionAbortedError("replaced by a new session"))
+        host, port = key[0][:2]
+        name = f"{host}-{port}-{proposal.session:08x}"
+        path = os.path.join(self.directory, name + '.bin')
+        # Built directly: the server owns SIGUSR1 and exports every session on it
+        metrics = TransferMetrics('receiver', 'selective-repeat',
+                                  f"{self.metrics_path}.{name}" if self.metrics_path else None, self.metrics_format)
+        protocol = ReceiverProtocol(path, self.limits, DelayedAck.from_options(self.options), metrics)
+        protocol.connection_made(self.transport)
+        protocol.done.add_done_callback(lambda done, key=key, path=path: self.session_done(key, path, done))
+        self.sessions[key] = protocol
+        self.by_addr[key[0]] = key
+        self.started[key] = time.perf_counter()
+        return protocol
+
+    def session_done(self, key, path, done):
+        if done.cancelled() or done.exception() is not None:
+            return  # Dropped or replaced; the partial file stays for inspection
+        protocol = self.sessions[key]
+        protocol.metrics.finish()
+        duration = time.perf_counter() - self.started[key]
+        print(f' {path} {protocol.bytes_received} {protocol.bytes_received / duration / 1024:.2f} ', flush=True)
+
+    def close_session(self, key, exc):
+        protocol = self.sessions.pop(key)
+        protocol.connection_lost(exc)  # Closes the file if the transfer was still running
+        protocol.metrics.finish()  # Already exported if it completed; a dropped session exports what it got
+        self.last_heard.pop(key, None)
+        self.started.pop(key, None)
+        if self.by_addr.get(key[0]) == key:
+            del self.by_addr[key[0]]
+
+    def export_metrics(self):
+        """Exports the metrics of every open session."""
+        for protocol in self.sessions.values():
+            protocol.metrics.export()
+
+    def datagram_received(self, packet, addr):
+        if is_handshake(packet):
+            kind, proposal = SessionParams.unpack(packet)
+            if kind != SYN:
+                return
+            key = (addr, proposal.session)
+            if key not in self.sessions:
+                if self.active() >= self.max_sessions:
+                    return  # Full: the sender retries its SYN
+                self.open_session(key, proposal)
+        else:
+            key = self.by_addr.get(addr)
+            if key is None:
+                return  # Data from an unknown or expired session
+        self.last_heard[key] = self.loop.time()
+        self.sessions[key].datagram_received(packet, addr)
+
+    def reap(self):
+        # Drop sessions that have gone quiet, running or finished
+        now = self.loop.time()
+        for key in [key for key, heard in self.last_heard.items() if now - heard > self.idle_timeout]:
+            self.close_session(key, TimeoutError("sender went quiet"))
+        self.reaper = self.loop.call_later(self.idle_timeout / 4, self.reap)
+
+    def error_received(self, exc):
+        pass  # ICMP errors from one peer must not take the server down
+
+    def connection_lost(self, exc):
+        if self.reaper is not None:
+            self.reaper.cancel()
+        for key in list(self.sessions):
+            self.close_session(key, exc or ConnectionError("server closed"))
+
+async def serve(port, directory, window, host='0.0.0.0', options=None):
+    """Receives files on `port` until cancelled."""
+    options = options or {}
+    os.makedirs(directory, exist_ok=True)
+    loop = asyncio.get_running_loop()
+    transport, server = await loop.create_datagram_endpoint(
+        lambda: ReceiverServer(directory, window, options,
+                               parse_quantity(options.get('max_sessions', DEFAULT_MAX_SESSIONS)),
+                               float(options.get('idle_timeout', DEFAULT_IDLE_TIMEOUT))),
+        local_addr=(host, port))
+    if server.metrics_path is not None and hasattr(signal, 'SIGUSR1'):
+        loop.add_signal_handler(signal.SIGUSR1, server.export_metrics)
+    try:
+        await asyncio.Event().wait()  # Serve forever
+    finally:
+        if server.metrics_path is not None and hasattr(signal, 'SIGUSR1'):
+            loop.remove_signal_handler(signal.SIGUSR1)
+        transport.close()
+
+if __name__ == '__main__':
+    args, options = split_options(sys.argv[1:])
+    if len(args) != 3:
+        print(__doc__.split('Usage:')[1])
+        sys.exit(1)
+    try:
+        asyncio.run(serve(int(args[0]), args[1], int(args[2]), options=options))
+    except KeyboardInterrupt:
+        pass
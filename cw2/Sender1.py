@@ -2,43 +2,54 @@
 
 from socket import socket, AF_INET, SOCK_DGRAM  # Import necessary components for UDP socket programming
 import sys  # For accessing command-line arguments
-import os  # For executing system commands
+from cliopts import split_options  # For the optional --rate/--burst flags
+from pacing import Pacer  # Token-bucket pacing between datagrams
+from filesource import MappedFile  # Zero-copy access to the file being sent
+from wire import HeaderFormat, SHORT_SEQ_WIDTH, FLAG_EOF  # Packet header layout
+from metrics import TransferMetrics  # Counters exported with --metrics
+
+DEFAULT_RATE = '100pps'  # Same spacing as the old 10 ms sleep per packet
 
 class Sender:
-    def __init__(self, destination_host, destination_port, file_path):
+    def __init__(self, destination_host, destination_port, file_path, pacer=None, metrics=None):
         # Initialize the Sender with destination details and file path
         self.destination = (destination_host, int(destination_port))  # Destination address and port
         self.file_path = file_path  # File to send
         self.sock = socket(AF_INET, SOCK_DGRAM)  # Create a UDP socket
         self.packet_size = 1024  # Define the size of data in each packet
+        self.header = HeaderFormat(SHORT_SEQ_WIDTH)  # 2-byte sequence number that wraps around
+        self.pacer = pacer  # Paces the datagrams, None sends as fast as possible
+        self.metrics = metrics or TransferMetrics('sender', 'oneway')  # Packets and bytes sent
 
     def transmit_file(self):
         # Method to read the file and send it in packets
-        with open(self.file_path, 'rb') as file:
-            file_data = file.read()  # Read the entire file
-            # Calculate total number of packets needed
-            total_packets = len(file_data) // self.packet_size + (1 if len(file_data) % self.packet_size else 0)
+        with MappedFile(self.file_path, self.packet_size) as file_data:  # Map the file instead of reading it
+            total_packets = file_data.total_packets  # Total number of packets needed
 
             for i in range(total_packets):
                 # For each packet, prepare and send it
-                start = i * self.packet_size
-                end = start + self.packet_size
-                eof_flag = 1 if i == total_packets - 1 else 0  # Set EOF flag for the last packet
-                # Prepare the packet header with sequence number and EOF flag
-                header = i.to_bytes(2, byteorder='big') + eof_flag.to_bytes(1, byteorder='big')
-                packet = header + file_data[start:end]  # Combine header with data slice
-                self.sock.sendto(packet, self.destination)  # Send the packet
-                os.system("sleep 0.01")  # Simulate propagation delay
+                eof_flag = FLAG_EOF if i == total_packets - 1 else 0  # Set EOF flag for the last packet
+                payload = file_data.payload(i)  # A view of the data
+                if self.pacer is not None:
+                    self.pacer.wait(self.header.header_length + len(payload))  # Wait for the token bucket to allow this packet
+                # Send the header with sequence number and EOF flag followed by the payload, without joining them
+                self.header.send_data(self.sock, self.destination, i, eof_flag, payload)
+                self.metrics.count('packets_sent_total')
+                self.metrics.count('bytes_sent_total', len(payload))
+                self.metrics.progress(len(payload))  # No ACKs: what was sent is all we know
 
         self.sock.close()  # Close the socket after sending all packets
+        self.metrics.finish()  # Export the metrics, with --metrics
 
 if __name__ == '__main__':
     # Main entry point for the script
-    if len(sys.argv) != 4:
+    args, options = split_options(sys.argv[1:])
+    if len(args) != 3:
         # Ensure correct command-line arguments are provided
-        print("Usage: python3 Sender1.py <RemoteHost> <Port> <Filename>")
+        print("Usage: python3 Sender1.py <RemoteHost> <Port> <Filename> [--rate=<bytes/s>|<n>pps] [--burst=<n>] [--metrics=<file>]")
         sys.exit(1)  # Exit if arguments are incorrect
-    sender = Sender(sys.argv[1], sys.argv[2], sys.argv[3])
+    pacer = Pacer.from_options(options, DEFAULT_RATE)  # Defaults to the original 100 packets/s
+    sender = Sender(args[0], args[1], args[2], pacer, TransferMetrics.from_options(options, 'sender', 'oneway'))
     sender.transmit_file()  # Start file transmission
 
 
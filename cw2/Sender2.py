@@ -3,31 +3,49 @@ import socket
 import sys
 import math
 import time
+from filesource import MappedFile
+from wire import SHORT_SEQ_WIDTH, FLAG_EOF
+from cliopts import split_options
+from rtt import RttEstimator
+from handshake import SessionParams, HANDSHAKE, connect, check_options, is_handshake
+from metrics import TransferMetrics
 
 # Collect command-line arguments for network configuration and file details
-destination_IP = sys.argv[1]
-destination_PORT = int(sys.argv[2])
-file_name = sys.argv[3]
-timeout = int(sys.argv[4])  # Timeout duration for ACK waiting, in milliseconds
+args, options = split_options(sys.argv[1:])
+destination_IP = args[0]
+destination_PORT = int(args[1])
+file_name = args[2]
+timeout = int(args[3])  # Initial timeout for ACK waiting, in milliseconds
+try:
+    check_options(options)  # --payload and --seq-width, checked before the socket is opened
+except ValueError as error:
+    print(error)
+    sys.exit(1)
+
+# Adapt the timeout to the measured round-trip time (--rto=initial|ceiling|fixed)
+rtt = RttEstimator.from_options(timeout, options)
+
+# Counters and histograms of the transfer, exported with --metrics=<file> and on SIGUSR1
+metrics = TransferMetrics.from_options(options, 'sender', 'stop-and-wait')
 
 # Setup the UDP socket for data transmission
 socket_obj = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
-def read_file_to_bytearray(filepath):
-    """
-    Opens and reads the contents of the specified file,
-    returning a bytearray of the file's contents.
-    """
-    with open(filepath, 'rb') as file:
-        file_data = file.read()
-    return bytearray(file_data)
+# Agree on the payload size with the receiver (--payload=<bytes>|mtu); one packet is in flight at a time
+session = connect(socket_obj, (destination_IP, destination_PORT),
+                  SessionParams.propose(options, 1, (destination_IP, destination_PORT), seq_width=SHORT_SEQ_WIDTH),
+                  rtt.timeout, rtt)
+payload_size = session.payload_size
+
+# 2-byte sequence numbers that wrap around, so files of any size can be sent
+header = session.header
 
-# Reading the specified file into a bytearray for transmission
-data = read_file_to_bytearray(file_name)
+# Map the specified file into memory; payloads are sliced out of it without copying
+data = MappedFile(file_name, payload_size)
 
 # Calculate the necessary transmission metrics
-num_full_packets = math.floor(len(data) / 1024)
-final_packet_size = len(data) % 1024
+num_full_packets = math.floor(len(data) / payload_size)
+final_packet_size = len(data) % payload_size
 
 # Initialize transmission control variables
 sequence_number = 0
@@ -36,38 +54,54 @@ start_time = time.perf_counter()
 
 # Main loop for packet preparation and transmission
 for packet_index in range(num_full_packets + 1):
-    # Determine if this packet is the last packet
-    is_final_packet = 1 if packet_index == num_full_packets and final_packet_size != 0 else 0
+    # Determine if this packet is the last packet; it is empty when the file fills every packet
+    is_final_packet = FLAG_EOF if packet_index == num_full_packets else 0
     
     # Increment the sequence number for each packet
     sequence_number += 1
     
-    # Construct the packet with its header and data
-    packet_header = bytearray(sequence_number.to_bytes(2, 'big')) + bytearray([is_final_packet])
-    packet_data = data[packet_index * 1024: (packet_index + 1) * 1024] if not is_final_packet else data[-final_packet_size:]
-    packet = packet_header + packet_data
+    # The packet's data; the final packet's view is already cut short
+    packet_data = data.payload(packet_index)
     
-    # Transmit the packet
-    socket_obj.sendto(packet, (destination_IP, destination_PORT))
+    # Transmit the packet: its header and data are gathered by the kernel, never joined
+    header.send_data(socket_obj, (destination_IP, destination_PORT), sequence_number, is_final_packet, packet_data)
+    metrics.count('packets_sent_total')
+    metrics.count('bytes_sent_total', len(packet_data))
+    send_time = time.perf_counter()
+    retransmitted = False  # Karn's rule: no RTT sample from a retransmitted packet
     
     # Initialize ACK reception logic
     correct_ack_received = False
     while not correct_ack_received:
         try:
-            socket_obj.settimeout(timeout / 1000)  # Convert milliseconds to seconds for the timeout
-            ack_data, _ = socket_obj.recvfrom(2)
-            ack_sequence_number = int.from_bytes(ack_data[:2], 'big')
+            socket_obj.settimeout(rtt.timeout)  # Current retransmission timeout in seconds
+            ack_data, _ = socket_obj.recvfrom(HANDSHAKE.size)
+            if is_handshake(ack_data):
+                continue  # A late answer to a repeated SYN
+            ack_sequence_number = header.unwrap(header.unpack_ack(ack_data), sequence_number)
+            metrics.count('acks_received_total')
             
             # Verify the ACK is for the current packet
             if ack_sequence_number == sequence_number:
                 correct_ack_received = True
+                rtt.on_ack()
+                metrics.progress(len(packet_data))
+                if not retransmitted:
+                    rtt.sample(time.perf_counter() - send_time)
+                    metrics.observe('rtt_seconds', time.perf_counter() - send_time)
             else:
                 # If ACK sequence number does not match, prepare for retransmission
                 raise ValueError("Received incorrect ACK sequence number.")
-        except (socket.timeout, ValueError):
+        except (socket.timeout, ValueError) as exc:
+            if isinstance(exc, socket.timeout):
+                rtt.on_timeout()  # Back off before waiting again
             # Retransmit the packet if ACK was not received correctly
-            socket_obj.sendto(packet, (destination_IP, destination_PORT))
+            header.send_data(socket_obj, (destination_IP, destination_PORT), sequence_number, is_final_packet, packet_data)
             num_retransmissions += 1
+            metrics.count('packets_sent_total')
+            metrics.count('bytes_sent_total', len(packet_data))
+            metrics.count('retransmissions_total', cause='timeout' if isinstance(exc, socket.timeout) else 'wrong_ack')
+            retransmitted = True
 
 # Mark the end of the transmission to calculate metrics
 end_time = time.perf_counter()
@@ -82,5 +116,7 @@ print(f" {num_retransmissions} {transmission_rate:.2f}")
 #print(f"Transmission time: {transmission_duration:.2f} seconds")
 #print(f" {transmission_rate:.2f}  ")
 
-# Clean up by closing the socket
+# Clean up by closing the socket and unmapping the file
 socket_obj.close()
+data.close()
+metrics.finish()
@@ -1,16 +1,48 @@
 # Emir Ersanli S2221285
 import socket
 import sys
-import math
 import time
-import select
+from filesource import MappedFile
+from wire import FLAG_EOF, FLAG_PARITY
+from cliopts import split_options
+from rtt import RttEstimator
+from congestion import make_controller
+from handshake import SessionParams, HANDSHAKE, FEATURE_FEC, connect, check_options, is_handshake
+from fec import ParityEncoder, PARITY_HEADER
+from batchio import BatchSender, SEND_MODES, choose
+from metrics import TransferMetrics, WINDOW_BUCKETS
 
 # Initialize socket setup and file transfer parameters from command-line arguments
-destination_IP = sys.argv[1]
-destination_PORT = int(sys.argv[2])
-file_name = sys.argv[3]
-timeout = int(sys.argv[4])  # Timeout duration in milliseconds
-window_size = int(sys.argv[5])
+args, options = split_options(sys.argv[1:])
+destination_IP = args[0]
+destination_PORT = int(args[1])
+file_name = args[2]
+timeout = int(args[3])  # Initial timeout in milliseconds
+window_size = int(args[4])  # Upper bound on the congestion window
+
+# Adapt the timeout to the measured round-trip time (--rto=initial|ceiling|fixed)
+rtt = RttEstimator.from_options(timeout, options)
+# Counters and histograms of the transfer, exported with --metrics=<file> and on SIGUSR1
+metrics = TransferMetrics.from_options(options, 'sender', 'go-back-n')
+# How window bursts go out (--batch-io=auto|gso|mmsg|off), checked before the handshake
+try:
+    batch_modes = choose(options.get('batch_io'), SEND_MODES)
+    check_options(options)  # --payload and --seq-width
+except ValueError as error:
+    print(error)
+    sys.exit(1)
+# Why the sender last went back: every packet resent after it is counted under this cause
+retransmit_cause = 'timeout'
+# Duplicate ACKs that trigger a retransmission without waiting for the timeout
+DUPLICATE_ACK_THRESHOLD = 3
+# Returned by receive_ack when the duplicate ACK threshold is reached
+FAST_RETRANSMIT = None
+
+# First-transmission time of each unacknowledged packet, for RTT samples
+send_times = {}
+# Packets below this sequence number have been retransmitted and give no RTT sample (Karn's rule);
+# fast retransmit is armed again only once all of them have been acknowledged
+retransmitted_below = 0
 
 # Function to send a single packet
 def send_packet(sequence_number, last_sequence_number, last_packet_size, data, socket_obj):
@@ -18,50 +50,99 @@ def send_packet(sequence_number, last_sequence_number, last_packet_size, data, s
     Prepares and sends a packet of data using the provided UDP socket.
     Adjusts packet size for the final packet and handles EOF flag.
     """
-    EOF = 1 if sequence_number == last_sequence_number else 0
-    packet_size = 1024 if EOF == 0 else last_packet_size
-    start_index = sequence_number * 1024
-    packet_data = data[start_index:start_index+packet_size]
-    
-    # Construct packet with header and payload
-    packet_header = bytearray(sequence_number.to_bytes(2, 'big')) + bytearray([EOF])
-    packet = packet_header + packet_data
+    EOF = FLAG_EOF if sequence_number == last_sequence_number else 0
+    packet_data = data.payload(sequence_number)  # Zero-copy view, already short for the final packet
     
-    # Send the packet, using select for non-blocking sockets
-    try:
-        socket_obj.sendto(packet, (destination_IP, destination_PORT))
-    except socket.error:
-        select.select([], [socket_obj], [])
+    # Record when the packet first went out
+    if sequence_number not in send_times:
+        send_times[sequence_number] = time.perf_counter()
+    else:
+        metrics.count('retransmissions_total', cause=retransmit_cause)
+    metrics.count('packets_sent_total')
+    metrics.count('bytes_sent_total', len(packet_data))
+    metrics.observe('window_occupancy_packets', sequence_number - base, WINDOW_BUCKETS)
+
+    # Queue the header and payload without joining them; flush_packets() sends the window's burst at once
+    batch.add(sequence_number, EOF, packet_data)
+
+    # With FEC, follow each completed group with its parity packets (sent once, never for a retransmission)
+    if fec is not None:
+        for key, parity in fec.add(sequence_number, EOF, packet_data, EOF):
+            batch.add(key, FLAG_PARITY, parity)
+            metrics.count('parity_packets_sent_total')
+
+# Function to send the queued packets
+def flush_packets(socket_obj):
+    """
+    Sends every packet queued by send_packet in as few system calls as the
+    batch mode allows, waiting with select while the socket buffer is full.
+    """
+    batch.flush(socket_obj, (destination_IP, destination_PORT))
 
 # Function to receive ACKs
-def receive_ack(expected_sequence_number, socket_obj):
+def receive_ack(expected_sequence_number, socket_obj, fast_retransmit=True):
     """
-    Waits for an ACK for the specified sequence number.
-    Implements timeout and retransmission based on socket timeout.
+    Waits for an ACK beyond the specified sequence number and returns it.
+    Returns the expected sequence number itself on a timeout, and
+    FAST_RETRANSMIT after DUPLICATE_ACK_THRESHOLD duplicate ACKs when
+    fast retransmit is allowed.
     """
+    duplicates = 0
     while True:
         try:
-            socket_obj.settimeout(timeout / 1000)  # Convert milliseconds to seconds
-            ack_data, _ = socket_obj.recvfrom(2)
-            ack_sequence_number = int.from_bytes(ack_data[:2], 'big')
+            socket_obj.settimeout(rtt.timeout)  # Current retransmission timeout in seconds
+            ack_data, _ = socket_obj.recvfrom(HANDSHAKE.size)
+            if is_handshake(ack_data):
+                continue  # A late answer to a repeated SYN
+            metrics.count('acks_received_total')
+            # Map the cumulative ACK back to an absolute sequence number near the window base
+            ack_sequence_number = header.unwrap(header.unpack_ack(ack_data), expected_sequence_number)
             
             if expected_sequence_number < ack_sequence_number:
                 return ack_sequence_number
+            if ack_sequence_number == expected_sequence_number and fast_retransmit:
+                # The receiver got a packet past a gap and repeated its last in-order ACK
+                duplicates += 1
+                if duplicates >= DUPLICATE_ACK_THRESHOLD:
+                    return FAST_RETRANSMIT
         except socket.timeout:
             # On timeout, return the current expected sequence number to trigger retransmission
             return expected_sequence_number
 
 # Setup UDP socket
 socket_obj = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+# Parity packets per group of data packets (--fec[=K[:R]]), checked before the handshake
+fec = ParityEncoder.from_options(options, 0, 0)
+
+# Agree on payload size, window and sequence width with the receiver (--payload=<bytes>|mtu, --seq-width=2|4|8)
+session = connect(socket_obj, (destination_IP, destination_PORT),
+                  SessionParams.propose(options, window_size, (destination_IP, destination_PORT),
+                                        FEATURE_FEC if fec else 0),
+                  rtt.timeout, rtt)
+payload_size = session.payload_size
+# Keep FEC only if the receiver can use it
+if fec is not None:
+    if session.features & FEATURE_FEC:
+        fec.payload_size = payload_size
+    else:
+        fec = None
+# Grow and shrink the effective window from ACKs and losses (--cc=reno|delay|none),
+# never beyond what the receiver agreed to
+congestion = make_controller(session.window, options)
+# Sequence numbers of the agreed width, with wraparound-safe comparisons
+header = session.header
 socket_obj.setblocking(False)  # Set socket to non-blocking mode
+# Window bursts go out in one system call per run of packets
+batch = BatchSender(header, header.header_length + payload_size + (PARITY_HEADER.size if fec is not None else 0),
+                    batch_modes)
 
-# Read file data
-with open(file_name, 'rb') as file:
-    data = bytearray(file.read())
+# Map file data instead of reading it into memory
+data = MappedFile(file_name, payload_size)
 
 # Calculate transmission parameters
-total_packets = math.ceil(len(data) / 1024)
-last_packet_size = len(data) % 1024 if len(data) % 1024 != 0 else 1024
+total_packets = data.total_packets
+last_packet_size = len(data) % payload_size if len(data) % payload_size != 0 else payload_size
 
 # Initialize control variables
 base = -1
@@ -73,17 +154,39 @@ start_time = time.perf_counter()
 try:
     while not file_sent:
         # Send packets within the window
-        while sequence_number - base <= window_size and sequence_number < total_packets:
+        while sequence_number - base <= congestion.window and sequence_number < total_packets:
             send_packet(sequence_number, total_packets - 1, last_packet_size, data, socket_obj)
             sequence_number += 1
+        flush_packets(socket_obj)
         
         # Receive ACKs and handle timeouts
         try:
-            new_base = receive_ack(base, socket_obj)
-            if new_base == base:  # Timeout occurred, prepare for retransmission
+            new_base = receive_ack(base, socket_obj, fast_retransmit=base + 1 >= retransmitted_below)
+            if new_base is FAST_RETRANSMIT:  # Duplicate ACKs: go back to the gap now, about one RTT after the loss
+                congestion.on_loss(base + 1, sequence_number, timeout=False)  # Halve the window instead of restarting
+                retransmitted_below = max(retransmitted_below, sequence_number)
+                sequence_number = base + 1
+                retransmissions += 1
+                retransmit_cause = 'dup_ack'
+            elif new_base == base:  # Timeout occurred, prepare for retransmission
+                rtt.on_timeout()  # Back off the timeout
+                congestion.on_loss(base + 1, sequence_number)  # Shrink the window
+                retransmitted_below = max(retransmitted_below, sequence_number)
                 sequence_number = base + 1
                 retransmissions += 1
+                retransmit_cause = 'timeout'
             else:
+                rtt.on_ack()  # Progress ends any backoff
+                # Sample the RTT of the newest packet this ACK covers, unless it was resent
+                rtt_sample = None
+                if new_base >= retransmitted_below and new_base in send_times:
+                    rtt_sample = time.perf_counter() - send_times[new_base]
+                    rtt.sample(rtt_sample)
+                    metrics.observe('rtt_seconds', rtt_sample)
+                metrics.progress((new_base - base) * payload_size)  # Whole packets, the last one may be shorter
+                congestion.on_ack(new_base - base, rtt_sample)  # Grow the window
+                for acked in range(base + 1, new_base + 1):
+                    send_times.pop(acked, None)
                 base = new_base
             
             if base >= total_packets - 1:  # Last packet acknowledged
@@ -102,3 +205,6 @@ transmission_rate = data_kb / transmission_time
 print(f" {transmission_rate:.2f} ")
 
 socket_obj.close()
+data.close()
+congestion.close()
+metrics.finish()
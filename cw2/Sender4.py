@@ -4,12 +4,25 @@ import sys
 import threading
 import time
 import select
+import os
+from wire import HeaderFormat, FLAG_EOF, FLAG_PARITY, sacked
+from batchio import BatchSender, SEND_MODES, choose
+from timers import RetransmitTimer
+from rtt import RttEstimator
+from cliopts import split_options
+from congestion import make_controller
+from handshake import SessionParams, HANDSHAKE, FEATURE_RESUME, FEATURE_COMPRESS, FEATURE_FEC, connect, fetch_journal, check_options, is_handshake
+from journal import covered_run
+from compression import BlockCompressor
+from fec import ParityEncoder, PARITY_HEADER
+from metrics import TransferMetrics, WINDOW_BUCKETS
+import pkttrace  # --trace recorder and its event codes
 
 # Define constants
 CHUNK_SIZE = 1024  # Size of data chunks to be sent
-HEADER_LENGTH = 3  # Length of the header: 2 bytes for sequence number, 1 byte for EOF indicator
-ACK_LENGTH = 2  # Length of the acknowledgement
-BYTE_ORDERING = 'big'  # Byte order to be used
+HEADER = HeaderFormat()  # 4-byte sequence number that wraps around, 1 byte of flags
+HEADER_LENGTH = HEADER.header_length  # Length of the header
+DUPLICATE_THRESHOLD = 3  # SACKed packets above a hole before it is resent without waiting for its timer
 
 # Define a class for data packets
 class DataPacket:
@@ -17,113 +30,279 @@ class DataPacket:
     Encapsulates a data packet's attributes and functionality.
     """
 
-    # Initialize the data packet with sequence number, content, and EOF indicator
-    def __init__(self, seq_no, content, is_last):
+    # Initialize the data packet with sequence number, content, EOF indicator and any further flags
+    def __init__(self, seq_no, content, is_last, flags=0):
         self.seq_no = seq_no
         self.content = content
         self.is_last = is_last
+        self.flags = flags  # FLAG_COMPRESSED for a compressed payload
 
-    # Assemble the data packet
-    def assemble(self):
-        seq_bytes = self.seq_no.to_bytes(2, byteorder=BYTE_ORDERING)
-        eof_byte = b'\x01' if self.is_last else b'\x00'
-        return seq_bytes + eof_byte + self.content  # Return the assembled packet
+    # Queue the data packet on the session's batch; it goes out with the batch's next flush
+    def queue(self, batch):
+        batch.add(self.seq_no, (FLAG_EOF if self.is_last else 0) | self.flags, self.content)
 
 # Define a class for reliable UDP sender
 class ReliableUDPSender:
-    # Initialize the sender with target host and port, source file, retry timeout, and maximum window size
-    def __init__(self, target_host, target_port, source_file, retry_timeout, max_window):
+    # Initialize the sender with target host and port, source file, retry timeout, and maximum window size;
+    # offset and length restrict the transfer to one byte range of the file (length None: up to its end)
+    def __init__(self, target_host, target_port, source_file, retry_timeout, max_window, options=None, offset=0, length=None):
+        # --batch-io, --payload and --seq-width, checked first so a bad value leaves no socket or worker behind
+        self.batch_modes = choose((options or {}).get('batch_io'), SEND_MODES)
+        check_options(options or {})
         self.target_host = target_host
         self.target_port = target_port
+        self.destination = (target_host, target_port)  # Address every packet goes to
         self.source_file = source_file
+        self.offset = offset  # First byte of the file to send
+        self.length = length  # Bytes to send from there
         self.retry_timeout = retry_timeout / 1000.0  # Convert timeout to seconds
+        self.rtt = RttEstimator.from_options(retry_timeout, options or {})  # Adaptive retransmission timeout
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # Create a UDP socket
         self.max_window = max_window  # Maximum window size for transmission
+        self.options = options or {}  # Proposed payload size and sequence width for the handshake
+        self.header = HEADER  # Header layout, replaced by the agreed one in connect()
+        self.chunk_size = CHUNK_SIZE  # Payload bytes per packet, replaced by the agreed size in connect()
+        self.resume_ranges = []  # Byte ranges the receiver already holds, with --resume
+        self.compressor = BlockCompressor.from_options(self.options)  # --compress; None when off or refused
+        self.fec = ParityEncoder.from_options(self.options, 1, CHUNK_SIZE)  # --fec; None when off or refused
+        self.congestion = make_controller(max_window, options or {})  # Effective window below the maximum
         self.seq_base = 1  # Base sequence number
         self.seq_next = 1  # Next sequence number
         self.acknowledged = {}  # Dictionary to keep track of acknowledged packets
         self.mutex = threading.Lock()  # Mutex for synchronization
+        self.wakeup = threading.Condition(self.mutex)  # Signalled when ACKs move the window
         self.finished = False  # Flag to indicate if transmission is finished
         self.outgoing = {}  # Dictionary to keep track of outgoing packets
+        self.timeouts = {}  # Send time of every unacknowledged packet
+        self.timer = RetransmitTimer()  # Retransmission deadlines in a min-heap
+        self.retransmitted = set()  # Unacknowledged packets sent more than once (no RTT sample, Karn's rule)
+        self.resends = 0  # Counter for resends
+        self.metrics = TransferMetrics.from_options(self.options, 'sender', 'selective-repeat')  # --metrics
+        self.trace = pkttrace.TraceRecorder.from_options(self.options)  # --trace; None when off
+        self.batch = None  # Packets waiting for one send call, set up in connect()
         self.ack_listener = threading.Thread(target=self.listen_for_ack)  # Thread to listen for acknowledgements
+
+    # Agree on the session parameters with the receiver, then start listening for acknowledgements
+    def connect(self):
+        features = FEATURE_RESUME if self.options.get('resume') else 0  # Skip what an earlier attempt delivered
+        if self.compressor is not None:
+            features |= FEATURE_COMPRESS  # Compressed payloads, if the receiver can inflate them
+        if self.fec is not None:
+            features |= FEATURE_FEC  # Parity packets, if the receiver can use them
+        proposal = SessionParams.propose(self.options, self.max_window, self.destination, features,
+                                         offset=self.offset)  # --payload, --seq-width; the receiver writes from offset
+        session = connect(self.socket, self.destination, proposal, self.rtt.timeout, self.rtt)
+        self.header = session.header
+        self.chunk_size = session.payload_size
+        self.congestion.max_window = min(self.max_window, session.window)  # The receiver's window may be smaller
+        if session.features & FEATURE_RESUME:
+            self.resume_ranges = fetch_journal(self.socket, self.destination, session, self.rtt.timeout)
+        if self.compressor is not None and not session.features & FEATURE_COMPRESS:
+            self.compressor.close()  # An older receiver: send everything raw
+            self.compressor = None
+        if self.fec is not None:
+            if session.features & FEATURE_FEC:
+                self.fec.payload_size = session.payload_size
+            else:
+                self.fec = None
+        packet_size = self.header.header_length + self.chunk_size + (PARITY_HEADER.size if self.fec is not None else 0)
+        self.batch = BatchSender(self.header, packet_size, self.batch_modes)
         self.ack_listener.start()  # Start the acknowledgement listener thread
-        self.timeouts = {}  # Dictionary to keep track of timeouts
-        self.resends = 0  # Counter for resends
 
-    # Transmit the file
+    # Transmit the file, returning the bytes sent and the seconds taken
     def transmit(self):
+        self.connect()
         total_bytes = 0  # Total bytes sent
         with open(self.source_file, 'rb') as f:  # Open the source file in binary mode
+            f.seek(self.offset)  # Start of the byte range
+            remaining = float('inf') if self.length is None else self.length  # Bytes of the range not yet read
+            end = os.fstat(f.fileno()).st_size if self.length is None else self.offset + self.length  # End of the range
             start = time.time()  # Start time of transmission
-            while not self.finished or self.outgoing:  # While transmission is not finished or there are outgoing packets
-                self.mutex.acquire()  # Acquire the mutex
-                while self.seq_next < self.seq_base + self.max_window and not self.finished:  # While the sequence number is within the window and transmission is not finished
-                    block = f.read(CHUNK_SIZE)  # Read a block of data from the file
-                    final_packet = len(block) < CHUNK_SIZE  # Check if this is the final packet
-                    packet = DataPacket(self.seq_next, block, final_packet).assemble()  # Assemble the packet
-                    self.outgoing[self.seq_next] = packet  # Add the packet to the outgoing dictionary
-                    self.socket.sendto(packet, (self.target_host, self.target_port))  # Send the packet
-                    total_bytes += len(block)  # Update the total bytes sent
-                    if self.seq_next not in self.timeouts:  # If the sequence number is not in the timeouts dictionary
-                        self.timeouts[self.seq_next] = time.time()  # Add it with the current time
-                    self.seq_next += 1  # Increment the sequence number
-                    if final_packet:  # If this is the final packet
-                        self.finished = True  # Set the finished flag to True
-                self.mutex.release()  # Release the mutex
-                self.handle_timeouts()  # Handle timeouts
+            with self.wakeup:  # Hold the mutex except while waiting
+                while not self.finished or self.outgoing:  # While transmission is not finished or there are outgoing packets
+                    batch = []  # (sequence number, block, final) read while the window is open
+                    while self.seq_next < self.seq_base + self.congestion.window and not self.finished:  # While the sequence number is within the congestion window and transmission is not finished
+                        skip = covered_run(self.resume_ranges, f.tell(), self.chunk_size, end)  # Packets the receiver already has
+                        if skip:
+                            if self.seq_base == self.seq_next:
+                                self.seq_base += skip  # Nothing in flight below them: move the window past them all
+                            else:
+                                skip = 1  # Count it as acknowledged so the base can pass it later
+                                self.outgoing[self.seq_next] = None
+                                self.acknowledged[self.seq_next] = True
+                            self.seq_next += skip
+                            f.seek(skip * self.chunk_size, 1)
+                            remaining -= skip * self.chunk_size
+                            continue
+                        block = f.read(int(min(self.chunk_size, remaining)))  # Read a block of data from the file
+                        remaining -= len(block)
+                        final_packet = len(block) < self.chunk_size  # Check if this is the final packet
+                        batch.append((self.seq_next, block, final_packet))
+                        total_bytes += len(block)  # Update the total bytes sent
+                        self.seq_next += 1  # Increment the sequence number
+                        if final_packet:  # If this is the final packet
+                            self.finished = True  # Set the finished flag to True
+                    if batch:
+                        self.send_batch(batch)
+                    self.handle_timeouts()  # Resend whatever has expired
+                    if self.finished and not self.outgoing:
+                        break
+                    # Sleep until the next deadline, or until an ACK opens the window
+                    deadline = self.timer.next_deadline()
+                    self.wakeup.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
             end = time.time()  # End time of transmission
             duration = end - start  # Duration of transmission
-            speed = total_bytes / duration / 1024  # Speed of transmission in KB/s
-            print(f' {speed:.2f} ')  # Print the speed
             self.ack_listener.join()  # Wait for the acknowledgement listener thread to finish
+        return total_bytes, duration
+
+    # Send the packets read in one pass over the open window; the caller holds the mutex
+    def send_batch(self, batch):
+        if self.compressor is None:
+            payloads = [(block, 0) for _, block, _ in batch]
+        else:
+            payloads = self.compressor.compress_all([block for _, block, _ in batch])  # In parallel on the worker pool
+        for (seq, _, final_packet), (payload, flags) in zip(batch, payloads):
+            packet = DataPacket(seq, payload, final_packet, flags)
+            self.outgoing[seq] = packet  # Add the packet to the outgoing dictionary
+            packet.queue(self.batch)  # Sent with the rest of the batch below
+            now = time.monotonic()
+            self.timeouts[seq] = now  # Remember when it was sent
+            self.timer.schedule(seq, now + self.rtt.timeout)  # Arm its retransmission timer
+            if self.trace is not None:
+                self.trace.record(pkttrace.SEND, seq, len(payload))
+            if self.fec is not None:
+                for key, parity in self.fec.add(seq, flags | (FLAG_EOF if final_packet else 0), payload, final_packet):
+                    self.batch.add(key, FLAG_PARITY, parity)
+                    self.metrics.count('parity_packets_sent_total')
+                    if self.trace is not None:
+                        self.trace.record(pkttrace.PARITY, key, len(parity))
+        self.batch.flush(self.socket, self.destination)  # The whole burst in as few system calls as the mode allows
+        # Counted once per batch, to keep the per-packet cost down
+        self.metrics.count('packets_sent_total', len(batch))
+        self.metrics.count('bytes_sent_total', sum(len(payload) for payload, _ in payloads))
+        self.metrics.observe('window_occupancy_packets', self.seq_next - self.seq_base, WINDOW_BUCKETS)
 
-    # Handle timeouts
+    # Handle timeouts; the caller holds the mutex
     def handle_timeouts(self):
-        now = time.time()  # Current time
-        self.mutex.acquire()  # Acquire the mutex
-        for seq, start_time in list(self.timeouts.items()):  # For each sequence number and start time in the timeouts dictionary
-            if now - start_time > self.retry_timeout:  # If the difference is greater than the retry timeout
-                if self.seq_base <= seq < self.seq_next:  # If the sequence number is within the window
-                    self.resends += 1  # Increment the resends counter
-                    self.socket.sendto(self.outgoing[seq], (self.target_host, self.target_port))  # Resend the packet
-                    self.timeouts[seq] = now  # Update the start time in the timeouts dictionary
-        self.mutex.release()  # Release the mutex
+        now = time.monotonic()  # Current time
+        expired = self.timer.pop_expired(now)  # Only the packets whose timer has fired
+        if expired:
+            self.rtt.on_timeout()  # Back off once per expiry, not once per packet
+            self.congestion.on_loss(min(expired), self.seq_next)  # Shrink the window once per window of data
+        for seq in expired:
+            self.resends += 1  # Increment the resends counter
+            self.metrics.count('retransmissions_total', cause='timeout')
+            if self.trace is not None:
+                self.trace.record(pkttrace.RETRANSMIT, seq, pkttrace.CAUSE_TIMEOUT)
+            self.metrics.count('packets_sent_total')
+            self.metrics.count('bytes_sent_total', len(self.outgoing[seq].content))
+            self.outgoing[seq].queue(self.batch)  # Resend the packet
+            self.timeouts[seq] = now  # Update the send time
+            self.retransmitted.add(seq)
+            self.timer.schedule(seq, now + self.rtt.timeout)  # Re-arm its timer
+        if expired:
+            self.batch.flush(self.socket, self.destination)
 
     # Listen for acknowledgements
     def listen_for_ack(self):
         while not self.finished or self.outgoing:  # While transmission is not finished or there are outgoing packets
             ready = select.select([self.socket], [], [], self.retry_timeout)  # Wait for the socket to be ready
             if ready[0]:  # If the socket is ready
-                ack, _ = self.socket.recvfrom(ACK_LENGTH)  # Receive the acknowledgement
-                ack_seq = int.from_bytes(ack, BYTE_ORDERING)  # Convert the acknowledgement to integer
-                self.mutex.acquire()  # Acquire the mutex
-                if self.seq_base <= ack_seq < self.seq_next:  # If the acknowledgement sequence number is within the window
-                    self.acknowledged[ack_seq] = True  # Acknowledge the packet
-                    while self.seq_base in self.acknowledged:  # While the base sequence number is in the acknowledged dictionary
-                        del self.outgoing[self.seq_base]  # Remove the packet from the outgoing dictionary
-                        del self.acknowledged[self.seq_base]  # Remove the acknowledgement from the acknowledged dictionary
-                        if self.seq_base in self.timeouts:  # If the base sequence number is in the timeouts dictionary
-                            del self.timeouts[self.seq_base]  # Remove it
-                        self.seq_base += 1  # Increment the base sequence number
-                self.mutex.release()  # Release the mutex
+                ack, _ = self.socket.recvfrom(HANDSHAKE.size)  # Receive the acknowledgement
+                if is_handshake(ack):
+                    continue  # A late answer to a repeated SYN or journal request
+                with self.wakeup:  # Acquire the mutex
+                    self.metrics.count('acks_received_total')
+                    self.handle_sack(ack)
+
+    # Process one SACK; the caller holds the mutex
+    def handle_sack(self, ack):
+        cumulative, bitmap = self.header.unpack_sack(ack, self.seq_base)  # Absolute cumulative ACK nearest the window base
+        newly_acked = [seq for seq in range(self.seq_base, min(cumulative, self.seq_next - 1) + 1) if seq not in self.acknowledged]
+        newly_acked += [seq for seq in sacked(cumulative, bitmap) if self.seq_base <= seq < self.seq_next and seq not in self.acknowledged]
+        if self.trace is not None:
+            self.trace.record(pkttrace.ACK, cumulative, len(newly_acked))
+        if not newly_acked:
+            return
+        now = time.monotonic()
+        rtt_sample = None
+        acked_bytes = 0
+        for seq in newly_acked:
+            self.acknowledged[seq] = True  # Acknowledge the packet
+            self.timer.cancel(seq)  # Stop its retransmission timer
+            sent_at = self.timeouts.pop(seq, None)
+            if seq in self.retransmitted:
+                self.retransmitted.discard(seq)  # Ambiguous RTT, skip it (Karn's rule)
+            elif sent_at is not None:
+                rtt_sample = now - sent_at  # Round trip of the latest packet this SACK covers
+            acked_bytes += len(self.outgoing[seq].content)
+            if self.trace is not None:
+                self.trace.record(pkttrace.ACKED, seq)
+        self.rtt.on_ack()  # Progress ends any backoff
+        if rtt_sample is not None:
+            self.rtt.sample(rtt_sample)
+            self.metrics.observe('rtt_seconds', rtt_sample)
+        self.metrics.progress(acked_bytes)
+        self.congestion.on_ack(len(newly_acked), rtt_sample)  # Grow the window
+        previous_base = self.seq_base
+        while self.seq_base in self.acknowledged:  # While the base sequence number is in the acknowledged dictionary
+            del self.outgoing[self.seq_base]  # Remove the packet from the outgoing dictionary
+            del self.acknowledged[self.seq_base]  # Remove the acknowledgement from the acknowledged dictionary
+            self.seq_base += 1  # Increment the base sequence number
+        if self.trace is not None and self.seq_base != previous_base:
+            self.trace.record(pkttrace.ADVANCE, self.seq_base, self.congestion.window)
+        # Every hole with enough SACKed packets above it is lost: resend it now rather than at its timeout.
+        # With FEC only packets past its group count, since until its parity arrives the receiver may rebuild it
+        for seq in range(self.seq_base, min(cumulative + 1 + bitmap.bit_length(), self.seq_next)):
+            above = seq if self.fec is None else self.fec.group_end(seq)
+            if seq not in self.acknowledged and seq not in self.retransmitted and \
+                    bin(bitmap >> max(0, above - cumulative - 1)).count('1') >= DUPLICATE_THRESHOLD:
+                self.resends += 1
+                self.metrics.count('retransmissions_total', cause='dup_ack')
+                if self.trace is not None:
+                    self.trace.record(pkttrace.RETRANSMIT, seq, pkttrace.CAUSE_DUP_ACK)
+                self.metrics.count('packets_sent_total')
+                self.metrics.count('bytes_sent_total', len(self.outgoing[seq].content))
+                self.congestion.on_loss(seq, self.seq_next, timeout=False)
+                self.outgoing[seq].queue(self.batch)
+                self.timeouts[seq] = now
+                self.retransmitted.add(seq)
+                self.timer.schedule(seq, now + self.rtt.timeout)
+        self.batch.flush(self.socket, self.destination)  # The fast retransmissions, if any
+        self.wakeup.notify()  # The window may have moved, wake the sending thread
 
     # Finalize the transmission
     def finalize(self):
         self.finished = True  # Set the finished flag to True
-        self.ack_listener.join()  # Wait for the acknowledgement listener thread to finish
+        if self.ack_listener.is_alive():
+            self.ack_listener.join()  # Wait for the acknowledgement listener thread to finish
         self.socket.close()  # Close the socket
+        self.congestion.close()  # Close the cwnd log, if any
+        if self.compressor is not None:
+            self.compressor.close()  # Stop the compression workers
+        self.metrics.finish()  # Export --metrics
+        if self.trace is not None:
+            self.trace.close()  # Flush the rest of the trace
 
 # Main function
 if __name__ == "__main__":
-    if len(sys.argv) != 6:  # If the number of command line arguments is not 6
-        print("Usage: script.py <TargetHost> <TargetPort> <SourceFile> <RetryTimeout(ms)> <MaxWindowSize>")  # Print the usage
+    USAGE = "Usage: script.py <TargetHost> <TargetPort> <SourceFile> <RetryTimeout(ms)> <MaxWindowSize> [--rto=initial|ceiling|fixed] [--cc=reno|delay|none] [--cwnd-log=<file>] [--payload=<bytes>|mtu] [--seq-width=2|4|8] [--resume] [--compress[=level]] [--compress-workers=N] [--fec[=K[:R]]] [--metrics=<file>] [--metrics-format=json|prometheus] [--trace=<file>] [--trace-buffer=<records>] [--batch-io=auto|gso|mmsg|off]"
+    args, options = split_options(sys.argv[1:])  # Separate the optional flags
+    if len(args) != 5:  # If the number of positional arguments is not 5
+        print(USAGE)  # Print the usage
         sys.exit()  # Exit the program
 
     # Parse the command line arguments
-    host, port, file, timeout, window = sys.argv[1], int(sys.argv[2]), sys.argv[3], int(sys.argv[4]), int(sys.argv[5])
-    udp_sender = ReliableUDPSender(host, port, file, timeout, window)  # Create a reliable UDP sender
+    host, port, file, timeout, window = args[0], int(args[1]), args[2], int(args[3]), int(args[4])
+    try:
+        udp_sender = ReliableUDPSender(host, port, file, timeout, window, options)  # Create a reliable UDP sender
+    except ValueError as error:  # e.g. an unsupported --batch-io mode or --seq-width
+        print(error)
+        print(USAGE)
+        sys.exit(1)
     try:
-        udp_sender.transmit()  # Start sending the file
+        total_bytes, duration = udp_sender.transmit()  # Start sending the file
+        print(f' {total_bytes / duration / 1024:.2f} ')  # Print the speed in KB/s
     finally:
         udp_sender.finalize()  # Ensure proper closure
 
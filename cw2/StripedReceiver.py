@@ -0,0 +1,60 @@
+# Emir Ersanli S2221285
+"""
+Striped Selective Repeat receiver, the counterpart of StripedSender.py.
+Worker i listens on <BasePort> + i with the Receiver4 engine and writes its
+range straight to the offset the sender announced in the handshake, so the
+ranges land in one output file without any copying or reassembly pass.
+Like StripedSender.py, worker i exports --metrics to <file>.i.
+
+Usage:
+    python3 StripedReceiver.py <BasePort> <Filename> <WindowSize> <Streams> [Receiver4 options]
+"""
+import multiprocessing
+import os
+import socket
+import sys
+from cliopts import split_options
+from ackpolicy import DelayedAck
+from handshake import ReceiverLimits, FEATURE_COMPRESS, FEATURE_FEC
+from Receiver4 import handle_incoming_data
+from batchio import RECEIVE_MODES, choose
+from metrics import TransferMetrics
+from StripedSender import stream_options
+
+def receive_stripe(port, path, window, options, batch_modes):
+    """Worker: receives one byte range and returns the offset just past it."""
+    metrics = TransferMetrics.from_options(options, 'receiver', 'selective-repeat')  # Exported when the range is in
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('0.0.0.0', port))
+    try:
+        # Each range ends where the next begins, so only the file's real end may cut it
+        return handle_incoming_data(sock, path, window, DelayedAck.from_options(options),
+                                    ReceiverLimits.from_options(options, window, FEATURE_COMPRESS | FEATURE_FEC), truncate=False,
+                                    metrics=metrics, batch_modes=batch_modes)
+    finally:
+        sock.close()
+
+if __name__ == "__main__":
+    args, options = split_options(sys.argv[1:])
+    if len(args) != 4:
+        print(__doc__.split('Usage:')[1])
+        sys.exit(1)
+
+    base_port, output_filename, window, streams = int(args[0]), args[1], int(args[2]), int(args[3])
+    try:
+        batch_modes = choose(options.get('batch_io'), RECEIVE_MODES)  # --batch-io, checked before any worker starts
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
+
+    # Start from an empty file that every worker opens for writing
+    if os.path.exists(output_filename):
+        os.remove(output_filename)
+    open(output_filename, 'wb').close()
+
+    with multiprocessing.Pool(streams) as pool:
+        ends = pool.starmap(receive_stripe, [(base_port + i, output_filename, window, stream_options(options, i), batch_modes)
+                                             for i in range(streams)])
+
+    # The range ending furthest into the file ends with the file itself
+    os.truncate(output_filename, max((end for end in ends if end is not None), default=0))
@@ -0,0 +1,80 @@
+# Emir Ersanli S2221285
+"""
+Striped Selective Repeat sender. The file is split into <Streams> byte
+ranges and every range is sent by its own worker process, to its own port
+(<BasePort> + i), with the Sender4 engine. One Python process saturates
+one core, so throughput scales with the cores on both ends.
+StripedReceiver.py puts the ranges back together.
+
+Usage:
+    python3 StripedSender.py <TargetHost> <BasePort> <SourceFile> <RetryTimeout(ms)> <MaxWindowSize> <Streams> [Sender4 options]
+"""
+import multiprocessing
+import os
+import sys
+import time
+from cliopts import split_options
+from Sender4 import ReliableUDPSender
+from metrics import PROMETHEUS_SUFFIXES
+from batchio import SEND_MODES, choose
+from handshake import check_options
+
+STRIPE_ALIGNMENT = 64 * 1024  # Ranges start on a multiple of this many bytes
+
+def stripe_ranges(size, streams, alignment=STRIPE_ALIGNMENT):
+    """
+    Splits `size` bytes into `streams` (offset, length) ranges of about the
+    same length. Every range starts at a multiple of `alignment`; trailing
+    ranges may be empty when the file is small.
+    """
+    stripe = -(-size // streams)  # Ceiling division
+    stripe = -(-stripe // alignment) * alignment  # Round up to the alignment
+    ranges = []
+    for i in range(streams):
+        offset = min(i * stripe, size)
+        ranges.append((offset, min(stripe, size - offset)))
+    return ranges
+
+def stream_options(options, index):
+    # Every stream logs its congestion window, metrics and trace to its own file
+    if 'metrics' in options and 'metrics_format' not in options and str(options['metrics']).endswith(PROMETHEUS_SUFFIXES):
+        options = dict(options, metrics_format='prometheus')  # The .i suffix would hide the format
+    for name in ('cwnd_log', 'metrics', 'trace'):
+        if name in options:
+            options = dict(options, **{name: f"{options[name]}.{index}"})
+    return options
+
+def send_stripe(host, port, path, timeout, window, options, offset, length):
+    """Worker: sends one byte range and returns (bytes sent, resends)."""
+    sender = ReliableUDPSender(host, port, path, timeout, window, options, offset, length)
+    try:
+        total_bytes, _ = sender.transmit()
+    finally:
+        sender.finalize()
+    return total_bytes, sender.resends
+
+if __name__ == "__main__":
+    args, options = split_options(sys.argv[1:])  # Separate the optional flags
+    if len(args) != 6:
+        print(__doc__.split('Usage:')[1])
+        sys.exit(1)
+
+    host, base_port, file, timeout, window, streams = args[0], int(args[1]), args[2], int(args[3]), int(args[4]), int(args[5])
+    try:
+        choose(options.get('batch_io'), SEND_MODES)  # --batch-io, checked before any worker starts
+        check_options(options)  # --payload and --seq-width
+    except ValueError as error:
+        print(error)
+        print(__doc__.split('Usage:')[1])
+        sys.exit(1)
+    ranges = stripe_ranges(os.path.getsize(file), streams)
+    jobs = [(host, base_port + i, file, timeout, window, stream_options(options, i), offset, length)
+            for i, (offset, length) in enumerate(ranges)]
+
+    start = time.time()
+    with multiprocessing.Pool(streams) as pool:
+        results = pool.starmap(send_stripe, jobs)  # One worker process per range
+    duration = time.time() - start
+
+    total_bytes = sum(sent for sent, _ in results)
+    print(f' {total_bytes / duration / 1024:.2f} ')  # Aggregate speed in KB/s, as Sender4 prints
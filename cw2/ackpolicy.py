@@ -0,0 +1,67 @@
+# Emir Ersanli S2221285
+"""
+Delayed, coalesced acknowledgements for the receivers. Instead of one ACK
+per datagram, an ACK goes out after every `every` in-order packets or once
+`delay` seconds have passed since the first unacknowledged one, whichever
+comes first. Gaps, duplicates and EOF are acknowledged at once, and so are
+the packets right after a gap, while the sender is recovering (Linux calls
+this quick-ACK mode).
+"""
+import time
+
+from cliopts import parse_quantity
+
+DEFAULT_ACK_EVERY = 8  # In-order packets covered by one ACK
+DEFAULT_ACK_DELAY = 0.005  # Seconds an ACK may be held back
+QUICK_ACKS = 16  # In-order packets acknowledged at once after a gap
+MIN_WAIT = 1e-6  # Shortest wait handed to settimeout for an overdue ACK
+
+class DelayedAck:
+    """
+    Decides when a receiver should send its next ACK. The receiver calls
+    on_packet() for every datagram, sends an ACK whenever it returns True or
+    the deadline passes, and then calls sent().
+    """
+
+    def __init__(self, every=DEFAULT_ACK_EVERY, delay=DEFAULT_ACK_DELAY):
+        self.every = max(1, every)  # 1 acknowledges every packet, the original behaviour
+        self.delay = delay
+        self.pending = 0  # Packets received since the last ACK
+        self.deadline = None  # Time by which the pending packets must be acknowledged
+        self.quick = 0  # Packets still to be acknowledged at once after the last gap
+
+    def on_packet(self, urgent=False):
+        """Counts one received packet; returns True if an ACK should be sent now."""
+        self.pending += 1
+        if urgent:
+            self.quick = QUICK_ACKS
+            return True
+        if self.quick > 0:
+            self.quick -= 1
+            return True
+        if self.pending >= self.every:
+            return True
+        if self.deadline is None:
+            self.deadline = time.monotonic() + self.delay
+        return False
+
+    def timeout(self):
+        """Seconds until the held-back ACK is due, or None if nothing is pending."""
+        if self.deadline is None:
+            return None
+        # Never 0: a zero socket timeout would make recvfrom non-blocking instead of timing out
+        return max(MIN_WAIT, self.deadline - time.monotonic())
+
+    def sent(self):
+        self.pending = 0
+        self.deadline = None
+
+    @classmethod
+    def from_options(cls, options, every=DEFAULT_ACK_EVERY):
+        """
+        Builds a policy from the --ack-every and --ack-delay (milliseconds)
+        options; `every` is the receiver's default for --ack-every.
+        """
+        every = parse_quantity(options.get('ack_every', every))
+        delay = float(options.get('ack_delay', DEFAULT_ACK_DELAY * 1000)) / 1000
+        return cls(every, delay)
@@ -0,0 +1,389 @@
+# Emir Ersanli S2221285
+"""
+Event-driven Selective Repeat transport built on asyncio.DatagramProtocol.
+
+Speaks the same wire protocol as Sender4/Receiver4, opening handshake
+included, but runs both ends in a single event loop with no threads or
+locks, so one process can run many transfers at once:
+
+    await send_file(host, port, path, timeout_ms, window)
+    await receive_file(port, path, window)
+
+Both ends count the metrics of metrics.py under the same names as
+Sender4/Receiver4, exported with --metrics=<file> when the transfer ends.
+
+Usage:
+    python3 asyncsr.py send <TargetHost> <TargetPort> <SourceFile> <RetryTimeout(ms)> <WindowSize> [Sender4 options]
+    python3 asyncsr.py receive <Port> <Filename> <WindowSize> [Receiver4 options]
+"""
+import asyncio
+import sys
+import time
+
+from cliopts import split_options
+from filesource import MappedFile
+from filesink import OffsetWriter, CompletionBitmap
+from timers import RetransmitTimer
+from rtt import RttEstimator
+from congestion import make_controller
+from wire import HeaderFormat, FLAG_EOF, FLAG_COMPRESSED, SACK_BITS, sacked
+from ackpolicy import DelayedAck
+from handshake import (SessionParams, ReceiverLimits, HandshakeError, SYN, SYN_ACK, FEATURE_COMPRESS,
+                       HANDSHAKE_ATTEMPTS, check_options, is_handshake, size_buffers)
+from compression import inflate
+from metrics import TransferMetrics, WINDOW_BUCKETS
+
+HEADER = HeaderFormat()  # 4-byte sequence number + 1 byte of flags, until a session agrees on another width
+REPEATED_ACKS_FOR_LAST_PACKET = 5  # Final ACK is repeated in case some are lost
+DUPLICATE_THRESHOLD = 3  # SACKed packets above a hole before it is resent early
+
+class SenderProtocol(asyncio.DatagramProtocol):
+    """
+    Sends one file with Selective Repeat. The SYN is repeated until the
+    receiver answers; the file is then mapped with the agreed payload size.
+    Sequence numbers start at 1 and the last packet carries the EOF flag; it
+    is empty when the file size is a multiple of the payload size, exactly
+    like Sender4.
+    """
+
+    def __init__(self, path, proposal, rtt, congestion, metrics=None):
+        self.path = path  # File to send, mapped once the session is agreed
+        self.proposal = proposal  # SessionParams offered in the SYN
+        self.session = None  # SessionParams agreed with the receiver
+        self.header = HEADER  # Header layout of the agreed sequence width
+        self.source = None  # MappedFile being sent
+        self.syn_attempts = 0  # SYNs sent so far
+        self.syn_sent_at = None  # Time of the first SYN, for an RTT sample
+        self.rtt = rtt  # RttEstimator providing the retransmission timeout
+        self.congestion = congestion  # Controller providing the window
+        self.last_seq = None  # Sequence number of the EOF packet
+        self.seq_base = 1  # Oldest unacknowledged packet
+        self.seq_next = 1  # Next packet to send for the first time
+        self.acknowledged = CompletionBitmap()  # Packets ACKed so far
+        self.timer = RetransmitTimer()  # Retransmission deadlines
+        self.timer_handle = None  # Event loop callback for the earliest deadline
+        self.sent_at = {}  # Last send time of every unacknowledged packet
+        self.retransmitted = set()  # Unacknowledged packets sent more than once (Karn's rule)
+        self.resends = 0  # Number of retransmissions
+        self.metrics = metrics or TransferMetrics('sender', 'selective-repeat')  # Collected, exported by the caller
+        self.transport = None
+        self.loop = asyncio.get_running_loop()
+        self.done = self.loop.create_future()  # Resolved once every packet is ACKed
+
+    def packet(self, seq):
+        # Rebuild the packet from the mapping; nothing is kept per packet in flight
+        flags = FLAG_EOF if seq == self.last_seq else 0
+        return self.header.pack_header(seq, flags) + self.source.payload(seq - 1)
+
+    def payload_length(self, seq):
+        # File bytes in packet seq: the payload size, less for the last packets
+        return max(0, min(self.session.payload_size, self.source.size - (seq - 1) * self.session.payload_size))
+
+    def resend(self, seq, now, cause):
+        self.resends += 1
+        self.metrics.count('retransmissions_total', cause=cause)
+        self.metrics.count('packets_sent_total')
+        self.metrics.count('bytes_sent_total', self.payload_length(seq))
+        self.transport.sendto(self.packet(seq))
+        self.sent_at[seq] = now
+        self.retransmitted.add(seq)
+        self.timer.schedule(seq, now + self.rtt.timeout)
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.send_syn()
+
+    def send_syn(self):
+        # Offer the session parameters, doubling the wait after every unanswered SYN
+        self.timer_handle = None
+        if self.session is not None:
+            return
+        if self.syn_attempts == HANDSHAKE_ATTEMPTS:
+            self.done.set_exception(HandshakeError("no answer from the receiver"))
+            return
+        if self.syn_attempts == 0:
+            self.syn_sent_at = self.loop.time()
+        self.transport.sendto(self.proposal.pack(SYN))
+        self.timer_handle = self.loop.call_later(self.rtt.timeout * 2 ** self.syn_attempts, self.send_syn)
+        self.syn_attempts += 1
+
+    def start(self, session):
+        # The receiver answered: map the file with the agreed payload size and start sending
+        if self.syn_attempts == 1:
+            self.rtt.sample(self.loop.time() - self.syn_sent_at)
+        self.timer_handle.cancel()
+        self.timer_handle = None
+        self.session = session
+        self.header = session.header
+        self.congestion.max_window = min(self.congestion.max_window, session.window)
+        self.source = MappedFile(self.path, session.payload_size)
+        self.last_seq = self.source.size // session.payload_size + 1
+        size_buffers(self.transport.get_extra_info('socket'), session)
+        self.fill_window()
+
+    def fill_window(self):
+        # Send new packets while there is room in the window
+        now = self.loop.time()
+        deadline = now + self.rtt.timeout
+        first = self.seq_next
+        while self.seq_next < self.seq_base + self.congestion.window and self.seq_next <= self.last_seq:
+            self.transport.sendto(self.packet(self.seq_next))
+            self.sent_at[self.seq_next] = now
+            self.timer.schedule(self.seq_next, deadline)
+            self.seq_next += 1
+        if self.seq_next != first:
+            # Counted once per burst, as Sender4 does
+            self.metrics.count('packets_sent_total', self.seq_next - first)
+            self.metrics.count('bytes_sent_total', sum(self.payload_length(seq) for seq in range(first, self.seq_next)))
+            self.metrics.observe('window_occupancy_packets', self.seq_next - self.seq_base, WINDOW_BUCKETS)
+        self.arm_timer()
+
+    def arm_timer(self):
+        # Keep one loop callback no later than the earliest live deadline. A
+        # callback that fires early just finds nothing expired and re-arms,
+        # which is cheaper than rescheduling it on every ACK.
+        deadline = self.timer.next_deadline()
+        if deadline is None or (self.timer_handle is not None and self.timer_handle.when() <= deadline):
+            return
+        if self.timer_handle is not None:
+            self.timer_handle.cancel()
+        self.timer_handle = self.loop.call_at(deadline, self.on_timer)
+
+    def on_timer(self):
+        self.timer_handle = None
+        now = self.loop.time()
+        expired = self.timer.pop_expired(now)
+        if expired:
+            self.rtt.on_timeout()
+            self.congestion.on_loss(min(expired), self.seq_next)
+        for seq in expired:
+            self.resend(seq, now, 'timeout')
+        self.arm_timer()
+
+    def datagram_received(self, data, addr):
+        if is_handshake(data):
+            kind, agreed = SessionParams.unpack(data)
+            if kind == SYN_ACK and agreed.session == self.proposal.session and self.session is None:
+                self.start(agreed)
+            return
+        if self.session is None or len(data) < self.header.sack_length:
+            return
+        self.metrics.count('acks_received_total')
+        cumulative, bitmap = self.header.unpack_sack(data, self.seq_base)
+        newly_acked = [seq for seq in range(self.seq_base, min(cumulative, self.seq_next - 1) + 1) if seq not in self.acknowledged]
+        newly_acked += [seq for seq in sacked(cumulative, bitmap) if self.seq_base <= seq < self.seq_next and seq not in self.acknowledged]
+        if not newly_acked:
+            return  # Nothing new, e.g. a repeated final SACK
+        now = self.loop.time()
+        rtt_sample = None
+        for seq in newly_acked:
+            self.acknowledged.add(seq)
+            self.timer.cancel(seq)
+            sent_at = self.sent_at.pop(seq)
+            if seq in self.retransmitted:
+                self.retransmitted.discard(seq)  # Karn's rule
+            else:
+                rtt_sample = now - sent_at
+        self.rtt.on_ack()
+        if rtt_sample is not None:
+            self.rtt.sample(rtt_sample)
+            self.metrics.observe('rtt_seconds', rtt_sample)
+        self.metrics.progress(sum(self.payload_length(seq) for seq in newly_acked))
+        self.congestion.on_ack(len(newly_acked), rtt_sample)
+        self.seq_base = self.acknowledged.advance(self.seq_base)
+        if self.seq_base > self.last_seq:
+            self.finish()
+            return
+        # Resend holes with enough SACKed packets above them without waiting for their timers
+        for seq in range(self.seq_base, min(cumulative + 1 + bitmap.bit_length(), self.seq_next)):
+            if seq not in self.acknowledged and seq not in self.retransmitted and \
+                    bin(bitmap >> max(0, seq - cumulative - 1)).count('1') >= DUPLICATE_THRESHOLD:
+                self.congestion.on_loss(seq, self.seq_next, timeout=False)
+                self.resend(seq, now, 'dup_ack')
+        self.fill_window()
+
+    def finish(self):
+        if self.timer_handle is not None:
+            self.timer_handle.cancel()
+        if not self.done.done():
+            self.done.set_result(None)
+
+    def close(self):
+        if self.timer_handle is not None:
+            self.timer_handle.cancel()
+        if self.source is not None:
+            self.source.close()
+
+    def error_received(self, exc):
+        pass  # e.g. ICMP port unreachable before the receiver is up; the timers resend
+
+    def connection_lost(self, exc):
+        if not self.done.done():
+            self.done.set_exception(exc or ConnectionError("transport closed"))
+
+class ReceiverProtocol(asyncio.DatagramProtocol):
+    """
+    Receives one file with Selective Repeat, writing each payload straight to
+    its offset and acknowledging with delayed SACKs, like Receiver4. Data is
+    ignored until a SYN has been answered.
+    """
+
+    def __init__(self, path, limits, ack_policy=None, metrics=None):
+        self.limits = limits  # ReceiverLimits for the handshake
+        self.window = limits.window  # Packets accepted ahead of the window start
+        self.session = None  # SessionParams agreed with the sender
+        self.header = HEADER  # Header layout of the agreed sequence width
+        self.ack_policy = ack_policy or DelayedAck()  # When to send the next SACK
+        self.ack_handle = None  # Event loop callback for a held-back SACK
+        self.window_start = 1  # Oldest packet not yet received
+        self.received = CompletionBitmap()  # Packets written so far
+        self.final_seq = None  # Sequence number of the EOF packet once seen
+        self.output = OffsetWriter(path)
+        self.bytes_received = 0
+        self.metrics = metrics or TransferMetrics('receiver', 'selective-repeat')  # Collected, exported by the owner
+        self.transport = None
+        self.peer = None  # Address the SACKs go to
+        self.loop = asyncio.get_running_loop()
+        self.done = self.loop.create_future()  # Resolved once the file is complete
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    @property
+    def complete(self):
+        """True once every packet up to the EOF packet has been written."""
+        return self.final_seq is not None and self.window_start > self.final_seq
+
+    def send_sack(self):
+        if self.ack_handle is not None:
+            self.ack_handle.cancel()
+            self.ack_handle = None
+        self.ack_policy.sent()
+        sack = self.header.pack_sack(self.window_start - 1, self.received.bits_from(self.window_start + 1, SACK_BITS))
+        self.transport.sendto(sack, self.peer)
+        self.metrics.count('acks_sent_total')
+
+    def datagram_received(self, packet, addr):
+        if is_handshake(packet):
+            kind, proposal = SessionParams.unpack(packet)
+            if kind == SYN and self.session is None:
+                self.session = self.limits.answer(proposal)
+                self.header = self.session.header
+                size_buffers(self.transport.get_extra_info('socket'), self.session)
+            if kind == SYN and self.session.session == proposal.session:
+                self.transport.sendto(self.session.pack(SYN_ACK), addr)  # Also answers a repeated SYN
+            return
+        if self.session is None or len(packet) < self.header.header_length:
+            return
+        if self.done.done():
+            if self.complete:
+                self.send_sack()  # The final SACKs were lost and the sender is still resending
+            return
+        self.peer = addr
+        self.metrics.count('packets_received_total')
+        wire_seq, flags = self.header.unpack_header(packet)
+        seq = self.header.unwrap(wire_seq, self.window_start)
+        urgent = True  # Duplicates and packets outside the window are answered at once
+        if not (self.window_start <= seq < self.window_start + self.window) or seq in self.received:
+            self.metrics.count('packets_discarded_total',
+                               reason='duplicate' if seq in self.received or seq < self.window_start else 'outside_window')
+        else:
+            payload = memoryview(packet)[self.header.header_length:]
+            if flags & FLAG_COMPRESSED:
+                payload = inflate(payload, self.session.payload_size)
+                if payload is None:
+                    return  # Corrupt: dropped like a lost packet
+            offset = self.session.offset + (seq - 1) * self.session.payload_size
+            self.output.write_at(offset, payload)
+            self.received.add(seq)
+            self.bytes_received += len(payload)
+            self.metrics.count('bytes_received_total', len(payload))
+            self.metrics.progress(len(payload))
+            if flags & FLAG_EOF:
+                self.final_seq = seq
+                self.output.truncate(offset + len(payload))
+            previous_start = self.window_start
+            self.window_start = self.received.advance(self.window_start)
+            if self.complete:
+                for _ in range(REPEATED_ACKS_FOR_LAST_PACKET):
+                    self.send_sack()
+                self.output.close()
+                self.done.set_result(None)
+                return
+            urgent = seq != previous_start or self.received.bits_from(self.window_start + 1, SACK_BITS) != 0
+        if self.ack_policy.on_packet(urgent):
+            self.send_sack()
+        elif self.ack_handle is None:
+            self.ack_handle = self.loop.call_later(self.ack_policy.timeout(), self.send_sack)
+
+    def connection_lost(self, exc):
+        if self.ack_handle is not None:
+            self.ack_handle.cancel()
+        if not self.done.done():
+            self.output.close()
+            self.done.set_exception(exc or ConnectionError("transport closed"))
+
+async def send_file(host, port, path, timeout_ms, window, options=None):
+    """
+    Sends `path` to a Selective Repeat receiver at (host, port). `timeout_ms`
+    seeds the adaptive timeout as described for RttEstimator.from_options
+    and `window` caps the congestion window chosen by make_controller.
+    --payload and --seq-width in `options` shape the proposal in the SYN;
+    --metrics exports the transfer's metrics when it ends.
+    Returns (bytes sent, retransmissions, seconds taken).
+    """
+    loop = asyncio.get_running_loop()
+    rtt = RttEstimator.from_options(timeout_ms, options or {})
+    congestion = make_controller(window, options or {})
+    proposal = SessionParams.propose(options or {}, window, (host, port))
+    metrics = TransferMetrics.from_options(options or {}, 'sender', 'selective-repeat')
+    start = time.perf_counter()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: SenderProtocol(path, proposal, rtt, congestion, metrics), remote_addr=(host, port))
+    try:
+        await protocol.done
+    finally:
+        transport.close()
+        protocol.close()
+        congestion.close()
+        metrics.finish()
+    return protocol.source.size, protocol.resends, time.perf_counter() - start
+
+async def receive_file(port, path, window, host='0.0.0.0', options=None):
+    """
+    Receives one file on `port` into `path`, accepting at most `window`
+    packets in flight and payloads up to --max-payload bytes; --metrics
+    exports the transfer's metrics when it ends.
+    Returns (bytes received, seconds from the first call until completion,
+    sender's address).
+    """
+    loop = asyncio.get_running_loop()
+    ack_policy = DelayedAck.from_options(options or {})
+    limits = ReceiverLimits.from_options(options or {}, window, FEATURE_COMPRESS)
+    metrics = TransferMetrics.from_options(options or {}, 'receiver', 'selective-repeat')
+    start = time.perf_counter()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: ReceiverProtocol(path, limits, ack_policy, metrics), local_addr=(host, port))
+    try:
+        await protocol.done
+    finally:
+        transport.close()
+        metrics.finish()
+    return protocol.bytes_received, time.perf_counter() - start, protocol.peer
+
+if __name__ == '__main__':
+    args, options = split_options(sys.argv[1:])
+    if len(args) == 6 and args[0] == 'send':
+        try:
+            check_options(options)  # --payload and --seq-width
+        except ValueError as error:
+            print(error)
+            print(__doc__.split('Usage:')[1])
+            sys.exit(1)
+        size, resends, duration = asyncio.run(send_file(args[1], int(args[2]), args[3], int(args[4]), int(args[5]), options))
+        print(f' {size / 1024 / duration:.2f} ')  # Same KB/s report as Sender4
+    elif len(args) == 4 and args[0] == 'receive':
+        asyncio.run(receive_file(int(args[1]), args[2], int(args[3]), options=options))
+    else:
+        print(__doc__.split('Usage:')[1])
+        sys.exit(1)
@@ -0,0 +1,320 @@
+# Emir Ersanli S2221285
+"""
+Batched datagram I/O for the Go-Back-N and Selective Repeat pairs: one
+system call per burst of packets instead of one per packet.
+
+Sending (BatchSender), best first:
+    gso   UDP generic segmentation offload: a run of up to 64 packets of
+          equal size goes out in one sendmsg, gathered from their headers
+          and payloads, and the kernel cuts it into datagrams
+    mmsg  sendmmsg(2) through ctypes: the burst is staged in a
+          preallocated arena and handed over in one call
+    off   one sendmsg per packet (HeaderFormat.send_data)
+
+Receiving (BatchReceiver), a drop-in for wire.ReceiveBuffers:
+    gro   UDP generic receive offload: a run a GSO sender sent arrives in
+          one recvmsg and is cut at the segment size the kernel reports
+    mmsg  recvmmsg(2) through ctypes: every datagram already queued, up to
+          BATCH, in one call
+    off   one recvfrom_into per datagram
+
+--batch-io=auto|gso|mmsg|gro|off picks the mode and the ones below it to
+fall back on; choose() checks it while the options are parsed, before the
+handshake. auto takes the first one that exists here (Linux only;
+elsewhere everything is off), skipping gro, which is used only when asked
+for. If the kernel refuses a mode at run time, e.g. GSO on a device
+without checksum offload, the next mode down takes over and sends the
+same packets again.
+GRO only saves anything when the sender uses GSO and nothing in between
+splits the runs (LinkEmulator.py does), so a receiver's auto starts at mmsg.
+"""
+import ctypes
+import ctypes.util
+import errno
+import select
+import socket
+import struct
+import sys
+
+from wire import ReceiveBuffers, DEFAULT_RECEIVE_BUFFERS
+
+BATCH = 64  # Packets per system call; also the kernel's limit of GSO segments
+MAX_GSO_BYTES = 65507  # Largest UDP payload, which a whole GSO run must fit in
+ARENA_BYTES = 256 * 1024  # Arena size; fewer datagrams per sendmmsg/recvmmsg when they are large
+SOL_UDP = getattr(socket, 'SOL_UDP', 17)
+UDP_SEGMENT = getattr(socket, 'UDP_SEGMENT', 103)  # Linux 4.18
+UDP_GRO = getattr(socket, 'UDP_GRO', 104)  # Linux 5.0
+MSG_WAITFORONE = 0x10000  # recvmmsg: block for the first datagram only
+SEGMENT = struct.Struct('=H')  # UDP_SEGMENT control message
+GRO_SEGMENT = struct.Struct('=i')  # UDP_GRO control message
+SOCKADDR_IN = struct.Struct('=H2s4s8x')  # family, port and address in network order
+SEND_MODES = ('gso', 'mmsg', 'off')
+RECEIVE_MODES = ('gro', 'mmsg', 'off')
+UNSUPPORTED = {errno.EINVAL, errno.EIO, errno.EMSGSIZE, errno.ENOPROTOOPT, errno.EOPNOTSUPP, errno.ENOSYS}  # Fall back on these
+
+class IoVec(ctypes.Structure):
+    _fields_ = [('base', ctypes.c_void_p), ('length', ctypes.c_size_t)]
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [('name', ctypes.c_void_p), ('namelen', ctypes.c_uint32), ('iov', ctypes.POINTER(IoVec)),
+                ('iovlen', ctypes.c_size_t), ('control', ctypes.c_void_p), ('controllen', ctypes.c_size_t),
+                ('flags', ctypes.c_int)]
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [('hdr', MsgHdr), ('len', ctypes.c_uint)]
+
+def load_libc():
+    """The C library if it has sendmmsg and recvmmsg, else None."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)  # Calls release the GIL
+    except OSError:
+        return None
+    if not hasattr(libc, 'sendmmsg') or not hasattr(libc, 'recvmmsg'):
+        return None
+    libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(MMsgHdr), ctypes.c_uint, ctypes.c_int]
+    libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    return libc
+
+LIBC = load_libc()
+
+def available(mode):
+    """True if `mode` can be tried on this platform."""
+    if mode == 'off':
+        return True
+    if not sys.platform.startswith('linux'):
+        return False
+    return LIBC is not None if mode == 'mmsg' else True
+
+def choose(requested, modes):
+    """
+    The modes to try for --batch-io=`requested`, best first, always ending
+    with 'off'. Raises ValueError for a mode `modes` does not have.
+    """
+    if requested in (None, True, 'auto'):
+        return [mode for mode in modes if available(mode) and mode != 'gro']
+    if requested not in modes:
+        raise ValueError(f"unsupported --batch-io mode: {requested}")
+    return [mode for mode in modes[modes.index(requested):] if available(mode)]
+
+def sockaddr(address):
+    """A sockaddr_in for (host, port), as sendmmsg wants it."""
+    host, port = address
+    return ctypes.create_string_buffer(SOCKADDR_IN.pack(socket.AF_INET, struct.pack('!H', port),
+                                                        socket.inet_aton(socket.gethostbyname(host))), SOCKADDR_IN.size)
+
+def wait_writable(sock):
+    select.select([], [sock], [])  # A non-blocking socket whose send buffer is full
+
+class BatchSender:
+    """
+    Collects the packets of a burst with add() and sends them with flush().
+    `packet_size` is the largest datagram the session sends and `modes`
+    what choose() returned for SEND_MODES. Like HeaderFormat.send_data, it
+    must be used from one thread at a time.
+    """
+
+    def __init__(self, header, packet_size, modes):
+        self.header = header
+        self.modes = list(modes)  # Shrinks as modes fail
+        self.mode = self.modes[0]
+        self.pending = []  # (sequence number, flags, payload) of the burst
+        self.syscalls = 0  # Send calls made, for the statistics
+        hl = header.header_length
+        self.headers = bytearray(BATCH * hl)  # Header of every packet of a GSO run
+        self.header_views = [memoryview(self.headers)[i * hl:(i + 1) * hl] for i in range(BATCH)]
+        self.slot = packet_size  # Arena bytes per packet for sendmmsg
+        self.batch = max(1, min(BATCH, ARENA_BYTES // packet_size))  # Packets per sendmmsg
+        self.arena = None  # Allocated on the first sendmmsg
+        self.address = None  # Destination the sockaddr was built for
+        self.name = None
+
+    def add(self, seq, flags, payload):
+        self.pending.append((seq, flags, payload))
+
+    def flush(self, sock, address):
+        """Sends every packet added since the last flush, in order."""
+        packets, self.pending = self.pending, []
+        start = 0
+        while start < len(packets):
+            try:
+                if self.mode == 'gso':
+                    start += self.send_gso(sock, address, packets, start)
+                elif self.mode == 'mmsg':
+                    start += self.send_mmsg(sock, address, packets, start)
+                else:
+                    seq, flags, payload = packets[start]
+                    self.header.send_data(sock, address, seq, flags, payload)
+                    self.syscalls += 1
+                    start += 1
+            except (BlockingIOError, InterruptedError, socket.timeout):
+                wait_writable(sock)  # A socket with a timeout gives up on a full buffer too
+            except OSError as exc:
+                if self.mode == 'off' or exc.errno not in UNSUPPORTED:
+                    raise  # Errors per-packet sends would see too
+                self.downgrade(exc)  # The packets of the failed call go out again with the next mode
+
+    def downgrade(self, exc):
+        self.modes.remove(self.mode)
+        self.mode = self.modes[0]
+        print(f"batched I/O: {exc}, falling back to {self.mode}", file=sys.stderr)
+
+    def send_gso(self, sock, address, packets, start):
+        # One run: packets of the same size, the last of which may be shorter
+        hl = self.header.header_length
+        segment = hl + len(packets[start][2])
+        limit = min(BATCH, MAX_GSO_BYTES // segment, len(packets) - start)
+        buffers = []
+        count = 0
+        while count < limit:
+            seq, flags, payload = packets[start + count]
+            size = hl + len(payload)
+            if size > segment:
+                break  # Starts the next run
+            self.header.data_header.pack_into(self.headers, count * hl, seq & self.header.mask, flags)
+            buffers += (self.header_views[count], payload)
+            count += 1
+            if size < segment:
+                break  # A shorter packet ends the run
+        if count == 1:
+            sock.sendmsg(buffers, (), 0, address)
+        else:
+            sock.sendmsg(buffers, [(SOL_UDP, UDP_SEGMENT, SEGMENT.pack(segment))], 0, address)
+        self.syscalls += 1
+        return count
+
+    def send_mmsg(self, sock, address, packets, start):
+        if self.arena is None:
+            self.arena = (ctypes.c_ubyte * (self.batch * self.slot))()
+            self.view = memoryview(self.arena).cast('B')
+            self.iovecs = (IoVec * self.batch)()
+            self.messages = (MMsgHdr * self.batch)()
+            base = ctypes.addressof(self.arena)
+            for i in range(self.batch):
+                self.iovecs[i].base = base + i * self.slot
+                self.messages[i].hdr.iov = ctypes.pointer(self.iovecs[i])
+                self.messages[i].hdr.iovlen = 1
+        if address != self.address:
+            self.address, self.name = address, sockaddr(address)
+        hl = self.header.header_length
+        count = min(self.batch, len(packets) - start)
+        for i in range(count):
+            seq, flags, payload = packets[start + i]  # Copied: ctypes cannot point into a read-only mapping
+            offset = i * self.slot
+            self.header.data_header.pack_into(self.arena, offset, seq & self.header.mask, flags)
+            self.view[offset + hl:offset + hl + len(payload)] = payload
+            self.iovecs[i].length = hl + len(payload)
+            self.messages[i].hdr.name = ctypes.addressof(self.name)
+            self.messages[i].hdr.namelen = SOCKADDR_IN.size
+        sent = LIBC.sendmmsg(sock.fileno(), self.messages, count, 0)
+        self.syscalls += 1
+        if sent < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, errno.errorcode.get(code, str(code)))
+        return sent
+
+class BatchReceiver:
+    """
+    Receives datagrams in batches and hands them out one per receive()
+    call, with the interface of wire.ReceiveBuffers: batches go into
+    DEFAULT_RECEIVE_BUFFERS arenas in turn, so a view stays valid until at
+    least that many more datagrams have been received. Honours the
+    socket's timeout. `modes` is what choose() returned for RECEIVE_MODES.
+    """
+
+    def __init__(self, sock, size, modes):
+        self.size = size  # Largest datagram expected
+        self.modes = list(modes)
+        self.mode = self.modes[0]
+        self.ready = []  # (view, address) received but not handed out yet
+        self.next = 0  # Index of the next one
+        self.syscalls = 0  # Receive calls made, for the statistics
+        self.addresses = {}  # Raw sockaddr -> (host, port), so each datagram does not build one
+        if self.mode == 'gro':
+            try:
+                sock.setsockopt(SOL_UDP, UDP_GRO, 1)
+            except OSError:
+                self.modes.remove('gro')
+                self.mode = self.modes[0]
+        self.arena = 0  # Arena the next batch goes into
+        if self.mode == 'gro':
+            self.views = [memoryview(bytearray(MAX_GSO_BYTES)) for _ in range(DEFAULT_RECEIVE_BUFFERS)]  # Whole coalesced runs
+            self.control_size = socket.CMSG_SPACE(GRO_SEGMENT.size)
+        elif self.mode == 'mmsg':
+            self.batch = max(1, min(BATCH, ARENA_BYTES // size))
+            self.arenas = [(ctypes.c_ubyte * (self.batch * size))() for _ in range(DEFAULT_RECEIVE_BUFFERS)]
+            self.views = [memoryview(arena).cast('B') for arena in self.arenas]
+            self.names = ctypes.create_string_buffer(self.batch * SOCKADDR_IN.size)
+            self.iovecs = (IoVec * self.batch)()
+            self.messages = (MMsgHdr * self.batch)()
+            names = ctypes.addressof(self.names)
+            for i in range(self.batch):
+                self.iovecs[i].length = size
+                self.messages[i].hdr.iov = ctypes.pointer(self.iovecs[i])
+                self.messages[i].hdr.iovlen = 1
+                self.messages[i].hdr.name = names + i * SOCKADDR_IN.size
+        else:
+            self.buffers = ReceiveBuffers(size)
+
+    def receive(self, sock):
+        """Like sock.recvfrom(size), but returns a memoryview."""
+        if self.next < len(self.ready):
+            self.next += 1
+            return self.ready[self.next - 1]
+        if self.mode == 'off':
+            self.syscalls += 1
+            return self.buffers.receive(sock)
+        index = self.arena
+        self.arena = (index + 1) % DEFAULT_RECEIVE_BUFFERS
+        if self.mode == 'gro':
+            self.receive_gro(sock, self.views[index])
+        else:
+            self.receive_mmsg(sock, index)
+        self.next = 1
+        return self.ready[0]
+
+    def receive_gro(self, sock, view):
+        nbytes, control, _, address = sock.recvmsg_into([view], self.control_size)
+        self.syscalls += 1
+        segment = nbytes  # A single datagram carries no control message
+        for level, kind, data in control:
+            if level == SOL_UDP and kind == UDP_GRO:
+                segment = GRO_SEGMENT.unpack_from(data)[0]
+        self.ready = [(view[start:min(start + segment, nbytes)], address)
+                      for start in range(0, max(nbytes, 1), max(segment, 1))]
+
+    def receive_mmsg(self, sock, index):
+        view = self.views[index]
+        base = ctypes.addressof(self.arenas[index])
+        for i in range(self.batch):
+            self.iovecs[i].base = base + i * self.size
+        timeout = sock.gettimeout()  # None: blocking, 0.0: non-blocking
+        while True:
+            if timeout and not select.select([sock], [], [], timeout)[0]:
+                raise socket.timeout('timed out')
+            for i in range(self.batch):
+                self.messages[i].hdr.namelen = SOCKADDR_IN.size
+            count = LIBC.recvmmsg(sock.fileno(), self.messages, self.batch, MSG_WAITFORONE, None)
+            self.syscalls += 1
+            if count > 0:
+                break
+            code = ctypes.get_errno()
+            if timeout == 0.0 or code not in (errno.EAGAIN, errno.EINTR):
+                raise OSError(code, errno.errorcode.get(code, str(code)))  # BlockingIOError for EAGAIN
+        names = self.names.raw
+        ready = []
+        for i in range(count):
+            raw = names[i * SOCKADDR_IN.size:(i + 1) * SOCKADDR_IN.size]
+            address = self.addresses.get(raw)
+            if address is None:
+                _, port, host = SOCKADDR_IN.unpack(raw)
+                address = self.addresses[raw] = (socket.inet_ntoa(host), struct.unpack('!H', port)[0])
+            ready.append((view[i * self.size:i * self.size + self.messages[i].len], address))
+        self.ready = ready
+
+def make_receiver(sock, size, modes):
+    """A BatchReceiver for the modes choose() returned, or the per-packet ReceiveBuffers when they come to off."""
+    if modes[0] == 'off':
+        return ReceiveBuffers(size)
+    return BatchReceiver(sock, size, modes)
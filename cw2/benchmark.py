@@ -0,0 +1,312 @@
+# Emir Ersanli S2221285
+"""
+End-to-end benchmark of the sender/receiver pairs on loopback.
+
+Every combination of pair, file size, window, timeout and impairment
+profile is run --repeat times. A run starts the receiver, the
+LinkEmulator for impaired profiles, and the sender as separate
+processes. It checks that the received file matches, and records:
+
+    throughput_kib_s  file size in KiB / seconds from sender start to
+                      receiver exit
+    reported_kib_s    the rate the sender printed (KiB/s as well)
+    retransmissions   datagrams the sender sent beyond one per packet
+                      and one SYN, as counted by the emulator (Sender2
+                      reports its own); with --fec this includes parity
+    cpu_sender/cpu_receiver       user + system seconds (os.wait4 rusage)
+    rss_sender_kb/rss_receiver_kb peak resident set size (VmHWM, polled
+                      while the process runs: on Linux the rusage figure
+                      also counts the benchmark process it was forked from)
+
+Results go to --out as JSON. With --baseline, the median of each case is
+compared with the stored one. A throughput drop or a CPU or memory rise
+beyond --tolerance, or a case that used to succeed and now fails, is
+reported as a regression and the exit status is 1. --save-baseline
+writes the medians of this run as a new baseline.
+
+Options (comma-separated lists):
+    --pairs=1,2,3,4  --sizes=64K,1M  --windows=16,64  --timeouts=50
+    --profiles=direct,lossy (see PROFILES; pair 1, which never retransmits,
+                       only runs the LOSSLESS ones)  --repeat=3
+    --sender-opts="..."  --receiver-opts="..."   extra options for every run
+    --run-timeout=<seconds> (default 120)  --tolerance=0.1  --seed=1
+
+Usage:
+    python3 benchmark.py [--out=results.json] [--baseline=baseline.json] [--save-baseline=baseline.json] [options]
+"""
+import hashlib
+import json
+import os
+import platform
+import random
+import shlex
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from cliopts import split_options, parse_quantity
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PAYLOAD = 1024  # Default payload size of every pair
+# pair -> (sender, receiver, sender takes a timeout, sender takes a window, receiver takes a window)
+PAIRS = {
+    1: ('Sender1.py', 'Receiver1.py', False, False, False),
+    2: ('Sender2.py', 'Receiver2.py', True, False, False),
+    3: ('Sender3.py', 'Receiver3.py', True, True, False),
+    4: ('Sender4.py', 'Receiver4.py', True, True, True),
+}
+# profile -> LinkEmulator options, None to connect the pair directly
+PROFILES = {
+    'direct': None,
+    'clean': [],  # Through the emulator without impairments: its own overhead only
+    'lossy': ['--loss=0.02', '--delay=5'],
+    'bursty': ['--burst-loss=0.01,0.3', '--delay=10', '--jitter=2'],
+    'wan': ['--delay=25', '--jitter=5', '--loss=0.005', '--rate=2M'],
+}
+LOSSLESS = ('direct', 'clean')  # Profiles that drop nothing
+UNRELIABLE_PAIRS = (1,)  # No retransmission: a lost packet leaves the receiver waiting until --run-timeout
+DEFAULTS = {'pairs': '1,2,3,4', 'sizes': '64K,1M', 'windows': '16,64', 'timeouts': '50',
+            'profiles': 'direct,lossy', 'repeat': '3', 'run_timeout': '120', 'tolerance': '0.1', 'seed': '1'}
+OTHER_OPTIONS = ('out', 'baseline', 'save_baseline', 'sender_opts', 'receiver_opts')  # Options without a default
+RECEIVER_STARTUP = 0.3  # Seconds for a receiver or emulator to bind before the sender starts
+EMULATOR_IDLE_EXIT = 1.0  # The emulator exits this long after the last datagram and prints its counters
+METRICS = ('throughput_kib_s', 'reported_kib_s', 'retransmissions', 'cpu_sender', 'cpu_receiver',
+           'rss_sender_kb', 'rss_receiver_kb')
+HIGHER_IS_WORSE = ('cpu_sender', 'cpu_receiver', 'rss_sender_kb', 'rss_receiver_kb')  # Compared with the baseline too
+
+def free_port():
+    """A UDP port nothing is bound to right now."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def make_file(directory, size, seed):
+    """Random test data, the same for the same size and seed."""
+    path = os.path.join(directory, f'input-{size}.bin')
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(random.Random(f'{seed}-{size}').randbytes(size))
+    return path
+
+def digest(path):
+    if not os.path.exists(path):
+        return None
+    checksum = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+def spawn(script, args, log):
+    return subprocess.Popen([sys.executable, os.path.join(HERE, script)] + [str(arg) for arg in args],
+                            stdout=log, stderr=subprocess.STDOUT, cwd=HERE)
+
+def peak_rss(pid):
+    """High-water resident set size of a running process in KB, or None."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def reap(processes, deadline):
+    """
+    Waits for every process with os.wait4, killing those still running at
+    `deadline`. Returns {name: (exit status, rusage, exit time, peak RSS in KB)}.
+    """
+    finished = {}
+    peaks = dict.fromkeys(processes, 0)
+    while len(finished) < len(processes):
+        for name, process in processes.items():
+            if name in finished:
+                continue
+            peaks[name] = max(peaks[name], peak_rss(process.pid) or 0)  # Read before the process can be reaped
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                process.returncode = os.waitstatus_to_exitcode(status)  # Keep Popen from waiting again
+                finished[name] = (process.returncode, usage, time.perf_counter(), peaks[name] or usage.ru_maxrss)
+        if time.perf_counter() > deadline:
+            for name, process in processes.items():
+                if name not in finished:
+                    process.kill()
+            deadline = float('inf')  # Killed: the next pass collects them
+        time.sleep(0.005)
+    return finished
+
+def last_numbers(path):
+    """The numbers on the last non-empty line of a log, e.g. a sender's rate line."""
+    with open(path) as f:
+        lines = [line for line in f.read().splitlines() if line.strip()]
+    numbers = []
+    for word in (lines[-1].split() if lines else []):
+        try:
+            numbers.append(float(word))
+        except ValueError:
+            pass
+    return numbers
+
+def emulator_counts(path):
+    """{'fwd': {...}, 'rev': {...}} from the counters LinkEmulator prints on exit."""
+    counts = {}
+    with open(path) as f:
+        for line in f:
+            words = line.split()
+            if words and words[0] in ('fwd', 'rev'):
+                counts[words[0]] = {key: int(value) for key, value in (word.split('=') for word in words[1:])}
+    return counts
+
+def run_case(case, source, scratch, options):
+    """Runs one transfer and returns its result record."""
+    sender, receiver, takes_timeout, takes_window, receiver_window = PAIRS[case['pair']]
+    profile = PROFILES[case['profile']]
+    output = os.path.join(scratch, 'output.bin')
+    if os.path.exists(output):
+        os.remove(output)
+    logs = {name: os.path.join(scratch, f'{name}.log') for name in ('sender', 'receiver', 'emulator')}
+    receiver_port = free_port()
+    sender_port = receiver_port if profile is None else free_port()
+
+    sender_args = ['127.0.0.1', sender_port, source]
+    sender_args += [case['timeout']] if takes_timeout else []
+    sender_args += [case['window']] if takes_window else []
+    sender_args += shlex.split(options.get('sender_opts', ''))
+    receiver_args = [receiver_port, output] + ([case['window']] if receiver_window else [])
+    receiver_args += shlex.split(options.get('receiver_opts', ''))
+
+    processes = {}
+    with open(logs['receiver'], 'w') as receiver_log, open(logs['sender'], 'w') as sender_log, \
+            open(logs['emulator'], 'w') as emulator_log:
+        processes['receiver'] = spawn(receiver, receiver_args, receiver_log)
+        if profile is not None:
+            processes['emulator'] = spawn('LinkEmulator.py', [sender_port, '127.0.0.1', receiver_port] + profile +
+                                          [f'--seed={options["seed"]}', f'--idle-exit={EMULATOR_IDLE_EXIT}'],
+                                          emulator_log)
+        time.sleep(RECEIVER_STARTUP)
+        start = time.perf_counter()
+        processes['sender'] = spawn(sender, sender_args, sender_log)
+        done = reap(processes, start + float(options['run_timeout']))
+
+    size = os.path.getsize(source)
+    ok = all(done[name][0] == 0 for name in ('sender', 'receiver')) and digest(output) == digest(source)
+    elapsed = done['receiver'][2] - start
+    reported = last_numbers(logs['sender'])
+    result = dict(case, ok=ok, elapsed=elapsed,
+                  throughput_kib_s=size / 1024 / elapsed if ok else 0.0,
+                  reported_kib_s=reported[-1] if reported else None,
+                  retransmissions=None,
+                  cpu_sender=done['sender'][1].ru_utime + done['sender'][1].ru_stime,
+                  cpu_receiver=done['receiver'][1].ru_utime + done['receiver'][1].ru_stime,
+                  rss_sender_kb=done['sender'][3],
+                  rss_receiver_kb=done['receiver'][3])
+    if case['pair'] == 2 and len(reported) >= 2:
+        result['retransmissions'] = int(reported[-2])  # Sender2 prints its own count first
+    elif profile is not None:
+        counts = emulator_counts(logs['emulator'])
+        if 'fwd' in counts:
+            packets = -(-size // PAYLOAD)
+            if case['pair'] == 4 and size % PAYLOAD == 0:
+                packets += 1  # Selective Repeat ends a file of whole packets with an empty EOF packet
+            handshake = 0 if case['pair'] == 1 else 1
+            result['retransmissions'] = max(0, counts['fwd']['in'] - packets - handshake)
+    return result
+
+def cases(options):
+    """
+    Every combination of the matrix; windows and timeouts only vary for
+    pairs that take them, and unreliable pairs skip the lossy profiles.
+    """
+    def values(name, convert):
+        return [convert(value) for value in str(options[name]).split(',') if value]
+    for pair in values('pairs', int):
+        _, _, takes_timeout, takes_window, _ = PAIRS[pair]
+        for size in values('sizes', parse_quantity):
+            for window in values('windows', int) if takes_window else [None]:
+                for timeout in values('timeouts', int) if takes_timeout else [None]:
+                    for profile in values('profiles', str):
+                        if pair in UNRELIABLE_PAIRS and profile not in LOSSLESS:
+                            continue  # Certain to fail, after a whole --run-timeout
+                        yield {'pair': pair, 'size': size, 'window': window, 'timeout': timeout, 'profile': profile}
+
+def case_key(record):
+    return f"pair{record['pair']} size={record['size']} window={record['window']} timeout={record['timeout']} profile={record['profile']}"
+
+def summarize(results):
+    """Median of every metric over the repeats of each case, and whether every repeat succeeded."""
+    groups = {}
+    for record in results:
+        groups.setdefault(case_key(record), []).append(record)
+    summary = {}
+    for key, records in groups.items():
+        entry = {'ok': all(record['ok'] for record in records), 'runs': len(records)}
+        for metric in METRICS:
+            values = [record[metric] for record in records if record['ok'] and record[metric] is not None]
+            entry[metric] = statistics.median(values) if values else None
+        summary[key] = entry
+    return summary
+
+def compare(summary, baseline, tolerance):
+    """Returns a list of regression messages against a baseline summary."""
+    regressions = []
+    for key, entry in summary.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        if before['ok'] and not entry['ok']:
+            regressions.append(f'{key}: failed, passed in the baseline')
+            continue
+        old = before.get('throughput_kib_s', before.get('throughput_kbps'))  # Baselines saved before the rename
+        new = entry.get('throughput_kib_s')
+        if old and new is not None and new < old * (1 - tolerance):
+            regressions.append(f'{key}: throughput {new:.0f} KiB/s, baseline {old:.0f} KiB/s')
+        for metric in HIGHER_IS_WORSE:
+            old, new = before.get(metric), entry.get(metric)
+            if old and new is not None and new > old * (1 + tolerance):
+                regressions.append(f'{key}: {metric} {new:.2f}, baseline {old:.2f}')
+    return regressions
+
+def describe():
+    """Where and on what the benchmark ran."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=HERE, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'host': platform.node(), 'python': platform.python_version(),
+            'platform': platform.platform(), 'cpus': os.cpu_count(), 'commit': commit or None}
+
+if __name__ == '__main__':
+    args, options = split_options(sys.argv[1:])
+    unknown = sorted(set(options) - set(DEFAULTS) - set(OTHER_OPTIONS))  # A mistyped --baseline must not skip the comparison
+    if args or unknown:
+        for name in unknown:
+            print(f"unknown option: --{name.replace('_', '-')}")
+        print(__doc__.split('Usage:')[1])
+        sys.exit(1)
+    options = dict(DEFAULTS, **options)
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        for case in cases(options):
+            source = make_file(scratch, case['size'], options['seed'])
+            for repeat in range(int(options['repeat'])):
+                result = run_case(dict(case, repeat=repeat), source, scratch, options)
+                results.append(result)
+                print(f" {case_key(result)} {'ok' if result['ok'] else 'FAILED'} {result['throughput_kib_s']:.2f}", flush=True)
+
+    summary = summarize(results)
+    if 'out' in options:
+        with open(options['out'], 'w') as f:
+            json.dump({'meta': describe(), 'options': options, 'results': results, 'summary': summary}, f, indent=2)
+    if 'save_baseline' in options:
+        with open(options['save_baseline'], 'w') as f:
+            json.dump({'meta': describe(), 'summary': summary}, f, indent=2)
+    if 'baseline' in options:
+        with open(options['baseline']) as f:
+            regressions = compare(summary, json.load(f)['summary'], float(options['tolerance']))
+        for message in regressions:
+            print(f' REGRESSION {message}')
+        sys.exit(1 if regressions else 0)
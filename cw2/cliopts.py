@@ -0,0 +1,36 @@
+# Emir Ersanli S2221285
+"""
+Helpers for the optional --name=value flags accepted by the scripts in this
+directory. Options are peeled off before the usual positional arguments are
+checked, so every script keeps its original command line.
+"""
+
+# Multipliers for the size suffixes accepted by parse_quantity
+SUFFIXES = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+def split_options(argv):
+    """
+    Splits an argument list into positional arguments and a dictionary of
+    options. '--name=value' is stored as a string, a bare '--name' as True.
+    Dashes in option names are turned into underscores.
+    """
+    positional = []
+    options = {}
+    for arg in argv:
+        if arg.startswith('--'):
+            name, separator, value = arg[2:].partition('=')
+            options[name.replace('-', '_')] = value if separator else True
+        else:
+            positional.append(arg)
+    return positional, options
+
+def parse_quantity(text):
+    """
+    Parses a number with an optional K/M/G suffix (powers of 1024),
+    e.g. '64K' -> 65536. Fractions such as '1.5M' are allowed.
+    """
+    text = str(text).strip()
+    multiplier = SUFFIXES.get(text[-1:].lower(), 1)
+    if multiplier != 1:
+        text = text[:-1]
+    return int(float(text) * multiplier)
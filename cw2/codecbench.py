@@ -0,0 +1,170 @@
+# Emir Ersanli S2221285
+"""
+Microbenchmark of the packet codec in wire.py: allocations, memory and
+time per datagram, for the joined packets the pairs used to build and for
+the gathered sends and pooled receives they use now.
+
+    send    joined:   header.pack_header(seq) + payload, then sendto
+            gathered: header.send_data(), sendmsg with header and payload
+    receive joined:   recvfrom(size), then packet[header:] (a copy)
+            pooled:   ReceiveBuffers.receive(), then a view of the payload
+
+Memory is measured with tracemalloc:
+    blocks/packet  memory blocks a path leaves with its caller per packet
+                   (the packet it joined, the payload it handed out),
+                   counted from tracemalloc snapshots taken around a run
+                   in which every packet's result is kept
+    bytes/packet   peak of traced memory during one datagram above what
+                   was allocated before it, temporaries included
+    held           bytes still allocated when the run is over, with
+                   nothing kept: the same on every path, nothing per
+                   packet survives
+Speed is measured separately, without tracemalloc, over the same
+loopback socket pair.
+
+The request was for per-packet allocations to go to zero. They do not.
+The codec itself keeps nothing per packet on the gathered send (0
+blocks, against one joined packet before). On the pooled receive it
+keeps only the payload's memoryview, not a copy of the payload. Both
+stay at a small fixed number of bytes whatever the payload size. What
+remains is made inside CPython's socket calls and cannot be removed from
+Python: sendmsg allocates its iovec and buffer arrays on every call
+(about 190 bytes); every send and receive returns a new int;
+recvfrom_into builds a new address tuple and host string. For 1 KB
+payloads the gathered send is no faster than the joined one, within
+run-to-run noise. The saving is the payload-sized copy, which grows with
+--payload.
+
+Usage:
+    python3 codecbench.py [--packets=20000] [--payload=1024] [--seq-width=4]
+"""
+import socket
+import sys
+import time
+import tracemalloc
+
+from cliopts import split_options, parse_quantity
+from wire import HeaderFormat, ReceiveBuffers, LONG_SEQ_WIDTH
+
+def socket_pair():
+    """A sending and a receiving UDP socket on loopback, and the receiver's address."""
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    return sender, receiver, receiver.getsockname()
+
+# Every path returns what it leaves with its caller, for the block count
+def send_joined(header, sender, address, seq, payload):
+    packet = header.pack_header(seq) + payload
+    sender.sendto(packet, address)
+    return packet
+
+def send_gathered(header, sender, address, seq, payload):
+    header.send_data(sender, address, seq, 0, payload)
+
+def receive_joined(header, receiver, size, buffers):
+    packet, _ = receiver.recvfrom(size)
+    return packet[header.header_length:]
+
+def receive_pooled(header, receiver, size, buffers):
+    packet, _ = buffers.receive(receiver)
+    return packet[header.header_length:]
+
+def traced_blocks():
+    return sum(statistic.count for statistic in tracemalloc.take_snapshot().statistics('filename'))
+
+def measure_send(send, header, packets, payload):
+    """Returns (blocks kept, peak bytes per packet, bytes still held, seconds per packet) of a send path."""
+    sender, receiver, address = socket_pair()
+    view = memoryview(payload)  # As the senders hand out slices of a mapped file
+    receiver.setblocking(False)
+    kept = [None] * packets
+    tracemalloc.start()
+    before = traced_blocks()
+    for seq in range(packets):
+        kept[seq] = send(header, sender, address, seq, view)
+        drain(receiver)
+    blocks = (traced_blocks() - before) / packets
+    tracemalloc.stop()
+    kept = None
+    peak_total = 0
+    tracemalloc.start()
+    held_before = tracemalloc.get_traced_memory()[0]
+    for seq in range(packets):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        send(header, sender, address, seq, view)
+        peak_total += tracemalloc.get_traced_memory()[1] - before
+        drain(receiver)
+    held = tracemalloc.get_traced_memory()[0] - held_before
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for seq in range(packets):
+        send(header, sender, address, seq, view)
+        drain(receiver)
+    elapsed = time.perf_counter() - start
+    sender.close()
+    receiver.close()
+    return blocks, peak_total / packets, held, elapsed / packets
+
+def measure_receive(receive, header, packets, payload):
+    """Returns (blocks kept, peak bytes per packet, bytes still held, seconds per packet) of a receive path."""
+    sender, receiver, address = socket_pair()
+    datagram = header.pack_header(1) + payload
+    size = len(datagram)
+    buffers = ReceiveBuffers(size)  # A kept view may see its buffer reused; only the view object is counted
+    kept = [None] * packets
+    tracemalloc.start()
+    before = traced_blocks()
+    for i in range(packets):
+        sender.sendto(datagram, address)
+        kept[i] = receive(header, receiver, size, buffers)
+    blocks = (traced_blocks() - before) / packets
+    tracemalloc.stop()
+    kept = None
+    peak_total = 0
+    tracemalloc.start()
+    held_before = tracemalloc.get_traced_memory()[0]
+    for _ in range(packets):
+        sender.sendto(datagram, address)
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        receive(header, receiver, size, buffers)  # The payload is dropped at once, as after a write
+        peak_total += tracemalloc.get_traced_memory()[1] - before
+    held = tracemalloc.get_traced_memory()[0] - held_before
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(packets):
+        sender.sendto(datagram, address)
+        receive(header, receiver, size, buffers)
+    elapsed = time.perf_counter() - start
+    sender.close()
+    receiver.close()
+    return blocks, peak_total / packets, held, elapsed / packets
+
+def drain(receiver):
+    # Keep the receiving socket's buffer from filling up during a send benchmark
+    try:
+        while receiver.recv_into(DRAIN_BUFFER):
+            pass
+    except BlockingIOError:
+        pass
+
+DRAIN_BUFFER = bytearray(65536)
+
+if __name__ == '__main__':
+    args, options = split_options(sys.argv[1:])
+    if args:
+        print(__doc__.split('Usage:')[1])
+        sys.exit(1)
+    packets = parse_quantity(options.get('packets', 20000))
+    payload = bytes(parse_quantity(options.get('payload', 1024)))
+    header = HeaderFormat(int(options.get('seq_width', LONG_SEQ_WIDTH)))
+    print(f"{'path':<18}{'blocks/packet':>15}{'bytes/packet':>14}{'held':>8}{'us/packet':>11}")
+    for name, measure, path in (('send joined', measure_send, send_joined),
+                                ('send gathered', measure_send, send_gathered),
+                                ('receive joined', measure_receive, receive_joined),
+                                ('receive pooled', measure_receive, receive_pooled)):
+        blocks, peak, held, seconds = measure(path, header, packets, payload)
+        print(f'{name:<18}{blocks:>15.2f}{peak:>14.1f}{held:>8}{seconds * 1e6:>11.2f}')
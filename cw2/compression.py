@@ -0,0 +1,97 @@
+# Emir Ersanli S2221285
+"""
+Optional payload compression for the Selective Repeat sender.
+
+Blocks are compressed with zlib on a thread pool (zlib releases the GIL, so
+the workers run in parallel). A block that does not shrink by at least
+MIN_SAVING is sent raw. After MISS_LIMIT such blocks in a row the
+compressor stops trying for a while and sends the next blocks raw without
+touching them, doubling the pause each time the data still turns out to be
+incompressible; so incompressible files cost almost no extra CPU.
+Compressed payloads carry FLAG_COMPRESSED and are inflated by the receiver
+before they are written to their offset.
+"""
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from cliopts import parse_quantity
+from wire import FLAG_COMPRESSED
+
+DEFAULT_LEVEL = 6  # zlib's own default trade-off between speed and ratio
+MIN_SAVING = 0.9  # Compressed blocks must be at most this fraction of the raw size
+MIN_BLOCK = 64  # Blocks shorter than this are always sent raw
+MISS_LIMIT = 4  # Incompressible blocks in a row before compression pauses
+INITIAL_SKIP = 16  # Blocks sent raw during the first pause
+MAX_SKIP = 4096  # Longest pause, in blocks
+
+class BlockCompressor:
+    """
+    Compresses batches of payloads, deciding per block whether it is worth it.
+    """
+
+    def __init__(self, level=DEFAULT_LEVEL, workers=None):
+        self.level = level
+        self.pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+        self.misses = 0  # Incompressible blocks in a row
+        self.skip = 0  # Blocks still to send raw without trying
+        self.pause = INITIAL_SKIP  # Length of the next pause
+        self.raw_bytes = 0  # Payload bytes before compression
+        self.sent_bytes = 0  # Payload bytes after compression
+
+    def compress_block(self, block):
+        # Runs on a worker thread; None means the block is better sent raw
+        packed = zlib.compress(block, self.level)
+        return packed if len(packed) <= len(block) * MIN_SAVING else None
+
+    def compress_all(self, blocks):
+        """Returns a (payload, flags) pair for every block, in order."""
+        results = [(block, 0) for block in blocks]
+        attempts = []  # Indexes of the blocks worth trying
+        for index, block in enumerate(blocks):
+            if self.skip > 0:
+                self.skip -= 1
+            elif len(block) >= MIN_BLOCK:
+                attempts.append(index)
+        for index, packed in zip(attempts, self.pool.map(self.compress_block, [blocks[i] for i in attempts])):
+            if packed is not None:
+                results[index] = (packed, FLAG_COMPRESSED)
+                self.misses = 0
+                self.pause = INITIAL_SKIP
+            else:
+                self.misses += 1
+                if self.misses >= MISS_LIMIT:
+                    # Incompressible data: stop trying for a while, longer every time
+                    self.skip, self.pause, self.misses = self.pause, min(2 * self.pause, MAX_SKIP), 0
+        self.raw_bytes += sum(len(block) for block in blocks)
+        self.sent_bytes += sum(len(payload) for payload, _ in results)
+        return results
+
+    def close(self):
+        self.pool.shutdown()
+
+    @classmethod
+    def from_options(cls, options):
+        """
+        Builds a compressor from --compress[=<level>] and --compress-workers,
+        or returns None when compression was not asked for.
+        """
+        if not options.get('compress'):
+            return None
+        level = DEFAULT_LEVEL if options['compress'] is True else int(options['compress'])
+        return cls(level, parse_quantity(options['compress_workers']) if 'compress_workers' in options else None)
+
+def inflate(payload, limit):
+    """
+    Decompresses a payload that must expand to at most `limit` bytes.
+    Returns None for a corrupt or oversized payload, which is then dropped
+    like a lost packet.
+    """
+    inflater = zlib.decompressobj()
+    try:
+        data = inflater.decompress(payload, limit)
+    except zlib.error:
+        return None
+    if inflater.unconsumed_tail or not inflater.eof:
+        return None
+    return data
@@ -0,0 +1,145 @@
+# Emir Ersanli S2221285
+"""
+Congestion control for the windowed senders. A controller turns ACK and
+loss signals into a congestion window (cwnd, in packets); the sender never
+has more than min(cwnd, its maximum window) packets in flight.
+
+Controllers:
+    reno   Slow start and AIMD congestion avoidance, as in TCP Reno
+    delay  Vegas-style: grows while the queueing delay is small and
+           shrinks as it builds, halving on loss like Reno
+    none   Fixed window, the senders' original behaviour
+"""
+import time
+
+INITIAL_WINDOW = 10  # Packets, as in RFC 6928
+MIN_WINDOW = 1  # The window never shrinks below one packet
+VEGAS_ALPHA = 2  # Fewer than this many packets queued: grow
+VEGAS_BETA = 4  # More than this many packets queued: shrink
+
+class FixedWindow:
+    """
+    Controller that keeps the window at its maximum; the base class of the
+    adaptive controllers.
+    """
+
+    name = 'none'
+
+    def __init__(self, max_window, log=None):
+        self.max_window = max_window  # Upper bound set on the command line
+        self.cwnd = float(self.initial_window())  # Congestion window in packets
+        self.ssthresh = float('inf')  # Slow start threshold
+        self.recovery_point = 0  # Losses below this sequence number belong to the last reduction
+        self.log = log  # Open file receiving the cwnd trajectory, or None
+        self.start = time.monotonic()
+        self.logged = None  # Last (window, event) written to the log
+        self.record('start')
+
+    def initial_window(self):
+        return self.max_window
+
+    @property
+    def window(self):
+        """Number of packets the sender may have in flight."""
+        return max(MIN_WINDOW, min(int(self.cwnd), self.max_window))
+
+    def record(self, event):
+        # Log the trajectory, one line per change of the usable window or per loss
+        if self.log is None or (self.window, event) == self.logged:
+            return
+        self.logged = (self.window, event)
+        self.log.write(f"{time.monotonic() - self.start:.6f} {self.cwnd:.2f} {self.ssthresh:.2f} {event}\n")
+
+    def on_ack(self, acked, rtt=None):
+        """`acked` packets were newly acknowledged; `rtt` is a valid RTT sample or None."""
+
+    def on_loss(self, seq, high_seq, timeout=True):
+        """
+        Packet `seq` was lost while `high_seq` was the next sequence number to
+        send. Further losses below `high_seq` count as the same event, so the
+        window is cut at most once per window of data.
+        """
+        if seq < self.recovery_point:
+            return False
+        self.recovery_point = high_seq
+        self.reduce(timeout)
+        self.record('timeout' if timeout else 'loss')
+        return True
+
+    def reduce(self, timeout):
+        pass
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+
+class RenoController(FixedWindow):
+    """
+    Slow start up to ssthresh, then one extra packet per window of ACKs.
+    A timeout restarts slow start from one packet; a loss detected by
+    duplicate ACKs halves the window.
+    """
+
+    name = 'reno'
+
+    def initial_window(self):
+        return min(INITIAL_WINDOW, self.max_window)
+
+    def on_ack(self, acked, rtt=None):
+        if self.cwnd < self.ssthresh:
+            self.cwnd += acked  # Slow start: double every round trip
+        else:
+            self.cwnd += acked / self.cwnd  # Congestion avoidance: one packet per round trip
+        self.cwnd = min(self.cwnd, float(self.max_window))  # Growing past the cap only delays the reaction to loss
+        self.record('ack')
+
+    def reduce(self, timeout):
+        self.ssthresh = max(self.cwnd / 2, 2.0)
+        self.cwnd = float(MIN_WINDOW) if timeout else self.ssthresh
+
+class DelayController(RenoController):
+    """
+    Vegas-style delay-based control. The expected and actual rates are
+    compared through the RTT: cwnd * (1 - base_rtt / rtt) estimates how many
+    packets sit in queues. The window grows while that is below VEGAS_ALPHA
+    and shrinks above VEGAS_BETA, so it settles before the queues overflow.
+    """
+
+    name = 'delay'
+
+    def __init__(self, max_window, log=None):
+        super().__init__(max_window, log)
+        self.base_rtt = None  # Smallest RTT seen, taken as the propagation delay
+
+    def on_ack(self, acked, rtt=None):
+        if rtt is None:
+            super().on_ack(acked, rtt)  # No delay signal, behave like Reno
+            return
+        self.base_rtt = rtt if self.base_rtt is None else min(self.base_rtt, rtt)
+        queued = self.cwnd * (1 - self.base_rtt / rtt)
+        if self.cwnd < self.ssthresh:
+            if queued <= VEGAS_BETA:
+                super().on_ack(acked, rtt)  # Keep slow-starting while the queues stay short
+                return
+            self.ssthresh = self.cwnd  # Leave slow start before the queues overflow
+        if queued < VEGAS_ALPHA:
+            self.cwnd += acked / self.cwnd
+        elif queued > VEGAS_BETA:
+            self.cwnd = max(float(MIN_WINDOW), self.cwnd - acked / self.cwnd)
+        self.cwnd = min(self.cwnd, float(self.max_window))
+        self.record('ack')
+
+CONTROLLERS = {cls.name: cls for cls in (FixedWindow, RenoController, DelayController)}
+
+def make_controller(max_window, options):
+    """
+    Builds the controller named by the --cc option (default reno). With
+    --cwnd-log=<file> the cwnd trajectory is written to that file as lines
+    of '<seconds> <cwnd> <ssthresh> <event>'.
+    """
+    name = options.get('cc', 'reno')
+    if name not in CONTROLLERS:
+        raise ValueError(f"unknown congestion controller: {name}")
+    path = options.get('cwnd_log')
+    log = open(path, 'w') if path else None
+    return CONTROLLERS[name](max_window, log)
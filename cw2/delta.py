@@ -0,0 +1,245 @@
+# Emir Ersanli S2221285
+"""
+Rsync-style delta transfer: only the parts of a file that changed cross
+the network.
+
+    1. The receiver splits its existing copy (the basis) into blocks and
+       sends a signature: a rolling weak checksum (Adler-32) and a strong
+       one (BLAKE2b, 16 bytes) per block.
+    2. The sender slides a block-sized window over the new file. Wherever
+       the weak checksum and then the strong one match a basis block it
+       emits a copy instruction, everything in between is sent literally.
+    3. The receiver rebuilds the new file from its basis and the delta, and
+       checks it against the sender's whole-file hash.
+
+Signature and delta both travel as files over the asyncsr Selective
+Repeat channel: the signature to <SenderPort>, the delta back to
+<SenderPort> + 1 on the receiver's host.
+
+Usage:
+    python3 delta.py send <Port> <SourceFile> <RetryTimeout(ms)> <WindowSize> [asyncsr options]
+    python3 delta.py receive <SenderHost> <SenderPort> <BasisFile> <OutputFile> <RetryTimeout(ms)> <WindowSize> [--block=<bytes>] [asyncsr options]
+"""
+import asyncio
+import hashlib
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+
+from cliopts import split_options, parse_quantity
+from asyncsr import send_file, receive_file
+
+SIGNATURE_MAGIC = b'RSIG'
+DELTA_MAGIC = b'RDLT'
+SIGNATURE_HEADER = struct.Struct('!IQ')  # block size, basis length
+BLOCK_SIGNATURE = struct.Struct('!I16s')  # weak checksum, strong checksum
+DELTA_HEADER = struct.Struct('!QI32s')  # new file length, block size, BLAKE2b-256 of the new file
+COPY = struct.Struct('!cQI')  # b'C', first basis block, number of blocks
+LITERAL = struct.Struct('!cI')  # b'L', length, followed by the bytes
+END = b'E'
+ADLER_MOD = 65521  # Modulus of Adler-32
+MIN_BLOCK = 1024  # Smallest default block size
+MAX_BLOCK = 128 * 1024  # Largest default block size
+MAX_LITERAL = 1024 * 1024  # Literal runs are split into pieces of at most this size
+DELTA_PORT_OFFSET = 1  # The delta goes to the sender's port plus this, on the receiver's host
+
+def default_block_size(size):
+    """About the square root of the file size, as rsync does, within MIN_BLOCK..MAX_BLOCK."""
+    return min(MAX_BLOCK, max(MIN_BLOCK, 1 << max(0, math.isqrt(size).bit_length() - 1)))
+
+def strong_checksum(block):
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+def map_file(path):
+    """Read-only mapping of `path`, or b'' for an empty or missing file."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return b''
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def write_signature(basis_path, signature_path, block_size=None):
+    """Writes the block signature of `basis_path` (which may be missing) to `signature_path`."""
+    basis = map_file(basis_path)
+    length = len(basis)
+    block_size = block_size or default_block_size(length)
+    with open(signature_path, 'wb') as out:
+        out.write(SIGNATURE_MAGIC + SIGNATURE_HEADER.pack(block_size, length))
+        for start in range(0, length, block_size):
+            block = basis[start:start + block_size]  # The last block may be short
+            out.write(BLOCK_SIGNATURE.pack(zlib.adler32(block), strong_checksum(block)))
+
+def read_signature(signature_path):
+    """Returns (block size, basis length, {weak: [(block index, strong)]})."""
+    with open(signature_path, 'rb') as f:
+        data = f.read()
+    if data[:4] != SIGNATURE_MAGIC:
+        raise ValueError(f"{signature_path} is not a signature")
+    block_size, length = SIGNATURE_HEADER.unpack_from(data, 4)
+    table = {}
+    for index, position in enumerate(range(4 + SIGNATURE_HEADER.size, len(data), BLOCK_SIGNATURE.size)):
+        weak, strong = BLOCK_SIGNATURE.unpack_from(data, position)
+        table.setdefault(weak, []).append((index, strong))
+    return block_size, length, table
+
+class DeltaWriter:
+    """Writes delta instructions, merging neighbouring copies into one."""
+
+    def __init__(self, out):
+        self.out = out
+        self.copy = None  # [first block, count] of the pending copy
+        self.literal_bytes = 0  # Bytes sent literally
+        self.copied_blocks = 0  # Blocks taken from the basis
+
+    def add_copy(self, index):
+        self.copied_blocks += 1
+        if self.copy is not None and self.copy[0] + self.copy[1] == index:
+            self.copy[1] += 1
+            return
+        self.flush()
+        self.copy = [index, 1]
+
+    def add_literal(self, data):
+        if not data:
+            return
+        self.flush()
+        for start in range(0, len(data), MAX_LITERAL):
+            piece = data[start:start + MAX_LITERAL]
+            self.out.write(LITERAL.pack(b'L', len(piece)))
+            self.out.write(piece)
+        self.literal_bytes += len(data)
+
+    def flush(self):
+        if self.copy is not None:
+            self.out.write(COPY.pack(b'C', *self.copy))
+            self.copy = None
+
+def write_delta(source_path, signature_path, delta_path):
+    """
+    Compares `source_path` with the basis described by `signature_path` and
+    writes the instructions that turn the basis into the source. Returns
+    (literal bytes, copied blocks).
+    """
+    block_size, basis_length, table = read_signature(signature_path)
+    tail_length = basis_length % block_size  # Length of the basis's short last block, if any
+    source = map_file(source_path)
+    length = len(source)
+    with open(delta_path, 'wb') as out:
+        out.write(DELTA_MAGIC + DELTA_HEADER.pack(length, block_size, hashlib.blake2b(source, digest_size=32).digest()))
+        writer = DeltaWriter(out)
+        literal_start = 0  # Start of the bytes not yet covered by an instruction
+        position = 0  # Start of the window being compared
+        a = b = None  # Adler-32 halves of the window, None when they must be recomputed
+        while table and position < length:  # No basis: everything is literal
+            window = min(block_size, length - position)
+            if window < block_size and window != tail_length:
+                break  # Too short to match any block
+            if a is None:
+                weak = zlib.adler32(source[position:position + window])
+                a, b = weak & 0xFFFF, weak >> 16
+            candidates = table.get((b << 16) | a)
+            if candidates:
+                strong = strong_checksum(source[position:position + window])
+                match = next((index for index, block_strong in candidates if block_strong == strong), None)
+                if match is not None:
+                    writer.add_literal(source[literal_start:position])
+                    writer.add_copy(match)
+                    position += window
+                    literal_start = position
+                    a = None
+                    continue
+            if window < block_size or position + block_size >= length:
+                break  # The tail did not match; the rest is literal
+            # Roll the window one byte forward (zlib's Adler-32 starts a at 1)
+            outgoing, incoming = source[position], source[position + block_size]
+            a = (a - outgoing + incoming) % ADLER_MOD
+            b = (b - block_size * outgoing + a - 1) % ADLER_MOD
+            position += 1
+        writer.add_literal(source[literal_start:length])
+        writer.flush()
+        out.write(END)
+    return writer.literal_bytes, writer.copied_blocks
+
+def apply_delta(basis_path, delta_path, output_path):
+    """
+    Rebuilds the new file at `output_path` from the basis and the delta.
+    The basis may be the output file itself: the result is written next to
+    it and moved into place only once its hash has been checked.
+    """
+    basis = map_file(basis_path)
+    with open(delta_path, 'rb') as f:
+        delta = f.read()
+    if delta[:4] != DELTA_MAGIC:
+        raise ValueError(f"{delta_path} is not a delta")
+    length, block_size, digest = DELTA_HEADER.unpack_from(delta, 4)
+    position = 4 + DELTA_HEADER.size
+    checksum = hashlib.blake2b(digest_size=32)
+    written = 0
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)))
+    with os.fdopen(descriptor, 'wb') as out:
+        while delta[position:position + 1] != END:
+            if delta[position:position + 1] == b'C':
+                _, first, count = COPY.unpack_from(delta, position)
+                position += COPY.size
+                data = basis[first * block_size:(first + count) * block_size]
+            else:
+                _, size = LITERAL.unpack_from(delta, position)
+                position += LITERAL.size
+                data = delta[position:position + size]
+                position += size
+            out.write(data)
+            checksum.update(data)
+            written += len(data)
+    if written != length or checksum.digest() != digest:
+        os.remove(temporary)
+        raise ValueError("rebuilt file does not match the sender's")
+    os.replace(temporary, output_path)
+
+async def serve_delta(port, source_path, timeout_ms, window, options=None):
+    """
+    Sender side: waits for a signature on `port`, then sends the delta to
+    the receiver's host on port + DELTA_PORT_OFFSET. Returns (literal bytes,
+    copied blocks, delta bytes).
+    """
+    with tempfile.TemporaryDirectory() as scratch:
+        signature_path = os.path.join(scratch, 'signature')
+        delta_path = os.path.join(scratch, 'delta')
+        _, _, peer = await receive_file(port, signature_path, window, options=options)
+        literal_bytes, copied_blocks = write_delta(source_path, signature_path, delta_path)
+        await send_file(peer[0], port + DELTA_PORT_OFFSET, delta_path, timeout_ms, window, options)
+        return literal_bytes, copied_blocks, os.path.getsize(delta_path)
+
+async def fetch_delta(host, port, basis_path, output_path, timeout_ms, window, options=None):
+    """
+    Receiver side: sends the signature of `basis_path` to the sender at
+    (host, port), receives the delta and rebuilds `output_path`. Returns
+    the bytes that crossed the network (signature + delta).
+    """
+    options = options or {}
+    block_size = parse_quantity(options['block']) if 'block' in options else None
+    with tempfile.TemporaryDirectory() as scratch:
+        signature_path = os.path.join(scratch, 'signature')
+        delta_path = os.path.join(scratch, 'delta')
+        write_signature(basis_path, signature_path, block_size)
+        # Listen for the delta before the sender can have it ready
+        incoming = asyncio.ensure_future(receive_file(port + DELTA_PORT_OFFSET, delta_path, window, options=options))
+        await send_file(host, port, signature_path, timeout_ms, window, options)
+        await incoming
+        apply_delta(basis_path, delta_path, output_path)
+        return os.path.getsize(signature_path) + os.path.getsize(delta_path)
+
+if __name__ == '__main__':
+    args, options = split_options(sys.argv[1:])
+    if len(args) == 5 and args[0] == 'send':
+        literal_bytes, copied_blocks, delta_bytes = asyncio.run(
+            serve_delta(int(args[1]), args[2], int(args[3]), int(args[4]), options))
+        print(f' {literal_bytes} {copied_blocks} {delta_bytes}')
+    elif len(args) == 7 and args[0] == 'receive':
+        network_bytes = asyncio.run(fetch_delta(args[1], int(args[2]), args[3], args[4], int(args[5]), int(args[6]), options))
+        print(f' {network_bytes}')
+    else:
+        print(__doc__.split('Usage:')[1])
+        sys.exit(1)
@@ -0,0 +1,194 @@
+# Emir Ersanli S2221285
+"""
+Forward error correction with XOR parity, for the Go-Back-N and Selective
+Repeat pairs.
+
+Data packets are taken in groups of K * R consecutive sequence numbers,
+counted from the session's first packet. Inside a group, packet i belongs
+to class i % R, and every class gets one parity packet: the XOR of its K
+payloads (zero-padded to the payload size), of their lengths and of their
+flags. A receiver that is missing exactly one packet of a class rebuilds
+it from the parity and the others, without waiting a round trip for the
+retransmission. With R > 1 the classes are interleaved, so a burst of up
+to R consecutive losses is repaired as well. The overhead is 1/K.
+
+A parity packet has the usual data header, with FLAG_PARITY set and the
+sequence number of the first packet of its class, and carries
+PARITY_HEADER followed by the XORed payloads. Parity is sent once, after
+the last packet of its group, and is never acknowledged or retransmitted.
+
+A class always covers consecutive members (every R-th packet from its
+first). When a resumed sender skips packets the receiver already has, the
+classes so far are flushed at the gap and new ones start at the next
+packet sent, so the parity never covers a skipped packet; the receiver
+looks for the parity of a packet at or below it in its class.
+"""
+import struct
+
+from cliopts import parse_quantity
+
+PARITY_HEADER = struct.Struct('!BBBHB')  # K, R, packets in this class, XOR of lengths, XOR of flags
+DEFAULT_GROUP = 8  # K: data packets per parity packet
+DEFAULT_STRIDE = 1  # R: interleaved classes per group
+MAX_SPAN = 255  # Largest group, K * R packets; also what a receiver keeps before it knows the group size
+
+class ParityEncoder:
+    """
+    Sender side: accumulates the parity of every class and hands out the
+    parity packets' payloads as groups complete.
+    """
+
+    def __init__(self, first_seq, payload_size, group=DEFAULT_GROUP, stride=DEFAULT_STRIDE):
+        if not 1 < group * stride <= MAX_SPAN or group < 2:
+            raise ValueError(f"FEC groups of {group} x {stride} packets are not supported")
+        self.first_seq = first_seq  # Sequence number the groups are counted from
+        self.payload_size = payload_size
+        self.group = group
+        self.stride = stride
+        self.span = group * stride  # Data packets per group
+        self.classes = {}  # First sequence number of a class -> [payload XOR, length XOR, flags XOR, packets]
+        self.open_group = None  # Start of the group being accumulated
+        self.run_start = first_seq  # First packet since the last flush; the classes count from it
+        self.next_seq = first_seq  # Packets below this have been encoded; retransmissions are ignored
+        self.parity_packets = 0  # Parity packets produced
+
+    def group_start(self, seq):
+        return seq - (seq - self.first_seq) % self.span
+
+    def group_end(self, seq):
+        """Last sequence number of the group `seq` belongs to."""
+        return self.group_start(seq) + self.span - 1
+
+    def add(self, seq, flags, payload, final=False):
+        """
+        Encodes the first transmission of packet `seq`. Returns a list of
+        (sequence number, parity payload) ready to go out, after the
+        packet itself.
+        """
+        if seq < self.next_seq:
+            return []  # A retransmission, already encoded
+        ready = []
+        start = self.group_start(seq)
+        if self.open_group is not None and (start != self.open_group or seq != self.next_seq):
+            ready = self.flush()  # Packets were skipped: the classes end at the gap
+        if self.open_group is None:
+            self.run_start = seq  # The group start, unless skipped packets come first
+        self.open_group = start
+        self.next_seq = seq + 1
+        key = self.run_start + (seq - self.run_start) % self.stride
+        parity = self.classes.setdefault(key, [0, 0, 0, 0])
+        parity[0] ^= int.from_bytes(payload, 'little')  # Little-endian, so a short payload is padded at its end
+        parity[1] ^= len(payload)
+        parity[2] ^= flags
+        parity[3] += 1
+        if final or seq == start + self.span - 1:
+            ready += self.flush()
+        return ready
+
+    def flush(self):
+        ready = []
+        for key in sorted(self.classes):
+            payload_xor, length_xor, flags_xor, count = self.classes[key]
+            ready.append((key, PARITY_HEADER.pack(self.group, self.stride, count, length_xor, flags_xor) +
+                          payload_xor.to_bytes(self.payload_size, 'little')))
+        self.classes.clear()
+        self.open_group = None
+        self.parity_packets += len(ready)
+        return ready
+
+    @classmethod
+    def from_options(cls, options, first_seq, payload_size):
+        """
+        Builds an encoder from --fec[=K[:R]], or returns None without it.
+        """
+        value = options.get('fec')
+        if not value:
+            return None
+        if value is True:
+            return cls(first_seq, payload_size)
+        group, _, stride = str(value).partition(':')
+        return cls(first_seq, payload_size, parse_quantity(group), parse_quantity(stride) if stride else DEFAULT_STRIDE)
+
+class ParityDecoder:
+    """
+    Receiver side: keeps the payloads of recent packets and the parity of
+    unfinished classes, and rebuilds a packet once it is the only one of
+    its class missing. The group size is learnt from the first parity.
+    """
+
+    def __init__(self, first_seq, payload_size):
+        self.first_seq = first_seq
+        self.payload_size = payload_size
+        self.group = None  # K and R, once a parity packet has arrived
+        self.stride = None
+        self.span = None
+        self.data = {}  # Sequence number -> (flags, payload) of packets that may still be needed
+        self.parity = {}  # First sequence number of a class -> (packets, length XOR, flags XOR, payload XOR)
+        self.low = first_seq  # Nothing below this is kept
+        self.recovered = 0  # Packets rebuilt
+
+    def group_end(self, seq):
+        """Last sequence number of the group `seq` belongs to; `seq` itself while the group size is unknown."""
+        if self.span is None:
+            return seq
+        return seq - (seq - self.first_seq) % self.span + self.span - 1
+
+    def add_data(self, seq, flags, payload):
+        """Records a newly received packet; returns the packets this makes recoverable."""
+        if seq < self.low:
+            return []
+        self.data[seq] = (flags, bytes(payload))  # A copy: the caller's receive buffer is reused
+        if self.span is None:
+            return []
+        # A class starts at its group's start, or after packets a resumed sender skipped
+        start = seq - (seq - self.first_seq) % self.span
+        for key in range(seq, start - 1, -self.stride):
+            if key in self.parity:
+                return self.recover(key)
+        return []
+
+    def add_parity(self, key, payload):
+        """Records a parity packet; returns the packet it rebuilds, if any."""
+        if key < self.low or len(payload) < PARITY_HEADER.size:
+            return []
+        group, stride, count, length_xor, flags_xor = PARITY_HEADER.unpack_from(payload)
+        if self.span is None:
+            self.group, self.stride, self.span = group, stride, group * stride
+        self.parity[key] = (count, length_xor, flags_xor, int.from_bytes(payload[PARITY_HEADER.size:], 'little'))
+        return self.recover(key)
+
+    def recover(self, key):
+        if key not in self.parity:
+            return []
+        count, length_xor, flags_xor, payload_xor = self.parity[key]
+        members = range(key, key + count * self.stride, self.stride)
+        missing = [seq for seq in members if seq not in self.data]
+        if len(missing) > 1:
+            return []  # Wait for more packets, or for the retransmission
+        del self.parity[key]
+        if not missing:
+            return []  # Nothing was lost
+        for seq in members:
+            if seq in self.data:
+                flags, payload = self.data[seq]
+                payload_xor ^= int.from_bytes(payload, 'little')
+                length_xor ^= len(payload)
+                flags_xor ^= flags
+        if length_xor > self.payload_size:
+            return []  # Inconsistent parity, e.g. with packets the receiver already had from a resume
+        seq = missing[0]
+        payload = payload_xor.to_bytes(self.payload_size, 'little')[:length_xor]
+        self.data[seq] = (flags_xor, payload)
+        self.recovered += 1
+        return [(seq, flags_xor, payload)]
+
+    def forget(self, window_start):
+        """
+        Drops what can no longer help: every packet from `window_start` on
+        belongs to a group that starts at most one span earlier.
+        """
+        low = window_start - (MAX_SPAN if self.span is None else self.span)
+        for seq in range(self.low, low):
+            self.data.pop(seq, None)
+            self.parity.pop(seq, None)
+        self.low = max(self.low, low)
@@ -0,0 +1,175 @@
+# Emir Ersanli S2221285
+"""
+File sinks for the receivers. StreamingWriter takes in-order data and writes
+it to disk in large batches on a background thread, so receiver memory stays
+bounded and disk writes overlap with receiving from the network.
+OffsetWriter and CompletionBitmap serve receivers that accept packets out of
+order: each payload goes straight to its file offset and its arrival is
+recorded as a single bit.
+"""
+import os
+import queue
+import threading
+
+from cliopts import parse_quantity
+
+BLOCK_SIZE = 4096  # Batches are kept a multiple of this so writes stay page aligned
+DEFAULT_BATCH_SIZE = 1024 * 1024  # Bytes handed to the writer thread at a time
+DEFAULT_MEMORY_CAP = 8 * 1024 * 1024  # Upper bound on bytes buffered in memory
+
+class StreamingWriter:
+    """
+    Write-behind sink for data that arrives in order. Data is collected into
+    batches of `batch_size` bytes which a writer thread appends to the file.
+    When `memory_cap` bytes are waiting, write() blocks until the disk catches
+    up instead of letting memory grow.
+    """
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE, memory_cap=DEFAULT_MEMORY_CAP):
+        # Round the batch size up to a whole number of blocks
+        self.batch_size = max(BLOCK_SIZE, -(-batch_size // BLOCK_SIZE) * BLOCK_SIZE)
+        # Full batches that may wait for the writer, leaving room for the one being filled
+        max_pending = max(1, memory_cap // self.batch_size - 1)
+        self.file = open(path, 'wb', buffering=0)  # Unbuffered, batches are already large
+        self.batch = bytearray()  # Batch currently being filled
+        self.pending = queue.Queue(maxsize=max_pending)  # Batches waiting to be written
+        self.error = None  # Exception raised by the writer thread, if any
+        self.bytes_written = 0  # Total bytes accepted so far
+        self.writer = threading.Thread(target=self.write_behind, daemon=True)
+        self.writer.start()
+
+    def write_behind(self):
+        # Writer thread: append batches to the file until the closing sentinel
+        while True:
+            batch = self.pending.get()
+            if batch is None:
+                break
+            if self.error is None:
+                try:
+                    self.file.write(batch)
+                except OSError as exc:
+                    self.error = exc  # Reported to the receiving thread on its next call
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def write(self, data):
+        """Appends data to the file, handing off each full batch to the writer thread."""
+        self.check()
+        self.batch += data
+        self.bytes_written += len(data)
+        if len(self.batch) >= self.batch_size:
+            cut = len(self.batch) - len(self.batch) % self.batch_size
+            if cut == len(self.batch):
+                full, self.batch = self.batch, bytearray()  # Hand over the buffer itself, no copy
+            else:
+                full = self.batch[:cut]
+                del self.batch[:cut]
+            self.pending.put(full)  # Blocks while the memory cap is reached
+
+    def close(self):
+        """Flushes the remaining data, waits for the writer thread and closes the file."""
+        if self.batch:
+            self.pending.put(self.batch)
+            self.batch = bytearray()
+        self.pending.put(None)
+        self.writer.join()
+        self.file.close()
+        self.check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @classmethod
+    def from_options(cls, path, options):
+        """Builds a writer using the --batch and --mem-cap command-line options."""
+        batch_size = parse_quantity(options.get('batch', DEFAULT_BATCH_SIZE))
+        memory_cap = parse_quantity(options.get('mem_cap', DEFAULT_MEMORY_CAP))
+        return cls(path, batch_size, memory_cap)
+
+class OffsetWriter:
+    """
+    Writes payloads at absolute file offsets with os.pwrite on a single
+    descriptor that stays open for the whole transfer.
+    """
+
+    def __init__(self, path):
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+
+    def write_at(self, offset, data):
+        # pwrite may write less than asked, so loop until the payload is on disk
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(self.fd, view, offset)
+            view = view[written:]
+            offset += written
+
+    def truncate(self, size):
+        """Cuts the file to `size` bytes, dropping anything left over from an older file."""
+        os.ftruncate(self.fd, size)
+
+    def sync(self):
+        """Forces the data written so far to disk."""
+        os.fdatasync(self.fd)
+
+    def close(self):
+        os.close(self.fd)
+
+class CompletionBitmap:
+    """
+    One bit per sequence number recording which packets have arrived.
+    Grows on demand, so the total number of packets need not be known.
+    """
+
+    def __init__(self, size=0):
+        self.bits = bytearray((size + 7) // 8)
+
+    def __contains__(self, index):
+        byte = index >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << (index & 7)))
+
+    def add(self, index):
+        """Marks `index` as received. Returns False if it was already marked."""
+        byte, mask = index >> 3, 1 << (index & 7)
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(max(byte + 1, 2 * len(self.bits)) - len(self.bits)))  # Double to keep growth amortised
+        if self.bits[byte] & mask:
+            return False
+        self.bits[byte] |= mask
+        return True
+
+    def add_range(self, first, last):
+        """Marks every index from `first` to `last` inclusive, whole bytes at a time."""
+        while first <= last and first & 7:
+            self.add(first)
+            first += 1
+        while last >= first and (last + 1) & 7:
+            self.add(last)
+            last -= 1
+        if first < last:
+            self.add(last)  # Grows the array to cover the range
+            self.bits[first >> 3:(last + 1) >> 3] = b'\xff' * (((last + 1) >> 3) - (first >> 3))
+
+    def bits_from(self, start, count):
+        """Returns the arrival bits of indexes start .. start + count - 1 as an int, lowest first."""
+        first = start >> 3
+        chunk = self.bits[first:first + (count + 7) // 8 + 1]
+        return (int.from_bytes(chunk, 'little') >> (start & 7)) & ((1 << count) - 1)
+
+    def advance(self, start):
+        """Returns the first index at or after `start` that has not been received."""
+        index = start
+        while index & 7 and index in self:  # Finish the partial byte bit by bit
+            index += 1
+        if index & 7 == 0:
+            byte = index >> 3
+            while byte < len(self.bits) and self.bits[byte] == 0xFF:  # Skip complete bytes
+                byte += 1
+            index = byte << 3
+            while index in self:
+                index += 1
+        return index
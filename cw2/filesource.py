@@ -0,0 +1,53 @@
+# Emir Ersanli S2221285
+"""
+Memory-mapped file source for the senders. Payloads are handed out as
+memoryview slices of the mapping, so nothing is read or copied up front and
+the pages a transfer has already sent can be dropped by the kernel.
+"""
+import mmap
+
+class MappedFile:
+    """
+    Read-only view of a file split into fixed-size payloads, addressed by
+    0-based packet index.
+    """
+
+    def __init__(self, path, payload_size=1024):
+        self.path = path
+        self.payload_size = payload_size  # Bytes of file data per packet
+        self.mapping = None  # The mmap object, None for empty files
+        with open(path, 'rb') as file:
+            file.seek(0, 2)
+            self.size = file.tell()  # File size in bytes
+            if self.size > 0:  # mmap refuses to map an empty file
+                self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mapping is not None:
+            if hasattr(self.mapping, 'madvise'):
+                self.mapping.madvise(mmap.MADV_SEQUENTIAL)  # Ask the kernel for aggressive read-ahead
+            self.view = memoryview(self.mapping)
+        else:
+            self.view = memoryview(b'')
+        # Number of packets needed to carry the whole file
+        self.total_packets = (self.size + payload_size - 1) // payload_size
+
+    def __len__(self):
+        return self.size
+
+    def payload(self, index):
+        """Returns the payload of packet `index` as a zero-copy memoryview."""
+        start = index * self.payload_size
+        return self.view[start:start + self.payload_size]
+
+    def close(self):
+        self.view.release()
+        if self.mapping is not None:
+            try:
+                self.mapping.close()
+            except BufferError:
+                pass  # A payload view is still alive; the mapping goes away with it
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,256 @@
+# Emir Ersanli S2221285
+"""
+Opening handshake for the Go-Back-N and Selective Repeat pairs.
+
+Before any data, the sender proposes the session parameters in a SYN and
+the receiver answers with a SYN-ACK carrying what it accepts:
+
+    payload size     min(proposed, receiver limit); up to MAX_PAYLOAD, less
+                     the parity header if FEATURE_FEC is agreed
+    window           min(proposed, receiver window)
+    sequence width   the proposed width if supported, else LONG_SEQ_WIDTH
+    features         proposed & supported (FEATURE_* bits)
+    offset           as proposed: file offset of the first packet's payload
+
+Both messages use a fixed layout that does not depend on the negotiated
+sequence width: magic, kind, session id, payload size, window, sequence
+width, feature bits, offset. The sender retries its SYN until it gets an answer,
+and a receiver answers a repeated SYN of its current session again, in
+case its SYN-ACK was lost.
+
+With FEATURE_RESUME agreed, the sender then asks for the receiver's
+checkpoint journal (JOURNAL_REQUEST, same layout) and gets back a JOURNAL:
+the same fields followed by the byte ranges the receiver already holds.
+"""
+import random
+import socket
+import struct
+import time
+
+from cliopts import parse_quantity
+from wire import HeaderFormat, SEQ_CODES, LONG_SEQ_WIDTH
+from journal import merge_ranges, pack_ranges, unpack_ranges
+from fec import PARITY_HEADER
+
+MAGIC = b'RUDP'  # Marks handshake datagrams
+SYN = 1  # Sender's proposal
+SYN_ACK = 2  # Receiver's answer
+JOURNAL_REQUEST = 3  # Sender asks for the ranges the receiver already has
+JOURNAL = 4  # Receiver's answer: the handshake fields, then the ranges
+HANDSHAKE = struct.Struct('!4sBIIIBHQ')  # magic, kind, session, payload size, window, seq width, features, offset
+
+DEFAULT_PAYLOAD = 1024  # The original payload size
+MAX_PAYLOAD = 65507 - 9  # Largest UDP payload over IPv4, less the widest data header
+IP_MTU = getattr(socket, 'IP_MTU', 14)  # Linux socket option reporting the path MTU
+IP_UDP_OVERHEAD = 28  # IPv4 + UDP header bytes
+HANDSHAKE_ATTEMPTS = 10  # SYNs sent before giving up
+MAX_SOCKET_BUFFER = 16 * 1024 * 1024  # Cap on the socket buffers sized for a window
+MAX_DATAGRAM = 65535  # Receive buffer for control messages of unknown length
+
+FEATURE_RESUME = 0x01  # Skip the byte ranges in the receiver's journal
+FEATURE_COMPRESS = 0x02  # Payloads may be zlib-compressed (FLAG_COMPRESSED)
+FEATURE_FEC = 0x04  # Parity packets follow each group of data packets (FLAG_PARITY)
+
+class HandshakeError(Exception):
+    """Raised when no receiver answers the SYN."""
+
+class SessionParams:
+    """
+    Parameters of one transfer, as proposed by a sender or agreed with a receiver.
+    """
+
+    def __init__(self, payload_size, window, seq_width=LONG_SEQ_WIDTH, features=0, session=None, offset=0):
+        self.payload_size = payload_size  # Bytes of file data per packet
+        self.window = window  # Packets in flight at most
+        self.seq_width = seq_width  # Bytes of sequence number in the data header
+        self.features = features  # FEATURE_* bits in use
+        self.session = random.getrandbits(32) if session is None else session  # Identifies the transfer
+        self.offset = offset  # Where packet 1's payload goes in the receiver's file
+        self.header = HeaderFormat(seq_width)  # Header layout for this session
+
+    def pack(self, kind):
+        return HANDSHAKE.pack(MAGIC, kind, self.session, self.payload_size, self.window, self.seq_width,
+                              self.features, self.offset)
+
+    @classmethod
+    def unpack(cls, packet):
+        """Returns (kind, SessionParams) for a handshake datagram."""
+        _, kind, session, payload_size, window, seq_width, features, offset = HANDSHAKE.unpack(packet)
+        seq_width = seq_width if seq_width in SEQ_CODES else LONG_SEQ_WIDTH
+        return kind, cls(payload_size, window, seq_width, features, session, offset)
+
+    @classmethod
+    def propose(cls, options, window, destination, features=0, seq_width=LONG_SEQ_WIDTH, offset=0):
+        """
+        Builds a sender's proposal from its window and the --payload and
+        --seq-width options, `seq_width` being the sender's default width.
+        --payload=mtu fills one datagram of the path MTU. `offset` places a
+        byte range that does not start at the beginning of the file.
+        """
+        check_options(options)
+        seq_width = int(options.get('seq_width', seq_width))
+        payload = options.get('payload', DEFAULT_PAYLOAD)
+        if payload == 'mtu':
+            payload = path_mtu(destination) - IP_UDP_OVERHEAD - HeaderFormat(seq_width).header_length
+        payload = min(max(1, parse_quantity(payload)), MAX_PAYLOAD)
+        return cls(payload, window, seq_width, features, offset=offset)
+
+def check_options(options):
+    """
+    Checks --seq-width and --payload, raising ValueError with a one-line
+    reason; senders call it before setting anything up.
+    """
+    width = options.get('seq_width')
+    if width is not None and str(width) not in [str(code) for code in SEQ_CODES]:
+        raise ValueError(f"--seq-width must be 2, 4 or 8, not {width}")
+    payload = options.get('payload')
+    if payload is not None and payload != 'mtu':
+        try:
+            parse_quantity(payload)
+        except ValueError:
+            raise ValueError(f"--payload must be a byte count or mtu, not {payload}") from None
+
+def is_handshake(packet):
+    """True if a datagram is a SYN, SYN-ACK or journal request rather than data."""
+    return len(packet) == HANDSHAKE.size and packet[:4] == MAGIC
+
+def is_journal(packet):
+    """True if a datagram is a JOURNAL; only a sender expects one, never a data packet."""
+    return len(packet) > HANDSHAKE.size and packet[:4] == MAGIC and packet[4] == JOURNAL
+
+def path_mtu(destination):
+    """Path MTU towards `destination` as known to the kernel, 1500 if it cannot tell."""
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        probe.connect(destination)
+        return probe.getsockopt(socket.IPPROTO_IP, IP_MTU)
+    except OSError:
+        return 1500
+    finally:
+        probe.close()
+
+def size_buffers(sock, params):
+    """Grows the socket buffers to hold a full window of datagrams."""
+    wanted = min(params.window * (params.payload_size + params.header.header_length) * 2, MAX_SOCKET_BUFFER)
+    for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+        if sock.getsockopt(socket.SOL_SOCKET, option) < wanted:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, option, wanted)
+            except OSError:
+                pass  # Keep the system default
+
+class ReceiverLimits:
+    """
+    What a receiver is prepared to accept; window None means no limit.
+    """
+
+    def __init__(self, window=None, max_payload=MAX_PAYLOAD, features=0):
+        self.window = window
+        self.max_payload = min(max_payload, MAX_PAYLOAD)
+        self.features = features  # FEATURE_* bits this receiver supports
+
+    def answer(self, proposal):
+        """Returns the agreed SessionParams for a sender's proposal."""
+        window = proposal.window if self.window is None else min(proposal.window, self.window)
+        window = min(window, proposal.header.modulus // 2 - 1)  # Keep sequence numbers unambiguous
+        features = proposal.features & self.features
+        payload_size = min(proposal.payload_size, self.max_payload)
+        if features & FEATURE_FEC:
+            payload_size = min(payload_size, MAX_PAYLOAD - PARITY_HEADER.size)  # Parity packets must fit in a datagram too
+        return SessionParams(payload_size, max(1, window), proposal.seq_width, features, proposal.session,
+                             proposal.offset)
+
+    @classmethod
+    def from_options(cls, options, window=None, features=0):
+        """Builds the limits from the receiver's window and its --max-payload option."""
+        return cls(window, parse_quantity(options.get('max_payload', MAX_PAYLOAD)), features)
+
+def exchange(sock, destination, request, is_answer, timeout):
+    """
+    Sends `request` until a datagram for which is_answer() holds comes back,
+    waiting `timeout` seconds for the first answer and doubling the wait
+    after every retry. Returns (answer, True if the first request was answered).
+    """
+    previous_timeout = sock.gettimeout()
+    try:
+        for attempt in range(HANDSHAKE_ATTEMPTS):
+            sock.sendto(request, destination)
+            deadline = time.monotonic() + timeout * (2 ** attempt)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                sock.settimeout(remaining)
+                try:
+                    packet, _ = sock.recvfrom(MAX_DATAGRAM)
+                except socket.timeout:
+                    break
+                if is_answer(packet):
+                    return packet, attempt == 0
+                # Anything else is a stray ACK or a late answer to an earlier request
+        raise HandshakeError(f"no answer from {destination[0]}:{destination[1]}")
+    finally:
+        sock.settimeout(previous_timeout)
+
+def connect(sock, destination, proposal, timeout, rtt=None):
+    """
+    Sends SYNs to `destination` until a SYN-ACK for this session arrives and
+    returns the agreed SessionParams. The SYN round trip is fed to `rtt` (an
+    RttEstimator) when the first SYN was answered.
+    """
+    def is_syn_ack(packet):
+        if not is_handshake(packet):
+            return False
+        kind, agreed = SessionParams.unpack(packet)
+        return kind == SYN_ACK and agreed.session == proposal.session
+
+    sent_at = time.monotonic()
+    packet, first = exchange(sock, destination, proposal.pack(SYN), is_syn_ack, timeout)
+    if rtt is not None and first:
+        rtt.sample(time.monotonic() - sent_at)
+    agreed = SessionParams.unpack(packet)[1]
+    size_buffers(sock, agreed)
+    return agreed
+
+def fetch_journal(sock, destination, agreed, timeout):
+    """Asks the receiver which byte ranges it already has; returns them merged."""
+    def is_reply(packet):
+        return is_journal(packet) and SessionParams.unpack(packet[:HANDSHAKE.size])[1].session == agreed.session
+
+    packet, _ = exchange(sock, destination, agreed.pack(JOURNAL_REQUEST), is_reply, timeout)
+    return merge_ranges(unpack_ranges(packet[HANDSHAKE.size:]))
+
+def accept(sock, limits):
+    """
+    Waits for a SYN, answers it with a SYN-ACK and returns the agreed
+    SessionParams together with the sender's address. Anything else
+    arriving first, such as data from an earlier transfer, is ignored.
+    """
+    sock.settimeout(None)
+    while True:
+        packet, address = sock.recvfrom(HANDSHAKE.size)
+        if not is_handshake(packet):
+            continue
+        kind, proposal = SessionParams.unpack(packet)
+        if kind == SYN:
+            agreed = limits.answer(proposal)
+            sock.sendto(agreed.pack(SYN_ACK), address)
+            size_buffers(sock, agreed)
+            return agreed, address
+
+def answer_again(sock, packet, address, agreed, ranges=()):
+    """
+    Re-sends the SYN-ACK when `packet` repeats the SYN of the current
+    session, and answers a journal request with `ranges`. Returns True if
+    the packet was a handshake and has been dealt with.
+    """
+    if not is_handshake(packet):
+        return False
+    kind, proposal = SessionParams.unpack(packet)
+    if proposal.session != agreed.session:
+        return True
+    if kind == SYN:
+        sock.sendto(agreed.pack(SYN_ACK), address)
+    elif kind == JOURNAL_REQUEST:
+        sock.sendto(agreed.pack(JOURNAL) + pack_ranges(list(ranges)), address)
+    return True
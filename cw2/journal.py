@@ -0,0 +1,95 @@
+# Emir Ersanli S2221285
+"""
+Checkpoint journal for resumable transfers. The receiver records which byte
+ranges of a partial file are already on disk, in a small file next to it
+(<output>.journal). A restarted transfer sends the ranges to the sender,
+and both sides skip every packet the ranges cover.
+
+A journal holds sorted, non-overlapping (start, end) byte ranges, end
+exclusive. On disk and on the wire they are a count followed by pairs of
+64-bit offsets; the file version starts with MAGIC.
+"""
+import bisect
+import os
+import struct
+
+MAGIC = b'RJNL'  # Marks a journal file
+COUNT = struct.Struct('!I')  # Number of ranges
+RANGE = struct.Struct('!QQ')  # start, end
+MAX_RANGES = 2048  # Ranges sent in one datagram (32 KB); any beyond are simply resent
+
+def merge_ranges(ranges):
+    """Sorts ranges and joins the ones that overlap or touch."""
+    merged = []
+    for start, end in sorted(ranges):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def covered_run(ranges, start, payload_size, end):
+    """
+    Number of whole packets of `payload_size` bytes from `start` onwards,
+    none reaching past `end`, that lie inside `ranges`.
+    """
+    index = bisect.bisect_right(ranges, (start, float('inf'))) - 1
+    if index < 0 or ranges[index][1] <= start:
+        return 0
+    return max(0, (min(ranges[index][1], end) - start) // payload_size)
+
+def covered_packets(ranges, offset, payload_size):
+    """
+    Yields (first, last) runs of sequence numbers whose whole payload lies
+    inside `ranges`, for packets numbered from 1 at `offset`. A packet that
+    is only partly covered, like the short final one, is not included.
+    """
+    for start, end in ranges:
+        first = max(1, -(-(start - offset) // payload_size) + 1)
+        last = (end - offset) // payload_size
+        if first <= last:
+            yield first, last
+
+def pack_ranges(ranges):
+    ranges = ranges[:MAX_RANGES]
+    return COUNT.pack(len(ranges)) + b''.join(RANGE.pack(start, end) for start, end in ranges)
+
+def unpack_ranges(data):
+    count = COUNT.unpack_from(data)[0]
+    return [RANGE.unpack_from(data, COUNT.size + i * RANGE.size) for i in range(count)]
+
+class RangeJournal:
+    """
+    The journal file of one output file. save() replaces it atomically, so a
+    crash leaves either the old or the new version.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.ranges = self.load()  # Ranges recorded by an earlier, interrupted transfer
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        if data[:len(MAGIC)] != MAGIC:
+            return []  # Not a journal: trust nothing
+        return merge_ranges(unpack_ranges(data[len(MAGIC):]))[:MAX_RANGES]
+
+    def save(self, ranges):
+        """Records `ranges`; the data they describe must already be on disk."""
+        temporary = self.path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(MAGIC + pack_ranges(merge_ranges(ranges)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+
+    def remove(self):
+        """The transfer completed: the journal is no longer needed."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,189 @@
+# Emir Ersanli S2221285
+"""
+Transfer metrics for the senders and receivers: counters, histograms and a
+goodput timeline, exported with --metrics=<file> when the transfer ends
+and whenever the process receives SIGUSR1. The format follows the file
+name (.prom or .txt: Prometheus text exposition, anything else: JSON)
+unless --metrics-format=json|prometheus says otherwise. The file is
+replaced atomically, so a scraper never reads half an export.
+
+Counters may carry labels, e.g. retransmissions by cause:
+
+    metrics.count('retransmissions_total', cause='timeout')
+
+The pairs share these names: packets_sent_total and bytes_sent_total
+(payload bytes, retransmissions included), retransmissions_total{cause},
+acks_received_total, parity_packets_sent_total, rtt_seconds and
+window_occupancy_packets on the sender; packets_received_total,
+bytes_received_total (payload bytes delivered), packets_discarded_total
+{reason}, fec_recovered_total, parity_packets_received_total and
+acks_sent_total on the receiver. The goodput timeline counts bytes
+acknowledged on the sender and delivered on the receiver.
+
+Nothing is written without --metrics; the usual printed rate lines stay
+as they are.
+"""
+import bisect
+import json
+import os
+import signal
+import threading
+import time
+
+PREFIX = 'rudp_'  # Prefix of every Prometheus metric name
+RTT_BUCKETS = tuple(0.0001 * 2 ** i for i in range(18))  # 100 us .. 13 s
+WINDOW_BUCKETS = tuple(2 ** i for i in range(17))  # 1 .. 65536 packets
+GOODPUT_INTERVAL = 1.0  # Seconds per goodput sample
+PROMETHEUS_SUFFIXES = ('.prom', '.txt')
+
+class Histogram:
+    """
+    Histogram with fixed upper bounds. Each bucket counts only the values
+    above the previous bound, in memory and in the JSON export; the
+    Prometheus export accumulates them into the cumulative le buckets.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # The last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile, None when empty."""
+        if self.count == 0:
+            return None
+        target, seen = q * self.count, 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        return {'buckets': dict(zip([str(bound) for bound in self.bounds] + ['+Inf'], self.counts)),
+                'sum': self.sum, 'count': self.count,
+                'p50': self.quantile(0.5), 'p99': self.quantile(0.99)}
+
+class TransferMetrics:
+    """
+    Metrics of one transfer. `role` is 'sender' or 'receiver' and
+    `protocol` names the pair, e.g. 'sr'; both become labels.
+    """
+
+    def __init__(self, role, protocol, path=None, fmt=None):
+        self.labels = {'role': role, 'protocol': protocol}
+        self.path = path  # Export file, None to collect without exporting
+        self.format = fmt or ('prometheus' if path and path.endswith(PROMETHEUS_SUFFIXES) else 'json')
+        self.counters = {}  # name, or (name, sorted label items) for a labelled counter -> value
+        self.histograms = {}  # name -> Histogram
+        self.start = time.monotonic()
+        self.end = None  # Set by finish()
+        self.goodput = []  # Bytes delivered or acknowledged in each GOODPUT_INTERVAL
+        self.interval_end = self.start  # When the last goodput sample closes
+
+    def count(self, name, amount=1, **labels):
+        # Called per packet: unlabelled counters are keyed by their bare name, no tuple to build
+        key = (name, tuple(sorted(labels.items()))) if labels else name
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, bounds=RTT_BUCKETS):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(bounds)
+        histogram.observe(value)
+
+    def progress(self, nbytes):
+        """Records `nbytes` of goodput: data written in order, or acknowledged."""
+        now = time.monotonic()
+        if now >= self.interval_end:
+            index = int((now - self.start) / GOODPUT_INTERVAL)
+            self.goodput.extend([0] * (index + 1 - len(self.goodput)))
+            self.interval_end = self.start + (index + 1) * GOODPUT_INTERVAL
+        self.goodput[-1] += nbytes
+
+    def total(self, name):
+        """Sum of a counter over all its labels."""
+        return sum(value for key, value in list(self.counters.items()) if (key if isinstance(key, str) else key[0]) == name)
+
+    def duration(self):
+        return (self.end if self.end is not None else time.monotonic()) - self.start
+
+    def snapshot(self):
+        duration = self.duration()
+        counters = {}
+        for key, value in list(self.counters.items()):  # Another thread may be counting
+            name, labels = (key, ()) if isinstance(key, str) else key
+            counters.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        return {'labels': self.labels, 'finished': self.end is not None, 'duration_seconds': duration,
+                'counters': counters,
+                'histograms': {name: histogram.snapshot() for name, histogram in list(self.histograms.items())},
+                'goodput_bytes_per_second': [nbytes / GOODPUT_INTERVAL for nbytes in self.goodput],
+                'ack_rate_per_second': (self.total('acks_sent_total') + self.total('acks_received_total')) / duration
+                if duration > 0 else 0.0}
+
+    def prometheus(self):
+        """The snapshot in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        def labels(extra=()):
+            items = list(self.labels.items()) + list(extra)
+            return '{' + ','.join(f'{key}="{value}"' for key, value in items) + '}'
+        lines = []
+        for name, series in sorted(snapshot['counters'].items()):
+            lines.append(f'# TYPE {PREFIX}{name} counter')
+            lines += [f'{PREFIX}{name}{labels(entry["labels"].items())} {entry["value"]}' for entry in series]
+        for name, histogram in sorted(snapshot['histograms'].items()):
+            lines.append(f'# TYPE {PREFIX}{name} histogram')
+            cumulative = 0
+            for bound, count in histogram['buckets'].items():
+                cumulative += count
+                lines.append(f'{PREFIX}{name}_bucket{labels([("le", bound)])} {cumulative}')
+            lines.append(f'{PREFIX}{name}_sum{labels()} {histogram["sum"]}')
+            lines.append(f'{PREFIX}{name}_count{labels()} {histogram["count"]}')
+        goodput = snapshot['goodput_bytes_per_second']
+        gauges = {'duration_seconds': snapshot['duration_seconds'],
+                  'ack_rate_per_second': snapshot['ack_rate_per_second'],
+                  'goodput_bytes_per_second': goodput[-1] if goodput else 0.0,
+                  'goodput_peak_bytes_per_second': max(goodput, default=0.0)}
+        for name, value in gauges.items():
+            lines.append(f'# TYPE {PREFIX}{name} gauge')
+            lines.append(f'{PREFIX}{name}{labels()} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self):
+        """Writes the current snapshot to the metrics file, if there is one."""
+        if self.path is None:
+            return
+        text = self.prometheus() if self.format == 'prometheus' else json.dumps(self.snapshot(), indent=2) + '\n'
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as f:
+            f.write(text)
+        os.replace(temporary, self.path)
+
+    def finish(self):
+        """The transfer is over: freeze the duration and export."""
+        if self.end is None:
+            self.end = time.monotonic()
+        self.export()
+
+    @classmethod
+    def from_options(cls, options, role, protocol):
+        """
+        Builds the metrics of a transfer from --metrics and --metrics-format,
+        and exports on SIGUSR1 while the transfer runs.
+        """
+        path = options.get('metrics')
+        fmt = options.get('metrics_format')
+        if fmt not in (None, 'json', 'prometheus'):
+            raise ValueError(f"unknown metrics format: {fmt}")
+        metrics = cls(role, protocol, path if isinstance(path, str) else None, fmt)
+        # Only the main thread may install a handler; transfers run elsewhere export at the end only
+        if metrics.path is not None and hasattr(signal, 'SIGUSR1') and \
+                threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, lambda signum, frame: metrics.export())
+        return metrics
@@ -0,0 +1,105 @@
+# Emir Ersanli S2221285
+"""
+Token-bucket pacing for the senders. Replaces forking a 'sleep' process per
+datagram with an in-process wait on the monotonic clock.
+"""
+import time
+
+from cliopts import parse_quantity
+
+# Below this many seconds the remaining wait is spun instead of slept, since
+# time.sleep() can overshoot by a few hundred microseconds
+SPIN_THRESHOLD = 0.0005
+
+def parse_rate(text):
+    """
+    Parses a rate given on the command line and returns (rate, per_packet).
+    '800pps' or '800p' is 800 packets per second, anything else is bytes per
+    second with an optional K/M/G suffix, e.g. '2M' -> 2 MiB/s.
+    """
+    text = text.strip().lower()
+    for unit in ('pps', 'p'):
+        if text.endswith(unit):
+            return float(text[:-len(unit)]), True
+    return float(parse_quantity(text.rstrip('b'))), False
+
+def sleep_until(deadline):
+    """Waits until time.monotonic() reaches deadline with sub-millisecond accuracy."""
+    remaining = deadline - time.monotonic()
+    if remaining > SPIN_THRESHOLD:
+        time.sleep(remaining - SPIN_THRESHOLD)  # Coarse wait, leaving a margin for oversleeping
+    while time.monotonic() < deadline:
+        pass  # Spin out the last fraction of a millisecond
+
+class TokenBucket:
+    """
+    Token bucket driven by the monotonic clock. Tokens accrue at `rate` per
+    second up to `burst`. Taking more tokens than are available puts the
+    bucket in debt and waits for the debt to be repaid, so a single request
+    larger than the burst size can never block forever.
+    """
+
+    def __init__(self, rate, burst=1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)  # Tokens added per second
+        self.burst = float(burst)  # Maximum number of tokens that can accumulate
+        self.tokens = self.burst  # Start full so the first burst goes out at once
+        self.last = time.monotonic()  # Time of the last refill
+
+    def refill(self):
+        # Add the tokens accrued since the last refill, capped at the burst size
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        return now
+
+    def consume(self, amount=1):
+        """Takes `amount` tokens, waiting until the bucket can cover them."""
+        sleep_until(time.monotonic() + self.reserve(amount))
+
+    def reserve(self, amount=1):
+        """
+        Takes `amount` tokens without waiting and returns the seconds until
+        the bucket covers them, for callers that schedule rather than sleep.
+        """
+        self.refill()
+        self.tokens -= amount
+        return max(0.0, -self.tokens / self.rate)
+
+    def backlog(self):
+        """Tokens owed by earlier reservations, e.g. bytes still queued on a link."""
+        self.refill()
+        return max(0.0, -self.tokens)
+
+class Pacer:
+    """
+    Paces datagrams at a fixed rate in either bytes or packets per second.
+    """
+
+    def __init__(self, rate, per_packet, burst=None, packet_size=1027):
+        if burst is None:
+            burst = 1 if per_packet else packet_size  # Default to no bursting at all
+        self.per_packet = per_packet  # Whether tokens are packets or bytes
+        self.bucket = TokenBucket(rate, burst)
+
+    def wait(self, size):
+        # Charge the bucket for one datagram of `size` bytes and block until it may be sent
+        self.bucket.consume(1 if self.per_packet else size)
+
+    @classmethod
+    def from_options(cls, options, default_rate=None, packet_size=1027):
+        """
+        Builds a Pacer from the --rate and --burst command-line options.
+        Returns None (no pacing) when the rate is 0 or there is no rate at all.
+        """
+        text = options.get('rate', default_rate)
+        if text is None:
+            return None
+        rate, per_packet = parse_rate(str(text))
+        if rate == 0:
+            return None
+        burst = options.get('burst')
+        if burst is not None:
+            burst = parse_quantity(burst) if not per_packet else int(burst)
+        return cls(rate, per_packet, burst, packet_size)
@@ -0,0 +1,242 @@
+# Emir Ersanli S2221285
+"""
+Per-packet event tracing for the Selective Repeat pair, cheap enough to
+leave on while chasing a stall.
+
+With --trace=<file>, Sender4 and Receiver4 record every send,
+retransmission, ACK, window advance and write as a fixed-size binary
+record (RECORD: monotonic time in ns, sequence number, a value, event
+code) in a preallocated ring buffer. A flusher thread copies the filled
+part of the ring to the file every FLUSH_INTERVAL, or as soon as half
+of it is full, so the hot path never formats text or touches the file.
+Sequence numbers are signed, since a stale datagram near the start of
+the window can unwrap to a negative one.
+If the flusher falls a whole ring behind, new records are dropped and
+counted rather than blocking the transfer; the count is the trace's last
+record. --trace-buffer=<records> sizes the ring (default 64K records).
+
+Run as a script, this module analyzes a trace: event counts, per-sequence
+latency (first send to acknowledgement on the sender, first arrival to
+window advance on the receiver), retransmission chains, and the longest
+silences. --csv=<prefix> also writes the data behind them:
+<prefix>.latency.csv, <prefix>.chains.csv and <prefix>.timeseq.csv (time,
+event, sequence number and value of every record, for a time-sequence
+plot).
+
+Usage:
+    python3 pkttrace.py <TraceFile> [--csv=<prefix>] [--top=<n>]
+"""
+import csv
+import heapq
+import struct
+import sys
+import threading
+import time
+
+from cliopts import split_options, parse_quantity
+
+MAGIC = b'RTRC'
+VERSION = 1
+TRACE_HEADER = struct.Struct('<4sHHQd')  # magic, version, record size, monotonic ns at start, wall clock at start
+RECORD = struct.Struct('<QqIB3x')  # monotonic ns, sequence number (signed), value, event code (24 bytes)
+DEFAULT_CAPACITY = 64 * 1024  # Records in the ring buffer
+FLUSH_INTERVAL = 0.25  # Seconds between flushes of a ring that is not half full
+VALUE_MASK = 0xFFFFFFFF
+
+# Event codes; the value each one carries is in the comment
+SEND = 1  # Payload bytes
+RETRANSMIT = 2  # Cause: CAUSE_TIMEOUT or CAUSE_DUP_ACK
+PARITY = 3  # Sender: parity packet sent for the class starting at seq; receiver: parity received
+ACK = 4  # Sender: SACK received, seq is its cumulative ACK, value the packets it newly acknowledged
+ACKED = 5  # Sender: packet seq acknowledged
+ADVANCE = 6  # Window base moved to seq; value is the window (cwnd on the sender)
+RECEIVE = 7  # Receiver: data packet arrived, value is its length on the wire
+RECOVER = 8  # Receiver: packet rebuilt from parity
+DISCARD = 9  # Receiver: duplicate or outside the window
+WRITE = 10  # Receiver: payload bytes written to the file
+ACK_SENT = 11  # Receiver: SACK sent, seq is its cumulative ACK
+DROPPED = 255  # Last record: records lost because the flusher fell behind
+
+CAUSE_TIMEOUT, CAUSE_DUP_ACK = 1, 2
+EVENT_NAMES = {SEND: 'send', RETRANSMIT: 'retransmit', PARITY: 'parity', ACK: 'ack', ACKED: 'acked',
+               ADVANCE: 'advance', RECEIVE: 'receive', RECOVER: 'recover', DISCARD: 'discard', WRITE: 'write',
+               ACK_SENT: 'ack_sent', DROPPED: 'dropped'}
+CAUSE_NAMES = {CAUSE_TIMEOUT: 'timeout', CAUSE_DUP_ACK: 'dup_ack'}
+
+class TraceRecorder:
+    """
+    Records events into the ring buffer and streams them to `path`.
+    record() may be called from several threads as long as they hold a
+    common lock, as the Sender4 threads do.
+    """
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.ring = bytearray(capacity * RECORD.size)  # Preallocated, never resized
+        self.head = 0  # Records written so far
+        self.flushed = 0  # Records copied to the file so far
+        self.dropped = 0  # Records lost to a full ring
+        self.file = open(path, 'wb')
+        self.file.write(TRACE_HEADER.pack(MAGIC, VERSION, RECORD.size, time.monotonic_ns(), time.time()))
+        self.ready = threading.Event()  # Set when half the ring waits to be flushed
+        self.closed = False
+        self.flusher = threading.Thread(target=self.flush_loop, daemon=True)
+        self.flusher.start()
+
+    def record(self, event, seq, value=0):
+        pending = self.head - self.flushed
+        if pending >= self.capacity:
+            self.dropped += 1  # Never wait for the flusher on the hot path
+            return
+        RECORD.pack_into(self.ring, (self.head % self.capacity) * RECORD.size, time.monotonic_ns(), seq,
+                         value & VALUE_MASK, event)
+        self.head += 1  # Published only once the record is complete
+        if pending + 1 == self.capacity // 2:
+            self.ready.set()
+
+    def flush(self):
+        # Only the flusher thread (or close(), once it has stopped) copies records out
+        end = self.head
+        start = self.flushed
+        ring = memoryview(self.ring)
+        while start < end:
+            index = start % self.capacity
+            stop = min(end - start, self.capacity - index) + index  # Up to the end of the ring at most
+            self.file.write(ring[index * RECORD.size:stop * RECORD.size])
+            start += stop - index
+        self.flushed = end  # The producer may reuse these slots now
+
+    def flush_loop(self):
+        while not self.closed:
+            self.ready.wait(FLUSH_INTERVAL)
+            self.ready.clear()
+            self.flush()
+
+    def close(self):
+        """Stops the flusher, writes what is left and the DROPPED record."""
+        if self.closed:
+            return
+        self.closed = True
+        self.ready.set()
+        self.flusher.join()
+        self.flush()
+        self.file.write(RECORD.pack(time.monotonic_ns(), 0, min(self.dropped, VALUE_MASK), DROPPED))
+        self.file.close()
+
+    @classmethod
+    def from_options(cls, options):
+        """Builds a recorder from --trace=<file> and --trace-buffer, or returns None without them."""
+        path = options.get('trace')
+        if not isinstance(path, str):
+            return None
+        return cls(path, parse_quantity(options.get('trace_buffer', DEFAULT_CAPACITY)))
+
+def read_trace(path):
+    """Returns (monotonic ns at start, wall clock at start, [(ns since start, event, seq, value)])."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, record_size, start_ns, wall = TRACE_HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise ValueError(f"{path} is not a version {VERSION} trace")
+    return start_ns, wall, [(ns - start_ns, event, seq, value)
+                            for ns, seq, value, event in RECORD.iter_unpack(memoryview(data)[TRACE_HEADER.size:])]
+
+def percentile(values, q):
+    """Nearest-rank percentile of sorted `values`."""
+    return values[min(len(values) - 1, max(0, int(q * len(values) + 0.5) - 1))] if values else None
+
+def analyze(records, top=10):
+    """
+    Reduces a trace to a dict of event counts, per-sequence latency in ns,
+    retransmission chains and the `top` longest gaps between records.
+    """
+    counts = {}
+    first_seen = {}  # Sequence number -> first send (sender) or first arrival (receiver)
+    done = {}  # Sequence number -> acknowledged (sender) or passed by the window (receiver)
+    waiting = []  # Heap of the sequence numbers seen but not yet passed by the window
+    chains = {}  # Sequence number -> [(ns, cause name)] of every transmission
+    gaps = []  # Min-heap of the `top` longest (silence in ns, ns at its end, event that ended it)
+    dropped = 0
+    previous = None
+    for ns, event, seq, value in records:
+        name = EVENT_NAMES.get(event, str(event))
+        counts[name] = counts.get(name, 0) + 1
+        if event == DROPPED:
+            dropped = value
+            continue
+        if previous is not None:
+            if len(gaps) < top:
+                heapq.heappush(gaps, (ns - previous, ns, name))
+            elif top and ns - previous > gaps[0][0]:
+                heapq.heapreplace(gaps, (ns - previous, ns, name))  # Drop the shortest of the longest so far
+        previous = ns
+        if (event == SEND or event == RECEIVE or event == RECOVER) and seq >= 0:
+            # A negative seq is a stale datagram from before the first packet: counted, never timed
+            if seq not in first_seen:
+                first_seen[seq] = ns
+                heapq.heappush(waiting, seq)
+            if event == SEND:
+                chains.setdefault(seq, []).append((ns, 'first'))
+        elif event == RETRANSMIT:
+            chains.setdefault(seq, []).append((ns, CAUSE_NAMES.get(value, str(value))))
+        elif event == ACKED:
+            done.setdefault(seq, ns)
+        elif event == ADVANCE:
+            # Every packet below the new window base is done; on the sender ACKED usually said so already
+            while waiting and waiting[0] < seq:
+                done.setdefault(heapq.heappop(waiting), ns)
+    latency = {seq: done[seq] - first_seen[seq] for seq in first_seen if seq in done}
+    chains = {seq: chain for seq, chain in chains.items() if len(chain) > 1}
+    gaps.sort(reverse=True)  # At most `top` of them
+    return {'counts': counts, 'latency': latency, 'chains': chains, 'gaps': gaps, 'dropped': dropped,
+            'unfinished': sorted(seq for seq in first_seen if seq not in done),
+            'duration': records[-1][0] if records else 0}
+
+def write_csv(prefix, records, result):
+    with open(prefix + '.latency.csv', 'w', newline='') as f:
+        out = csv.writer(f)
+        out.writerow(['seq', 'latency_ms', 'transmissions'])
+        for seq in sorted(result['latency']):
+            out.writerow([seq, result['latency'][seq] / 1e6, len(result['chains'].get(seq, [None]))])
+    with open(prefix + '.chains.csv', 'w', newline='') as f:
+        out = csv.writer(f)
+        out.writerow(['seq', 'attempt', 'time_s', 'cause'])
+        for seq in sorted(result['chains']):
+            for attempt, (ns, cause) in enumerate(result['chains'][seq]):
+                out.writerow([seq, attempt, ns / 1e9, cause])
+    with open(prefix + '.timeseq.csv', 'w', newline='') as f:
+        out = csv.writer(f)
+        out.writerow(['time_s', 'event', 'seq', 'value'])
+        for ns, event, seq, value in records:
+            out.writerow([ns / 1e9, EVENT_NAMES.get(event, str(event)), seq, value])
+
+def report(result, top=10):
+    """Prints the analysis in a few lines per section."""
+    print(f"duration {result['duration'] / 1e9:.3f} s, dropped records {result['dropped']}")
+    print('events: ' + ' '.join(f'{name}={count}' for name, count in sorted(result['counts'].items())))
+    latencies = sorted(result['latency'].values())
+    if latencies:
+        print('latency ms: ' + ' '.join(f'{name}={percentile(latencies, q) / 1e6:.3f}'
+                                        for name, q in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))))
+    if result['unfinished']:
+        print(f"never completed: {len(result['unfinished'])} packets, first {result['unfinished'][:top]}")
+    chains = sorted(result['chains'].items(), key=lambda item: (-len(item[1]), item[0]))
+    print(f"retransmitted packets: {len(chains)}")
+    for seq, chain in chains[:top]:
+        steps = ' -> '.join(f'{ns / 1e6:.1f}ms({cause})' for ns, cause in chain)
+        print(f'  seq {seq}: {steps}')
+    print('longest gaps:')
+    for silence, ns, name in result['gaps'][:top]:
+        print(f'  {silence / 1e6:.3f} ms before {name} at {ns / 1e9:.3f} s')
+
+if __name__ == '__main__':
+    args, options = split_options(sys.argv[1:])
+    if len(args) != 1:
+        print(__doc__.split('Usage:')[1])
+        sys.exit(1)
+    _, _, records = read_trace(args[0])
+    top = parse_quantity(options.get('top', 10))
+    result = analyze(records, top)
+    report(result, top)
+    if isinstance(options.get('csv'), str):
+        write_csv(options['csv'], records, result)
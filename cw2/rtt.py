@@ -0,0 +1,80 @@
+# Emir Ersanli S2221285
+"""
+Adaptive retransmission timeout in the style of Jacobson/Karels (RFC 6298).
+
+Callers feed RTT samples only for packets that were never retransmitted
+(Karn's rule) and report each timeout, which doubles the RTO. Any ACK for
+new data ends the backoff, as Linux TCP does; waiting for a Karn-clean
+sample alone would keep a lossy Go-Back-N link backed off indefinitely.
+"""
+
+ALPHA = 1 / 8  # Gain for the smoothed RTT
+BETA = 1 / 4  # Gain for the RTT variation
+K = 4  # Weight of the variation in the RTO
+CLOCK_GRANULARITY = 0.001  # Seconds; lower bound on the variation term
+MIN_RTO = 0.02  # Seconds; RFC 6298 says 1 s, far too long for a LAN or loopback
+MAX_RTO = 60.0  # Seconds; upper bound in RFC 6298
+MAX_BACKOFF = 64  # Largest multiplier exponential backoff may reach
+
+class RttEstimator:
+    """
+    Tracks SRTT and RTTVAR and derives the retransmission timeout from them.
+    With adaptive=False the timeout stays at its initial value, which is the
+    senders' original fixed-timeout behaviour.
+    """
+
+    def __init__(self, initial_rto, min_rto=MIN_RTO, max_rto=MAX_RTO, adaptive=True):
+        self.min_rto = min_rto
+        self.max_rto = max(max_rto, min_rto)
+        self.adaptive = adaptive
+        self.srtt = None  # Smoothed round-trip time, None until the first sample
+        self.rttvar = None  # Round-trip time variation
+        self.rto = min(max(initial_rto, min_rto), self.max_rto)  # Timeout before backoff
+        self.backoff = 1  # Multiplier doubled on every timeout
+        self.samples = 0  # Number of RTT samples taken
+
+    @property
+    def timeout(self):
+        """Current retransmission timeout in seconds, backoff included."""
+        return min(self.rto * self.backoff, self.max_rto)
+
+    def sample(self, rtt):
+        """Folds in one RTT measurement from a packet that was sent only once."""
+        self.samples += 1
+        self.backoff = 1  # A fresh measurement ends any backoff
+        if not self.adaptive:
+            return
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - ALPHA) * self.srtt + ALPHA * rtt
+        rto = self.srtt + max(CLOCK_GRANULARITY, K * self.rttvar)
+        self.rto = min(max(rto, self.min_rto), self.max_rto)
+
+    def on_ack(self):
+        """Clears the backoff once an ACK shows the receiver is making progress."""
+        self.backoff = 1
+
+    def on_timeout(self):
+        """Backs the timeout off exponentially after a retransmission timeout."""
+        if self.adaptive:
+            self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+
+    @classmethod
+    def from_options(cls, timeout_ms, options):
+        """
+        Builds an estimator for a sender's <Timeout(ms)> argument and its
+        --rto option: 'initial' (default) starts from the given timeout,
+        'ceiling' never lets the RTO exceed it, 'fixed' keeps it constant.
+        """
+        timeout = timeout_ms / 1000.0
+        mode = options.get('rto', 'initial')
+        if mode == 'fixed':
+            return cls(timeout, min_rto=timeout, max_rto=timeout, adaptive=False)
+        if mode == 'ceiling':
+            return cls(timeout, max_rto=timeout)
+        if mode == 'initial':
+            return cls(timeout)
+        raise ValueError(f"unknown --rto mode: {mode}")
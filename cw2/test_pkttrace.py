@@ -0,0 +1,29 @@
+# Emir Ersanli S2221285
+import os
+import tempfile
+import unittest
+
+import pkttrace
+
+class TraceRecorderTest(unittest.TestCase):
+
+    def test_negative_sequence_number(self):
+        # Receiver4 traces header.unwrap() results, which are -1 for a stale packet while the window starts at 1
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'receiver.trace')
+            trace = pkttrace.TraceRecorder(path, 16)
+            trace.record(pkttrace.RECEIVE, -1, 1029)
+            trace.record(pkttrace.DISCARD, -1)
+            trace.record(pkttrace.RECEIVE, 1, 1029)
+            trace.record(pkttrace.ADVANCE, 2, 64)
+            trace.close()
+            _, _, records = pkttrace.read_trace(path)
+        self.assertEqual([(event, seq) for _, event, seq, _ in records[:4]],
+                         [(pkttrace.RECEIVE, -1), (pkttrace.DISCARD, -1), (pkttrace.RECEIVE, 1), (pkttrace.ADVANCE, 2)])
+        result = pkttrace.analyze(records)
+        self.assertEqual(result['counts']['receive'], 2)
+        self.assertEqual(list(result['latency']), [1])  # The stale packet is counted, not timed
+        self.assertEqual(result['unfinished'], [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+# Emir Ersanli S2221285
+"""
+Retransmission scheduler for the windowed senders. Deadlines live in a
+min-heap; cancelling or rescheduling a packet only updates a dictionary and
+leaves the old heap entry to be discarded when it reaches the top, so every
+operation costs O(log n) and expiry handling only touches expired packets.
+"""
+import heapq
+
+class RetransmitTimer:
+    """
+    Min-heap of (deadline, sequence number) with lazy cancellation.
+    """
+
+    def __init__(self):
+        self.heap = []  # (deadline, seq) entries, some of them stale
+        self.deadlines = {}  # seq -> its current deadline; the only live entries
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, seq):
+        return seq in self.deadlines
+
+    def schedule(self, seq, deadline):
+        """Arms (or re-arms) the timer of `seq` to fire at `deadline`."""
+        self.deadlines[seq] = deadline
+        heapq.heappush(self.heap, (deadline, seq))
+        if len(self.heap) > 2 * len(self.deadlines) + 64:
+            self.compact()
+
+    def cancel(self, seq):
+        """Disarms the timer of `seq`; its heap entry is dropped lazily."""
+        self.deadlines.pop(seq, None)
+
+    def compact(self):
+        # Rebuild the heap from the live entries once stale ones dominate it
+        self.heap = [(deadline, seq) for seq, deadline in self.deadlines.items()]
+        heapq.heapify(self.heap)
+
+    def next_deadline(self):
+        """Returns the earliest live deadline, or None when no timer is armed."""
+        heap = self.heap
+        while heap and self.deadlines.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)  # Discard cancelled or superseded entries
+        return heap[0][0] if heap else None
+
+    def pop_expired(self, now):
+        """Disarms and returns the sequence numbers whose deadline is at or before `now`."""
+        expired = []
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            deadline, seq = heapq.heappop(heap)
+            if self.deadlines.get(seq) == deadline:
+                del self.deadlines[seq]
+                expired.append(seq)
+        return expired
@@ -0,0 +1,131 @@
+# Emir Ersanli S2221285
+"""
+Packet header layout shared by the senders and receivers.
+
+A data packet is a big-endian sequence number followed by a one-byte flags
+field (bit 0 is the EOF marker, bit 1 marks a compressed payload, bit 2 a
+parity packet of fec.py) and the payload. An ACK is a bare sequence number of the same width. Sequence
+numbers travel modulo 2**(8 * width) and are compared with serial-number
+arithmetic (RFC 1982), so each end keeps an unbounded absolute counter and
+the wire value is allowed to wrap around.
+
+The Selective Repeat pair acknowledges with a SACK instead: the cumulative
+ACK (the last sequence number received in order) followed by a 64-bit map
+of the packets received beyond the first gap. Bit i reports packet
+cumulative + 2 + i, since cumulative + 1 is missing by definition.
+
+Packets are never assembled in memory: send_data() packs the header into
+a reused buffer and hands it to the kernel together with the payload
+(sendmsg gather), and ReceiveBuffers lets recvfrom_into fill a fixed
+pool of buffers, so neither side allocates a packet-sized object per
+datagram.
+"""
+import socket
+import struct
+
+FLAG_EOF = 0x01  # Set on the final packet of a file
+FLAG_COMPRESSED = 0x02  # The payload is zlib-compressed
+FLAG_PARITY = 0x04  # Not data: the XOR parity of a group of packets (fec.py)
+
+SHORT_SEQ_WIDTH = 2  # Original 2-byte sequence numbers, used by the Stop-and-Wait pairs
+LONG_SEQ_WIDTH = 4  # Extended sequence numbers, used by the Go-Back-N and Selective Repeat pairs
+
+SACK_BITS = 64  # Packets beyond the cumulative ACK reported in each SACK
+
+# struct codes for the supported sequence number widths
+SEQ_CODES = {2: 'H', 4: 'I', 8: 'Q'}
+
+HAVE_SENDMSG = hasattr(socket.socket, 'sendmsg')  # Missing on Windows, where packets are joined instead
+DEFAULT_RECEIVE_BUFFERS = 4  # Datagrams a receiver can hold on to before their buffer is reused
+
+class HeaderFormat:
+    """
+    Packs and unpacks headers for one sequence number width.
+    """
+
+    def __init__(self, seq_width=LONG_SEQ_WIDTH):
+        if seq_width not in SEQ_CODES:
+            raise ValueError(f"unsupported sequence number width: {seq_width}")
+        self.seq_width = seq_width  # Bytes of sequence number on the wire
+        self.modulus = 1 << (8 * seq_width)  # Sequence numbers wrap around at this value
+        self.mask = self.modulus - 1
+        self.data_header = struct.Struct('!' + SEQ_CODES[seq_width] + 'B')  # Sequence number + flags
+        self.ack_header = struct.Struct('!' + SEQ_CODES[seq_width])  # Sequence number only
+        self.sack_header = struct.Struct('!' + SEQ_CODES[seq_width] + 'Q')  # Cumulative ACK + bitmap
+        self.header_length = self.data_header.size  # Bytes before the payload of a data packet
+        self.ack_length = self.ack_header.size  # Bytes in an ACK
+        self.sack_length = self.sack_header.size  # Bytes in a SACK
+        self.scratch = bytearray(self.header_length)  # Header of the packet send_data() is sending
+
+    def pack_header(self, seq, flags=0):
+        """Returns the header for absolute sequence number `seq`."""
+        return self.data_header.pack(seq & self.mask, flags)
+
+    def send_data(self, sock, address, seq, flags, payload):
+        """
+        Sends a data packet with header and payload gathered by the kernel,
+        without joining them. The header buffer is shared, so sends through
+        one HeaderFormat must not run concurrently; every sender sends from
+        one thread or under its lock.
+        """
+        self.data_header.pack_into(self.scratch, 0, seq & self.mask, flags)
+        if HAVE_SENDMSG:
+            return sock.sendmsg((self.scratch, payload), (), 0, address)
+        return sock.sendto(self.scratch + payload, address)
+
+    def unpack_header(self, packet):
+        """Returns (wire sequence number, flags) from the start of a data packet."""
+        return self.data_header.unpack_from(packet)
+
+    def pack_ack(self, seq):
+        return self.ack_header.pack(seq & self.mask)
+
+    def unpack_ack(self, packet):
+        return self.ack_header.unpack_from(packet)[0]
+
+    def pack_sack(self, cumulative, bitmap):
+        """Builds a SACK from the cumulative ACK and the bitmap of later packets."""
+        return self.sack_header.pack(cumulative & self.mask, bitmap)
+
+    def unpack_sack(self, packet, reference):
+        """Returns (absolute cumulative ACK, bitmap), unwrapping next to `reference`."""
+        cumulative, bitmap = self.sack_header.unpack_from(packet)
+        return self.unwrap(cumulative, reference), bitmap
+
+    def serial_diff(self, a, b):
+        """Signed distance from wire number b to wire number a, taking wraparound into account."""
+        diff = (a - b) & self.mask
+        return diff - self.modulus if diff >= self.modulus // 2 else diff
+
+    def unwrap(self, wire_seq, reference):
+        """
+        Maps a wire sequence number back to the absolute sequence number
+        closest to `reference`, e.g. the receiver's next expected packet.
+        """
+        return reference + self.serial_diff(wire_seq, reference & self.mask)
+
+class ReceiveBuffers:
+    """
+    Fixed pool of datagram buffers that recvfrom_into fills in turn. A view
+    returned by receive() stays valid until `count` more datagrams have
+    been received; anything kept longer must be copied.
+    """
+
+    def __init__(self, size, count=DEFAULT_RECEIVE_BUFFERS):
+        self.size = size  # Largest datagram expected
+        self.views = [memoryview(bytearray(size)) for _ in range(count)]
+        self.next = 0  # Buffer the next datagram goes into
+
+    def receive(self, sock):
+        """Like sock.recvfrom(size), but returns a memoryview into the pool."""
+        view = self.views[self.next]
+        self.next = (self.next + 1) % len(self.views)
+        nbytes, address = sock.recvfrom_into(view)
+        return view[:nbytes], address
+
+def sacked(cumulative, bitmap):
+    """Yields the absolute sequence numbers reported by the bitmap of a SACK."""
+    while bitmap:
+        low = bitmap & -bitmap  # Lowest set bit
+        yield cumulative + 1 + low.bit_length()
+        bitmap ^= low